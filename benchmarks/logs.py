@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the logging pipeline: event loop latency under heavy logging
+
+A number of tasks log as fast as they can on the event loop, like
+the display does on every percent, while another task measures the
+loop lag, i.e. how late a short sleep() wakes up. This is done with
+the handlers attached to the logger - synchronous - or behind a queue
+and a writer thread like in rhubarbe.logger - asynchronous - and for
+the text and JSON formats. The handlers can be slowed down to emulate
+a slow storage, like a home directory over NFS.
+
+For each setup we report the time spent in the loop, the time to
+flush the pending records, and the loop lag (mean, p99 and max).
+Everything is written as a single JSON document.
+
+Example:
+
+    python3 benchmarks/logs.py --records 100000 --latency 0.0001
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import logging.handlers
+import platform
+import tempfile
+from pathlib import Path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from rhubarbe.version import __version__
+from rhubarbe.logger import (AsynchronousLogging, JsonFormatter,
+                             rhubarbe_logging_config)
+
+MODES = ('synchronous', 'asynchronous')
+
+
+class SlowHandler(logging.handlers.RotatingFileHandler):
+    """
+    a file handler that takes latency seconds more for each record
+    """
+
+    latency = 0.
+
+    def emit(self, record):
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+
+def make_logger(name, path, text_format, latency):
+    the_logger = logging.getLogger(name)
+    the_logger.propagate = False
+    the_logger.setLevel(logging.INFO)
+    handler = SlowHandler(path, maxBytes=10 * 2**20, backupCount=2)
+    handler.latency = latency
+    if text_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        standard = rhubarbe_logging_config['formatters']['standard']
+        handler.setFormatter(logging.Formatter(standard['format'],
+                                               standard['datefmt']))
+    the_logger.addHandler(handler)
+    return the_logger
+
+
+async def sample_lag(lags, period):
+    while True:
+        before = time.monotonic()
+        await asyncio.sleep(period)
+        lags.append(max(0., time.monotonic() - before - period))
+
+
+async def log_records(the_logger, rank, nb_records):
+    for counter in range(nb_records):
+        the_logger.info(f"fit{rank:02} percent: {counter % 100}/100")
+        # like a display that gets a message every now and then
+        if counter % 10 == 0:
+            await asyncio.sleep(0)
+
+
+def run_setup(mode, text_format, workdir, args):
+    name = f"bench-{mode}-{text_format}"
+    the_logger = make_logger(name, Path(workdir) / f"{name}.log",
+                             text_format, args.latency)
+    pipeline = None
+    if mode == 'asynchronous':
+        pipeline = AsynchronousLogging(the_logger)
+        pipeline.start()
+    loop = asyncio.new_event_loop()
+    lags = []
+    per_task = args.records // args.tasks
+
+    async def main():
+        sampler = asyncio.ensure_future(sample_lag(lags, args.period))
+        await asyncio.gather(*[log_records(the_logger, rank, per_task)
+                               for rank in range(args.tasks)])
+        sampler.cancel()
+
+    beg = time.monotonic()
+    loop.run_until_complete(main())
+    in_loop = time.monotonic() - beg
+    if pipeline:
+        pipeline.stop()
+    flushed = time.monotonic() - beg
+    loop.close()
+    lags.sort()
+    result = {
+        'records': per_task * args.tasks,
+        'in_loop': round(in_loop, 4),
+        'flushed': round(flushed, 4),
+        'lag_mean': round(sum(lags) / len(lags), 6) if lags else None,
+        'lag_p99': round(lags[int(len(lags) * .99)], 6) if lags else None,
+        'lag_max': round(lags[-1], 6) if lags else None,
+        'lag_samples': len(lags),
+    }
+    print(f"{mode:>12} {text_format:>4}: in loop {in_loop:.3f}s, "
+          f"flushed {flushed:.3f}s, lag max {result['lag_max']}s",
+          file=sys.stderr)
+    return result
+
+
+def main():
+    parser = ArgumentParser(usage=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-n", "--records", default=100000, type=int,
+        help="how many records are logged in each setup")
+    parser.add_argument(
+        "-t", "--tasks", default=10, type=int,
+        help="how many tasks share the logging")
+    parser.add_argument(
+        "-l", "--latency", default=0., type=float,
+        help="extra delay for writing each record, in seconds")
+    parser.add_argument(
+        "-p", "--period", default=0.001, type=float,
+        help="how often the loop lag is sampled, in seconds")
+    parser.add_argument(
+        "-f", "--formats", default="text,json",
+        help="comma-separated list of formats, among text and json")
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="where to write the JSON results; default is stdout")
+    args = parser.parse_args()
+
+    report = {
+        'rhubarbe': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': vars(args),
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="rhubarbe-bench-") as workdir:
+        for text_format in args.formats.split(","):
+            for mode in MODES:
+                report['results'][f"{mode}-{text_format}"] = \
+                    run_setup(mode, text_format, workdir, args)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"results written in {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
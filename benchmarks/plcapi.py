@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the PLCAPI-dependent code: leases and accounts
+
+For each dataset size, a stand-in PLCAPI server (see
+rhubarbe/simulator/plcapi.py) is loaded with that many slices,
+persons and leases, and we time
+
+* booked_now_by, that fetches the leases of the day and checks them
+* the accounts manager: fetching the PLCAPI specification alone,
+  then a full cycle (a full audit, that writes all accounts),
+  and an incremental cycle (where nothing has changed)
+
+The accounts manager runs in a sandbox: accounts are plain
+directories in a temporary location, and no actual user gets created.
+Everything is written as a single JSON document.
+
+Example:
+
+    python3 benchmarks/plcapi.py --sizes 1000,5000 -o results.json
+"""
+
+# c0111 no docstrings yet
+# c0415 imports must happen once the config overlay is in place
+# pylint: disable=c0111, c0415
+
+import os
+import sys
+import json
+import time
+import asyncio
+import platform
+import tempfile
+from pathlib import Path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from rhubarbe.version import __version__
+
+DEFAULT_SIZES = "100,1000,5000"
+
+CONFIG_OVERLAY = """# generated by benchmarks/plcapi.py
+[plcapi]
+url = http://127.0.0.1:{port}/PLCAPI/
+admin_email = admin@example.org
+admin_password = benchmark
+
+[accounts]
+audit_period = 1000000
+"""
+
+
+def sandboxed_accounts_manager(homedir):
+    """
+    an AccountsManager that deals with plain directories under homedir
+    """
+    from rhubarbe.monitor.accountsmanager import (
+        AccountsManager, replace_file_with_string, SSH_CONFIG)
+
+    class SandboxedAccountsManager(AccountsManager):
+
+        @staticmethod
+        def slices_from_passwd():
+            return [path.name for path in homedir.iterdir()
+                    if '_' in path.name]
+
+        @staticmethod
+        def create_account(slicename):
+            (homedir / slicename / ".ssh").mkdir(parents=True, exist_ok=True)
+            return True
+
+        @staticmethod
+        def create_ssh_config(slicename):
+            return replace_file_with_string(
+                homedir / slicename / ".ssh/config", SSH_CONFIG, chmod=0o600)
+
+        @staticmethod
+        def apply_keys(slicename, keys_string):
+            return replace_file_with_string(
+                homedir / slicename / ".ssh/authorized_keys", keys_string,
+                chmod=0o600, remove_if_empty=True)
+
+    return SandboxedAccountsManager()
+
+
+def timed(loop, coroutine):
+    beg = time.monotonic()
+    result = loop.run_until_complete(coroutine)
+    return round(time.monotonic() - beg, 4), result
+
+
+def run_size(size, server, workdir, args):
+    from rhubarbe.simulator.plcapi import PlcDataset
+    from rhubarbe.leases import Leases
+
+    server.dataset = PlcDataset(size, size, size)
+    server.counter = 0
+    loop = asyncio.get_event_loop()
+    results = {}
+
+    def report(name, duration):
+        print(f"{size:>6} {name:>22}: {duration:.3f}s", file=sys.stderr)
+        results[name] = duration
+
+    # leases
+    leases = Leases(asyncio.Queue())
+    durations = []
+    for _ in range(args.repeat):
+        leases.leases = None
+        duration, _ = timed(loop, leases.booked_now_by(
+            login="inria_slice1", root_allowed=False))
+        durations.append(duration)
+    report('booked_now_by', sum(durations) / len(durations))
+
+    # accounts
+    homedir = Path(workdir) / f"home-{size}"
+    homedir.mkdir()
+    accounts_manager = sandboxed_accounts_manager(homedir)
+    duration, _ = timed(loop, accounts_manager.fetch_specification('open'))
+    report('accounts_fetch', duration)
+    duration, _ = timed(loop, accounts_manager.manage_accounts('open'))
+    report('accounts_full', duration)
+    duration, _ = timed(loop, accounts_manager.manage_accounts('open'))
+    report('accounts_incremental', duration)
+    results['plcapi_requests'] = server.counter
+    return results
+
+
+def main():
+    parser = ArgumentParser(usage=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-s", "--sizes", default=DEFAULT_SIZES,
+        help="comma-separated list of dataset sizes, i.e. number of "
+        "slices, persons and leases")
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="where to write the JSON results; default is stdout")
+    parser.add_argument(
+        "-l", "--latency", default=0., type=float,
+        help="average delay for the PLCAPI server to answer, in seconds")
+    parser.add_argument(
+        "-r", "--repeat", default=5, type=int,
+        help="how many times booked_now_by is timed")
+    parser.add_argument(
+        "-p", "--port", default=10080, type=int,
+        help="port for the stand-in PLCAPI server")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    # we are going to chdir
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    report = {
+        'rhubarbe': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': vars(args),
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="rhubarbe-bench-") as workdir:
+        # the config overlay is read from the current directory
+        with open(Path(workdir) / "rhubarbe.conf", 'w') as overlay:
+            overlay.write(CONFIG_OVERLAY.format(port=args.port))
+        os.chdir(workdir)
+        from rhubarbe.simulator.plcapi import PlcDataset, SimulatedPlcApi
+        server = SimulatedPlcApi(PlcDataset(0, 0, 0), args.port, args.latency)
+        server.start_in_thread()
+        for size in sizes:
+            report['results'][size] = run_size(size, server, workdir, args)
+        os.chdir("/")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"results written in {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for rhubarbe push: direct upload vs relay tree
+
+For each testbed size, a simulated testbed is started with its nodes
+on (see rhubarbe simulator), where the gateway and each node have an
+uplink of --link-bandwidth MiB/s; a file of --file-size MiB is then
+pushed to all nodes, with each strategy. We report the summary of
+each push, i.e. the elapsed time and the overall throughput - how
+much data got written on the nodes per second - and everything is
+written as a single JSON document.
+
+With the direct strategy the gateway uplink is the bottleneck, so the
+elapsed time grows linearly with the number of nodes; with the tree
+strategy it is expected to grow like the log of the number of nodes.
+
+Example:
+
+    python3 benchmarks/push.py --sizes 8,32 --link-bandwidth 50
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from rhubarbe.version import __version__
+
+from run import (rhubarbe_command, raise_file_limit, SimulatorProcess,
+                 add_port_arguments, port_options)
+
+STRATEGIES = ('direct', 'tree')
+
+
+def push(workdir, path, strategy, args):
+    completed = subprocess.run(
+        rhubarbe_command("push", "-a", "-j", "-s", strategy,
+                         "-f", str(args.fanout), "-t", str(args.timeout),
+                         str(path), "/tmp/"),
+        cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        universal_newlines=True)
+    records = [json.loads(line) for line in completed.stdout.splitlines()
+               if line.startswith('{')]
+    summary = next((record for record in records
+                    if record.get('type') == 'summary'), {})
+    summary['returncode'] = completed.returncode
+    summary['relayed'] = sum(1 for record in records
+                             if record.get('type') != 'summary'
+                             and record['source'] != 'gateway')
+    return summary
+
+
+def run_size(nb_nodes, args):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="rhubarbe-bench-") as workdir:
+        path = Path(workdir) / "bundle.bin"
+        with path.open('wb') as output:
+            output.truncate(int(args.file_size * 2**20))
+        options = ["--ssh", "--on", "--boot-delay", "0",
+                   "--link-bandwidth", str(args.link_bandwidth)]
+        with SimulatorProcess(nb_nodes, workdir,
+                              options + port_options(args), args.cmc_port):
+            # make sure all ssh servers are up
+            subprocess.run(rhubarbe_command("wait", "-a",
+                                            "-t", str(args.timeout)),
+                           cwd=workdir, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            for strategy in STRATEGIES:
+                result = push(workdir, path, strategy, args)
+                print(f"{nb_nodes:>5} nodes {strategy:>6}: "
+                      f"duration={result.get('duration')}s "
+                      f"throughput={result.get('throughput')}MiB/s "
+                      f"ok={result.get('ok')} relayed={result['relayed']} "
+                      f"rc={result['returncode']}", file=sys.stderr)
+                results[strategy] = result
+    return results
+
+
+def main():
+    parser = ArgumentParser(usage=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-s", "--sizes", default="8,32",
+        help="comma-separated list of testbed sizes")
+    parser.add_argument(
+        "-m", "--file-size", dest="file_size", default=10., type=float,
+        help="size of the pushed file, in MiB")
+    parser.add_argument(
+        "-b", "--link-bandwidth", dest="link_bandwidth",
+        default=50., type=float,
+        help="simulated uplink of the gateway and of each node, in MiB/s")
+    parser.add_argument(
+        "-f", "--fanout", default=4, type=int,
+        help="how many uploads the gateway does at the same time")
+    parser.add_argument(
+        "-t", "--timeout", default=300, type=int,
+        help="timeout passed to wait and push")
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="where to write the JSON results; default is stdout")
+    add_port_arguments(parser)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    report = {
+        'rhubarbe': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': vars(args),
+        'results': {},
+    }
+    for nb_nodes in sizes:
+        report['results'][nb_nodes] = run_size(nb_nodes, args)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"results written in {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
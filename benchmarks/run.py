@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+Scale benchmarks for the main rhubarbe subcommands
+
+For each testbed size, a simulated testbed is started (see
+rhubarbe simulator), and the regular subcommands are run against it
+as separate processes; for each of them we measure wall-clock time,
+CPU time (user + system) and peak RSS, and everything is written
+as a single JSON document, so that results can be compared
+between releases.
+
+Example:
+
+    python3 benchmarks/run.py --sizes 10,100 -o results.json
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import platform
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from rhubarbe.version import __version__
+
+DEFAULT_SIZES = "10,100,500,2000"
+DEFAULT_COMMANDS = "status,on,off,wait,load,monitornodes"
+
+# the simulator gets started on these ports, and not on its defaults,
+# so as to not collide with a simulator that would be running already
+DEFAULT_PORTS = {
+    'cmc': 18080,
+    'telnet': 12323,
+    'ssh': 12222,
+    'sidecar': 20999,
+    'plcapi': 20080,
+}
+
+
+def rhubarbe_command(*args):
+    return [sys.executable, "-m", "rhubarbe"] + list(args)
+
+
+def add_port_arguments(parser):
+    for name, port in DEFAULT_PORTS.items():
+        parser.add_argument(
+            f"--{name}-port", dest=f"{name}_port", default=port, type=int,
+            help=f"{name} port for the simulated testbed")
+
+
+def port_options(args):
+    """
+    the simulator options for the ports in args
+    """
+    return [option for name in DEFAULT_PORTS
+            for option in (f"--{name}-port",
+                           str(getattr(args, f"{name}_port")))]
+
+
+def raise_file_limit():
+    # inherited by all the processes we spawn
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def measure(command, workdir, duration=None):
+    """
+    run command in workdir; if duration is set, the command gets
+    interrupted after that many seconds, which is how we deal
+    with monitornodes
+
+    returns a dict with wall-clock, cpu and peak RSS
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(
+        command, cwd=workdir,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 gives us the resources used by that very process
+    interrupted = False
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if (duration is not None and not interrupted
+                and time.monotonic() - start >= duration):
+            process.send_signal(signal.SIGTERM)
+            interrupted = True
+        time.sleep(0.02)
+    process.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                          else -os.WTERMSIG(status))
+    wall = time.monotonic() - start
+    return {
+        'command': " ".join(command[2:]),
+        'returncode': process.returncode,
+        'wall': round(wall, 3),
+        'user': round(usage.ru_utime, 3),
+        'system': round(usage.ru_stime, 3),
+        'cpu': round(usage.ru_utime + usage.ru_stime, 3),
+        # in KiB on linux
+        'maxrss': usage.ru_maxrss,
+    }
+
+
+class SimulatorProcess:
+
+    def __init__(self, nb_nodes, workdir, options, cmc_port):
+        self.nb_nodes = nb_nodes
+        self.workdir = workdir
+        self.options = options
+        self.cmc_port = cmc_port
+        self.process = None
+
+    def last_cmc(self):
+        """
+        the CMC of the last node is the last thing to come up
+        """
+        rank = self.nb_nodes
+        return (f"127.20.{rank >> 8}.{rank & 255}", self.cmc_port)
+
+    def __enter__(self):
+        # make sure we are not going to talk to another testbed
+        try:
+            socket.create_connection(self.last_cmc(), timeout=1).close()
+            raise RuntimeError(f"port {self.cmc_port} already in use - "
+                               f"see the --*-port options")
+        except OSError:
+            pass
+        self.process = subprocess.Popen(
+            rhubarbe_command("simulator", "-n", str(self.nb_nodes),
+                             "-d", self.workdir, *self.options),
+            cwd=self.workdir,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.wait_ready()
+        return self
+
+    def __exit__(self, *_):
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait()
+
+    def wait_ready(self, timeout=120):
+        last_cmc = self.last_cmc()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("simulator exited prematurely")
+            try:
+                socket.create_connection(last_cmc, timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"simulator not ready after {timeout}s")
+
+
+def run_size(nb_nodes, commands, args):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="rhubarbe-bench-") as workdir:
+        options = ["--ssh", "--boot-delay", str(args.boot_delay),
+                   "--frisbee-duration", str(args.frisbee_duration)]
+        with SimulatorProcess(nb_nodes, workdir,
+                              options + port_options(args), args.cmc_port):
+            def bench(name, *rhubarbe_args, duration=None):
+                if name not in commands:
+                    return
+                result = measure(rhubarbe_command(*rhubarbe_args),
+                                 workdir, duration=duration)
+                print(f"{nb_nodes:>5} nodes {name:>12}: "
+                      f"wall={result['wall']:.2f}s cpu={result['cpu']:.2f}s "
+                      f"maxrss={result['maxrss']//1024}MiB "
+                      f"rc={result['returncode']}", file=sys.stderr)
+                results[name] = result
+
+            timeout = str(args.timeout)
+            bench('status', "status", "-a")
+            bench('on', "on", "-a")
+            bench('off', "off", "-a")
+            # wait needs the nodes to be on, and is expected
+            # to last about the simulated boot delay
+            measure(rhubarbe_command("on", "-a"), workdir)
+            bench('wait', "wait", "-a", "-t", timeout)
+            bench('load', "load", "-a", "-t", timeout)
+            # monitornodes runs forever, so we let it do a fixed number
+            # of cycles; what matters is the cpu it takes meanwhile
+            bench('monitornodes',
+                  "monitornodes", "-a", "-c", str(args.cycle),
+                  duration=args.cycles * args.cycle)
+    return results
+
+
+def main():
+    parser = ArgumentParser(usage=__doc__,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-s", "--sizes", default=DEFAULT_SIZES,
+        help="comma-separated list of testbed sizes")
+    parser.add_argument(
+        "-c", "--commands", default=DEFAULT_COMMANDS,
+        help="comma-separated list of commands to run")
+    parser.add_argument(
+        "-o", "--output", default=None,
+        help="where to write the JSON results; default is stdout")
+    parser.add_argument(
+        "-t", "--timeout", default=120, type=int,
+        help="timeout passed to wait and load")
+    parser.add_argument(
+        "--boot-delay", dest="boot_delay", default=2., type=float,
+        help="average time for a simulated node to boot")
+    parser.add_argument(
+        "--frisbee-duration", dest="frisbee_duration", default=5., type=float,
+        help="average time for a simulated frisbee to complete")
+    parser.add_argument(
+        "--cycle", default=1., type=float,
+        help="monitornodes cycle")
+    parser.add_argument(
+        "--cycles", default=10, type=int,
+        help="how many monitornodes cycles to run")
+    add_port_arguments(parser)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    commands = args.commands.split(",")
+
+    report = {
+        'rhubarbe': __version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'date': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': vars(args),
+        'results': {},
+    }
+    for nb_nodes in sizes:
+        report['results'][nb_nodes] = run_size(nb_nodes, commands, args)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"results written in {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
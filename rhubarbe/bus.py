@@ -0,0 +1,188 @@
+"""
+The message bus, that conveys events - see rhubarbe.events - from
+nodes and servers to one or several sinks, like the display
+
+The bus fans out each event to all sinks; each sink reads the
+events through its own cursor, so sinks consume at their own pace.
+The main cursor is created with the bus, and the bus itself can be
+used like an asyncio.Queue to read from it; other sinks, e.g. to
+record events or count them, get their cursor with subscribe().
+
+Each cursor
+
+* coalesces progress events - frisbee percents and imagezip ticks -
+  i.e. a progress event replaces the one from the same node and kind
+  that is still pending in that cursor, if any; so a sink only sees
+  the latest percent for a node, however late it is, and the amount
+  of pending progress events is bounded by the number of nodes
+* has a bounded capacity; when it is full, progress events get
+  dropped, but the other ones, like return codes or errors, never are
+
+put() waits for room in the main cursor only, so a slow extra sink
+can't stall producers; put_nowait(), that can't wait, never does.
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import asyncio
+from collections import deque
+
+from rhubarbe.events import Progress, Tick
+
+DEFAULT_CAPACITY = 1000
+
+
+def progress_key(event):
+    """
+    the key used to coalesce event, or None if
+    event must be delivered as-is
+
+    the final progress events - 100% or end of ticks - are
+    always delivered
+    """
+    if isinstance(event, Progress) and event.percent != 100:
+        return (event.ip, 'percent')
+    if isinstance(event, Tick) and not event.end:
+        return (event.ip, 'tick')
+    return None
+
+
+class Cursor:
+
+    def __init__(self, name, maxsize=DEFAULT_CAPACITY):
+        self.name = name
+        self.maxsize = maxsize
+        # pending entries, as lists [key, event]
+        self._entries = deque()
+        # key -> entry, for the pending progress events
+        self._pending = {}
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        # stats
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return (f"<Cursor {self.name} {self.qsize()}/{self.maxsize}"
+                f" coalesced={self.coalesced} dropped={self.dropped}>")
+
+    def qsize(self):
+        return len(self._entries)
+
+    def empty(self):
+        return not self._entries
+
+    def full(self):
+        return self.maxsize > 0 and len(self._entries) >= self.maxsize
+
+    def _update_events(self):
+        if self._entries:
+            self._readable.set()
+        else:
+            self._readable.clear()
+        if self.full():
+            self._writable.clear()
+        else:
+            self._writable.set()
+
+    def _coalesce(self, key, event):
+        """
+        returns True if event could replace a pending one
+        """
+        if key is None or key not in self._pending:
+            return False
+        self._pending[key][1] = event
+        self.coalesced += 1
+        return True
+
+    def _append(self, key, event):
+        entry = [key, event]
+        self._entries.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._update_events()
+
+    def put_nowait(self, event):
+        key = progress_key(event)
+        if self._coalesce(key, event):
+            return
+        if key is not None and self.full():
+            self.dropped += 1
+            return
+        self._append(key, event)
+
+    async def put(self, event):
+        key = progress_key(event)
+        while not self._coalesce(key, event):
+            if not self.full():
+                self._append(key, event)
+                return
+            await self._writable.wait()
+
+    def get_nowait(self):
+        if not self._entries:
+            raise asyncio.QueueEmpty
+        key, event = self._entries.popleft()
+        if key is not None:
+            del self._pending[key]
+        self._update_events()
+        return event
+
+    async def get(self):
+        while not self._entries:
+            await self._readable.wait()
+        return self.get_nowait()
+
+    def task_done(self):
+        # for compatibility with asyncio.Queue
+        pass
+
+
+class MessageBus:
+
+    def __init__(self, maxsize=DEFAULT_CAPACITY):
+        self.maxsize = maxsize
+        self.main = Cursor('main', maxsize)
+        self.cursors = [self.main]
+
+    def __repr__(self):
+        return f"<MessageBus {' '.join(repr(c) for c in self.cursors)}>"
+
+    def subscribe(self, name):
+        """
+        returns a new cursor, that receives all events from now on
+        """
+        cursor = Cursor(name, self.maxsize)
+        self.cursors.append(cursor)
+        return cursor
+
+    def unsubscribe(self, cursor):
+        self.cursors.remove(cursor)
+
+    def put_nowait(self, event):
+        for cursor in self.cursors:
+            cursor.put_nowait(event)
+
+    async def put(self, event):
+        for cursor in self.cursors:
+            if cursor is not self.main:
+                cursor.put_nowait(event)
+        await self.main.put(event)
+
+    # reading from the bus means reading from the main cursor
+    def qsize(self):
+        return self.main.qsize()
+
+    def empty(self):
+        return self.main.empty()
+
+    def get_nowait(self):
+        return self.main.get_nowait()
+
+    async def get(self):
+        return await self.main.get()
+
+    def task_done(self):
+        self.main.task_done()
@@ -8,6 +8,8 @@ import asyncio
 
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.tracer import Tracer, SERVER_TRACK
+from rhubarbe.events import make_event
 
 # c0111 no docstrings yet
 # w1202 logger & format
@@ -25,15 +27,19 @@ class Collector:
         self.port = None
 
     async def feedback(self, field, msg):
-        await self.message_bus.put({field: msg})
+        await self.message_bus.put(make_event(field, msg))
 
     def feedback_nowait(self, field, msg):
-        self.message_bus.put_nowait({field: msg})
+        self.message_bus.put_nowait(make_event(field, msg))
 
-    async def start(self):                              # pylint: disable=r0914
+    async def start(self):
         """
         Start a collector instance; returns a port_number
         """
+        with Tracer().span(SERVER_TRACK, 'collector start'):
+            return await self._start()
+
+    async def _start(self):                             # pylint: disable=r0914
         the_config = Config()
         netcat = the_config.value('frisbee', 'netcat')
         local_ip = the_config.local_control_ip()
@@ -68,8 +74,10 @@ class Collector:
             port = str(eval(                            # pylint: disable=w0123
                 pat_port.replace('*', pat)))
             command = command_format.format(port=port)
-            self.subprocess = await asyncio.create_subprocess_shell(command)
-            await asyncio.sleep(1)
+            with Tracer().span(SERVER_TRACK, 'port allocation'):
+                self.subprocess = await asyncio.create_subprocess_shell(
+                    command)
+                await asyncio.sleep(1)
             # after such a short time, frisbeed should not have returned yet
             # if is has, we try our luck on another couple (ip, port)
             command_line = command
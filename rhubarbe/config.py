@@ -11,7 +11,7 @@ from pathlib import Path
 from pkg_resources import resource_exists, resource_filename
 
 from rhubarbe.singleton import Singleton
-from rhubarbe.logger import logger
+from rhubarbe.logger import logger, configure_logging
 
 # c0111 no docstrings yet
 # w1202 logger & format
@@ -57,6 +57,7 @@ class Config(metaclass=Singleton):
             elif mandatory:
                 raise ConfigException(
                     f"Missing mandatory config file {location}")
+        configure_logging(self.parser)
         #
         self._hostname = None
 
@@ -83,6 +84,21 @@ class Config(metaclass=Singleton):
         return config_section.get(key, None) \
             or self.get_or_raise(config_section, section, flag)
 
+    def section_values(self, section):
+        """
+        all the flags defined in a section, as a dict flag -> value
+        with the hostname-specific values applied like in value()
+        """
+        if section not in self.parser:
+            return {}
+        hostname = self.local_hostname()
+        flags = set()
+        for key in self.parser[section]:
+            flag, _, flag_hostname = key.partition('.')
+            if not flag_hostname or flag_hostname == hostname:
+                flags.add(flag)
+        return {flag: self.value(section, flag) for flag in sorted(flags)}
+
     # for now
     # the foreseeable tricky part is, this should be a coroutine..
     def available_frisbee_port(self):
@@ -9,6 +9,7 @@ import time
 import progressbar
 
 from rhubarbe.logger import logger
+from rhubarbe.events import Event, Progress, Tick, Status, Retcod, Info
 
 # c0111 no docstrings yet
 # w0201 attributes defined outside of __init__
@@ -19,7 +20,8 @@ from rhubarbe.logger import logger
 # pylint: disable=c0111,w1202,w0201,r1705,r0913
 
 
-# message_bus is just an asyncio.Queue
+# message_bus is a rhubarbe.bus.MessageBus, or one of its cursors,
+# that conveys rhubarbe.events.Event instances
 
 # a display instance comes with a hash
 # 'ip' -> DisplayNode
@@ -37,6 +39,7 @@ class DisplayNode:                                      # pylint: disable=r0903
 
 class Display:                                          # pylint: disable=r0902
     def __init__(self, nodes, message_bus):
+        # message_bus can be a cursor as well
         self.message_bus = message_bus
         self.nodes = nodes
         #
@@ -56,9 +59,12 @@ class Display:                                          # pylint: disable=r0902
             return self._display_node_by_ip[ipaddr]
 
         # in case the incoming ip is a reboot ip
-        from rhubarbe.inventory import Inventory
-        the_inventory = Inventory()
-        control_ip = the_inventory.control_ip_from_any_ip(ipaddr)
+        control_ip = ipaddr
+        if not any(node.control_ip_address() == ipaddr
+                   for node in self.nodes):
+            from rhubarbe.inventory import Inventory
+            the_inventory = Inventory()
+            control_ip = the_inventory.control_ip_from_any_ip(ipaddr)
         # locate this in the subject nodes list
         for rank, node in enumerate(self.nodes):
             if node.control_ip_address() == control_ip:
@@ -95,18 +101,18 @@ class Display:                                          # pylint: disable=r0902
         # in case the message is sent before the event loop has started
         duration = (f"+{int(time.time()-self._start_time):03}s"
                     if self._start_time is not None else 5*'-')
-        if isinstance(message, dict) and 'ip' in message:
-            ipaddr = message['ip']
+        if isinstance(message, Event) and message.ip is not None:
+            ipaddr = message.ip
             node = self.get_display_node(ipaddr)
             if node is None:
                 logger.info(f"Unexpected message gave node=None in dispatch: {message}")
-            elif 'tick' in message:
+            elif isinstance(message, Tick):
                 self.dispatch_ip_tick_hook(ipaddr, node, message,
                                            timestamp, duration)
-            elif 'percent' in message:
+            elif isinstance(message, Progress):
                 # compute delta, update node.percent and self.total_percent
                 node_previous_percent = node.percent
-                node_current_percent = message['percent']
+                node_current_percent = message.percent
                 delta = node_current_percent - node_previous_percent
                 node.percent = node_current_percent
                 self.total_percent += delta
@@ -125,39 +131,33 @@ class Display:                                          # pylint: disable=r0902
     def message_to_text(message):
         if isinstance(message, str):
             return message
-        elif not isinstance(message, dict):
+        elif not isinstance(message, Event):
             # should not happen
             return "UNEXPECTED" + str(message)
-        elif 'info' in message:
-            return message['info']
-        elif 'authorization' in message:
-            return "AUTH: " + message['authorization']
-        elif 'loading_image' in message:
-            return f"Loading image {message['loading_image']}"
-        elif 'selected_nodes' in message:
-            names = message['selected_nodes'].node_names()
-            return ("Selection: " + " ".join(names)) \
-                if names \
-                else "Empty Node Selection"
+        elif isinstance(message, Info):
+            return message.text
+        elif isinstance(message, Status) and message.kind == 'authorization':
+            return "AUTH: " + message.text
+        elif isinstance(message, Status):
+            return f"{message.kind} = {message.text}"
         else:
             return str(message)
 
-    subkeys = ['frisbee_retcod', 'reboot', 'ssh_status', 'frisbee_status']
-
-    def message_to_text_ip(self, message, node, mention_node=True):
-        text = None
-        if 'percent' in message:
-            text = f"{message['percent']:02}"
-        elif 'frisbee_retcod' in message:
+    @staticmethod
+    def message_to_text_ip(message, node, mention_node=True):
+        if isinstance(message, Progress):
+            text = f"{message.percent:02}"
+        elif isinstance(message, Retcod) and message.kind == 'frisbee_retcod':
             text = "Uploading successful" \
-                if message['frisbee_retcod'] == 0 \
+                if message.retcod == 0 \
                 else "Uploading FAILED !"
+        elif isinstance(message, Retcod):
+            text = f"{message.kind} = {message.retcod}"
+        elif isinstance(message, Status):
+            text = f"{message.kind} = {message.text}"
+        elif isinstance(message, Info):
+            text = message.text
         else:
-            for key in self.subkeys:
-                if key in message:
-                    text = f"{key} = {message[key]}"
-                    break
-        if text is None:
             text = str(message)
         return text \
             if not mention_node \
@@ -230,5 +230,5 @@ class Display:                                          # pylint: disable=r0902
         self.pbar.update(self.value)
         # hack way to finish the progressbar
         # since we have no other way to figure it out
-        if message['tick'] == 'END':
+        if message.end:
             self.pbar.finish()
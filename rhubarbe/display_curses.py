@@ -1,8 +1,17 @@
 """
 display class when using curses, like in
 rhubarbe load --curses
+
+Messages only update an in-memory model of the screen, and mark the
+corresponding lines as dirty; the screen is then redrawn at most fps
+times per second, and only for the dirty lines, in a single doupdate().
+
+When there are more nodes than lines in the terminal, nodes are laid out
+in a compact grid, with several nodes per line.
 """
 
+import time
+import asyncio
 import curses
 
 from rhubarbe.display import Display
@@ -20,28 +29,102 @@ class DisplayCurses(Display):
     # extra room on top and on the left
     offsetl = 3
     offsetc = 25
+    # max number of screen updates per second
+    fps = 10
 
     def start_hook(self):
         self.screen = curses.initscr()
         self.maxl, self.maxc = self.screen.getmaxyx()
-        self.submaxc = self.maxc - self.offsetc
-        if len(self.nodes) + self.offsetl + 2 >= self.maxl:
-            self.screen.addstr(1, 1,
-                               "WARNING: screen not high enough - "
-                               "best effort..")
-            self.screen.refresh()
-            self.submaxl = self.maxl - self.offsetl
+        nb_nodes = max(1, len(self.nodes))
+        # how many lines are available for nodes, borders excluded
+        lines = max(1, self.maxl - self.offsetl - 3)
+        self.columns = -(-nb_nodes // lines)
+        if self.columns == 1:
+            # one node per line, the time on the left
+            self.usable_l = nb_nodes
+            self.submaxc = self.maxc - self.offsetc
+            left = self.offsetc
         else:
-            self.submaxl = len(self.nodes) + 2
-        self.usable_l = self.submaxl - 1
+            # grid mode: no time, several nodes per line
+            self.usable_l = -(-nb_nodes // self.columns)
+            self.submaxc = self.maxc - 1
+            left = 1
+        self.submaxl = self.usable_l + 2
+        self.cell_width = (self.submaxc - 2) // self.columns
         self.screen.border()
         self.subwin = self.screen.subwin(self.submaxl, self.submaxc,
-                                         self.offsetl, self.offsetc)
+                                         self.offsetl, left)
         self.subwin.border()
+        # the model: line -> (time, text) for the 2 header lines
+        # rank -> (time, text) for nodes
+        self.headers = {}
+        self.cells = {}
+        self.dirty_headers = set()
+        self.dirty_cells = set()
+        self.last_render = 0
+        self.render_handle = None
+
+    ##########
+    def render(self):
+        """
+        write all dirty lines, and update the terminal in one go
+        """
+        self.render_handle = None
+        self.last_render = time.monotonic()
+        for line in self.dirty_headers:
+            timemsg, text = self.headers[line]
+            self.screen.addstr(line, 1, timemsg)
+            self.screen.addstr(line, self.offsetc+1,
+                               self._pad(text, self.maxc - self.offsetc - 2))
+        for rank in self.dirty_cells:
+            self.render_cell(rank)
+        self.dirty_headers.clear()
+        self.dirty_cells.clear()
+        self.screen.noutrefresh()
+        self.subwin.noutrefresh()
+        curses.doupdate()
+
+    def render_cell(self, rank):
+        timemsg, text = self.cells[rank]
+        line = (rank % self.usable_l) + 1
+        if self.columns == 1:
+            self.screen.addstr(line+self.offsetl, 1, timemsg)
+            self.subwin.addstr(line, 1, self.pad(text))
+        else:
+            column = rank // self.usable_l
+            self.subwin.addstr(line, 1 + column * self.cell_width,
+                               self._pad(text, self.cell_width - 1))
+
+    def schedule_render(self):
+        """
+        render now if the last render is old enough, later otherwise
+        """
+        if self.render_handle is not None:
+            return
+        delay = self.last_render + 1 / self.fps - time.monotonic()
+        if delay <= 0:
+            self.render()
+        else:
+            self.render_handle = \
+                asyncio.get_event_loop().call_later(delay, self.render)
+
+    def set_header(self, line, timemsg, text):
+        self.headers[line] = (timemsg, text)
+        self.dirty_headers.add(line)
+        self.schedule_render()
 
+    def set_cell(self, node, timemsg, text):
+        self.cells[node.rank] = (timemsg, text)
+        self.dirty_cells.add(node.rank)
+        self.schedule_render()
+
+    ##########
     # this is guaranteed to run once the event loop has returned
     # and all the messages have been displayed
     def epilogue(self):
+        if self.render_handle is not None:
+            self.render_handle.cancel()
+        self.render()
         prompt = "Press any key to exit"
         if self.goodbye_message:
             prompt = self.goodbye_message + " " + prompt
@@ -56,40 +139,41 @@ class DisplayCurses(Display):
     def dispatch_hook(self, message, timestamp, duration):
         timemsg = f"{timestamp} {duration}"
         text = self.message_to_text(message)
-        self.screen.addstr(1, 1, timemsg)
-        self.screen.addstr(1, self.offsetc+1, self.pad(text))
-        self.screen.refresh()
+        self.set_header(1, timemsg, text)
 
     def dispatch_ip_hook(self, _, node,            # pylint:disable=w0221,r0913
                          message, timestamp, duration):
         timemsg = f"{timestamp} {duration} {node.name}"
         text = self.message_to_text_ip(message, node, mention_node=False)
-        text = str(text)
-        line = (node.rank % self.usable_l) + 1
-        self.screen.addstr(line+self.offsetl, 1, timemsg)
-        self.subwin.addstr(line, 1, self.pad(text))
-        self.screen.refresh()
-        self.subwin.refresh()
+        if self.columns > 1:
+            text = f"{node.name} {text}"
+        self.set_cell(node, timemsg, str(text))
 
     def dispatch_ip_percent_hook(self, _, node,    # pylint:disable=w0221,r0913
                                  message, timestamp, duration):
         # global area
         timemsg = f"{timestamp} {duration}"
-        text = self.node_percent_bar(int((self.total_percent)/len(self.nodes)))
-        self.screen.addstr(2, 1, timemsg)
-        self.screen.addstr(2, self.offsetc+1, self.pad(text))
+        text = self.percent_bar(int((self.total_percent)/len(self.nodes)),
+                                self.maxc - self.offsetc - 2)
+        self.set_header(2, timemsg, text)
         # node area
         timemsg = f"{timestamp} {duration} {node.name}"
-        barsize = self.node_percent_bar(node.percent)
-        line = (node.rank % self.usable_l) + 1
-        self.screen.addstr(line+self.offsetl, 1, timemsg)
-        self.subwin.addstr(line, 1, barsize)
-        self.screen.refresh()
-        self.subwin.refresh()
+        if self.columns == 1:
+            text = self.node_percent_bar(node.percent)
+        else:
+            label = f"{node.name} "
+            text = label + self.percent_bar(
+                node.percent, self.cell_width - 1 - len(label))
+        self.set_cell(node, timemsg, text)
 
     def node_percent_bar(self, percent):
-        # 2 is for the 2 borders left and right; 4 is the size for '|10%'
-        avail = self.submaxc - 2 - 4
+        # 2 is for the 2 borders left and right
+        return self.percent_bar(percent, self.submaxc - 2)
+
+    @staticmethod
+    def percent_bar(percent, width):
+        # 4 is the size for '|10%'
+        avail = max(0, width - 4)
         left = int(percent*avail/100)
         middle = avail - left
         right = f"|{percent:02}%" if percent != 100 else "||||"
@@ -102,6 +186,8 @@ class DisplayCurses(Display):
 
     @staticmethod
     def _pad(text, width):
+        if width <= 3:
+            return text[:max(width, 0)]
         if len(text) == width:
             return text
         elif len(text) > width:
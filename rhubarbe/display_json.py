@@ -0,0 +1,105 @@
+"""
+display class for machine consumption, like in
+rhubarbe load --json
+
+Each event is written on stdout as one compact JSON line (NDJSON),
+and flushed right away; e.g.
+
+{"time":1700000000.123,"elapsed":12.3,"type":"progress","node":"fit01","percent":40,"total":25}
+
+Progress events - percents and ticks - are throttled, per node, to
+one every `interval` seconds; the final ones, 100% or end of ticks,
+are always written. The last line has type 'end'.
+"""
+
+import sys
+import json
+import time
+
+from rhubarbe.display import Display
+from rhubarbe.events import Event
+
+# c0111 no docstrings yet
+# w0201 attributes defined outside of __init__
+# r0913 too many arguments in functions
+# pylint: disable=c0111,w0201,r0913
+
+
+class DisplayJson(Display):
+
+    # min delay between 2 progress lines for a given node
+    interval = 0.5
+
+    def __init__(self, nodes, message_bus, output=None):
+        super().__init__(nodes, message_bus)
+        self.output = output or sys.stdout
+        # node name -> time of the last progress line
+        self._last_progress = {}
+
+    def emit(self, record):
+        self.output.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self.output.flush()
+
+    def record(self, message, node=None):
+        timestamp = getattr(message, 'timestamp', time.time())
+        record = {
+            'time': round(timestamp, 3),
+            # events may be issued before the display starts
+            'elapsed': round(max(0, timestamp - self._start_time), 3)
+                       if self._start_time is not None else 0,
+        }
+        if not isinstance(message, Event):
+            record.update({'type': 'info', 'text': str(message)})
+            return record
+        record['type'] = type(message).__name__.lower()
+        if node is not None:
+            record['node'] = node.name
+        for key, value in message.fields().items():
+            # kind is the phase the node is in, e.g. reboot or frisbee
+            record['phase' if key == 'kind' else key] = value
+        return record
+
+    def throttled(self, node, final):
+        """
+        returns True if a progress line for that node can be skipped
+        """
+        now = time.monotonic()
+        last = self._last_progress.get(node.name)
+        if not final and last is not None and now - last < self.interval:
+            return True
+        self._last_progress[node.name] = now
+        return False
+
+    ####################
+    def epilogue(self):
+        # a node may show up under several ips
+        percents = {}
+        for node in self._display_node_by_ip.values():
+            percents[node.name] = max(node.percent,
+                                      percents.get(node.name, 0))
+        record = {'time': round(time.time(), 3), 'type': 'end',
+                  'nodes': percents}
+        if self.goodbye_message:
+            record['text'] = self.goodbye_message
+        self.emit(record)
+
+    def dispatch_hook(self, message, timestamp, duration):
+        self.emit(self.record(message))
+
+    def dispatch_ip_hook(self, ipaddr, node,            # pylint: disable=w0613
+                         message, timestamp, duration):
+        self.emit(self.record(message, node))
+
+    def dispatch_ip_percent_hook(self, ipaddr, node,    # pylint: disable=w0613
+                                 message, timestamp, duration):
+        if self.throttled(node, message.percent == 100):
+            return
+        record = self.record(message, node)
+        record['total'] = int(self.total_percent / max(1, len(self.nodes)))
+        self.emit(record)
+
+    def dispatch_ip_tick_hook(self, ipaddr, node,       # pylint: disable=w0613
+                              message, timestamp, duration):
+        if self.throttled(node, message.end):
+            return
+        self.emit(self.record(message, node))
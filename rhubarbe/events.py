@@ -0,0 +1,115 @@
+"""
+The events that travel on the message bus
+
+Each event optionnally comes with the ip of the node it is about,
+and is timestamped when created.
+
+* Progress: a node is that many percent through, e.g. with frisbee
+* Tick: a node is making progress, but with no known total, e.g.
+  with imagezip; the last one has end=True
+* Status: a node or server reports on what it is doing, as a text;
+  kind tells what this is about, e.g. 'reboot' or 'ssh_status'
+* Retcod: the return code of a subprocess on a node, e.g. frisbee
+* Info: free text
+
+Producers typically use make_event(), that builds the right event
+from the traditional (field, value) pairs, like ('percent', 10).
+"""
+
+# c0111 no docstrings yet
+# r0903 too few public methods
+# pylint: disable=c0111, r0903
+
+import time
+
+
+class Event:
+
+    __slots__ = ('ip', 'timestamp')
+
+    def __init__(self, ip=None):
+        self.ip = ip
+        self.timestamp = time.time()
+
+    def fields(self):
+        """
+        the specifics of this event, as a dict
+        """
+        return {slot: getattr(self, slot)
+                for klass in type(self).__mro__[:-2]
+                for slot in klass.__slots__}
+
+    def __repr__(self):
+        details = " ".join(f"{key}={value!r}"
+                           for key, value in self.fields().items())
+        about = f" {self.ip}" if self.ip else ""
+        return f"<{type(self).__name__}{about} {details}>"
+
+
+class Progress(Event):
+
+    __slots__ = ('percent',)
+
+    def __init__(self, percent, ip=None):
+        super().__init__(ip)
+        self.percent = percent
+
+
+class Tick(Event):
+
+    __slots__ = ('end',)
+
+    def __init__(self, end=False, ip=None):
+        super().__init__(ip)
+        self.end = end
+
+
+class Status(Event):
+
+    __slots__ = ('kind', 'text')
+
+    def __init__(self, kind, text, ip=None):
+        super().__init__(ip)
+        self.kind = kind
+        self.text = text
+
+
+class Retcod(Event):
+
+    __slots__ = ('kind', 'retcod')
+
+    def __init__(self, kind, retcod, ip=None):
+        super().__init__(ip)
+        self.kind = kind
+        self.retcod = retcod
+
+
+class Info(Event):
+
+    __slots__ = ('text',)
+
+    def __init__(self, text, ip=None):
+        super().__init__(ip)
+        self.text = text
+
+
+def make_event(field, value, ip=None):
+    """
+    build an event from a (field, value) pair
+    """
+    if field == 'percent':
+        return Progress(value, ip=ip)
+    if field == 'tick':
+        return Tick(end=(value == 'END'), ip=ip)
+    if field == 'info':
+        return Info(value, ip=ip)
+    if field.endswith('_retcod'):
+        return Retcod(field, value, ip=ip)
+    return Status(field, value, ip=ip)
+
+
+def selection_info(selector):
+    names = selector.node_names()
+    return Info(("Selection: " + " ".join(names))
+                if names
+                else "Empty Node Selection")
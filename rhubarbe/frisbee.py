@@ -14,20 +14,29 @@ import re
 from rhubarbe.logger import logger
 from rhubarbe.telnet import TelnetProxy
 from rhubarbe.config import Config
+from rhubarbe.tracer import Tracer
+from rhubarbe.events import make_event
 
 
 class FrisbeeParser:
     def __init__(self, proxy):
         self.proxy = proxy
         self.total_chunks = 0
+        self.progressing = False
 
     def ip(self):
         return self.proxy.control_ip
 
     def feedback(self, field, msg):
-        self.proxy.message_bus.put_nowait({'ip': self.ip(), field: msg})
+        self.proxy.message_bus.put_nowait(
+            make_event(field, msg, ip=self.ip()))
 
     def send_percent(self, percent):
+        if int(percent) > 0 and not self.progressing:
+            self.progressing = True
+            Tracer().mark(self.ip(), 'first percent')
+        if int(percent) == 100:
+            Tracer().mark(self.ip(), '100%')
         self.feedback('percent', percent)
 
     # parse frisbee output
@@ -110,7 +119,8 @@ class Frisbee(TelnetProxy):
         logger.info(f"on {self.control_ip} : running command {self.command}")
         await self.feedback('frisbee_status', "starting frisbee client")
 
-        retcod = await self.session([self.command])
+        with Tracer().span(self.control_ip, 'frisbee'):
+            retcod = await self.session([self.command])
 
         logger.info(f"frisbee on {self.control_ip} returned {retcod}")
 
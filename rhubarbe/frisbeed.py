@@ -16,6 +16,8 @@ import asyncio
 
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.tracer import Tracer, SERVER_TRACK
+from rhubarbe.events import make_event
 
 
 class Frisbeed:
@@ -40,16 +42,20 @@ class Frisbeed:
         return text
 
     async def feedback(self, field, msg):
-        await self.message_bus.put({field: msg})
+        await self.message_bus.put(make_event(field, msg))
 
     def feedback_nowait(self, field, msg):
-        self.message_bus.put_nowait({field: msg})
+        self.message_bus.put_nowait(make_event(field, msg))
 
-    async def start(self):                              # pylint: disable=r0914
+    async def start(self):
         """
         Start a frisbeed instance
         returns a tuple multicast_group, port_number
         """
+        with Tracer().span(SERVER_TRACK, 'frisbeed start'):
+            return await self._start()
+
+    async def _start(self):                             # pylint: disable=r0914
         the_config = Config()
         server = the_config.value('frisbee', 'server')
         server_options = the_config.value('frisbee', 'server_options')
@@ -74,12 +80,13 @@ class Frisbeed:
             command = command_common + [
                 "-m", multicast_group, "-p", multicast_port,
                 ]
-            self.subprocess = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-                )
-            await asyncio.sleep(1)
+            with Tracer().span(SERVER_TRACK, 'port allocation'):
+                self.subprocess = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT
+                    )
+                await asyncio.sleep(1)
             # after such a short time, frisbeed should not have returned yet
             # if it has, we try our luck on another couple (ip, port)
             command_line = " ".join(command)
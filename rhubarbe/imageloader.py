@@ -16,23 +16,26 @@ from asynciojobs import Scheduler, Job
 from rhubarbe.frisbeed import Frisbeed
 from rhubarbe.leases import Leases
 from rhubarbe.config import Config
+from rhubarbe.events import make_event
 
 
 class ImageLoader:
 
     def __init__(self, nodes, image, bandwidth,         # pylint: disable=r0913
-                 message_bus, display):
+                 message_bus, display, sinks=()):
         self.nodes = nodes
         self.image = image
         self.bandwidth = bandwidth
         self.display = display
         self.message_bus = message_bus
+        # other coroutines that read the bus, like a recorder
+        self.sinks = sinks
         #
         self.frisbeed = None
 
 
     async def feedback(self, field, msg):
-        await self.message_bus.put({field: msg})
+        await self.message_bus.put(make_event(field, msg))
 
 
     async def stage1(self):
@@ -105,7 +108,9 @@ class ImageLoader:
 
         mainjob = Job(self.run(reset), critical=True)
         displayjob = Job(self.display.run(), forever=True, critical=True)
-        scheduler = Scheduler(mainjob, displayjob,
+        sinkjobs = [Job(sink, forever=True, critical=False)
+                    for sink in self.sinks]
+        scheduler = Scheduler(mainjob, displayjob, *sinkjobs,
                               timeout=timeout,
                               critical=False)
 
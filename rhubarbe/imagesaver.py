@@ -16,24 +16,27 @@ from asynciojobs import Scheduler, Job
 from rhubarbe.collector import Collector
 from rhubarbe.leases import Leases
 from rhubarbe.config import Config
+from rhubarbe.events import make_event
 
 
 class ImageSaver:
 
     def __init__(self, node, image, radical,            # pylint: disable=r0913
-                 message_bus, display, comment):
+                 message_bus, display, comment, sinks=()):
         self.node = node
         self.image = image
         self.radical = radical
         self.message_bus = message_bus
         self.display = display
         self.comment = comment
+        # other coroutines that read the bus, like a recorder
+        self.sinks = sinks
         #
         self.collector = None
 
 
     async def feedback(self, field, msg):
-        await self.message_bus.put({field: msg})
+        await self.message_bus.put(make_event(field, msg))
 
 
     # this is exactly as imageloader
@@ -111,8 +114,10 @@ class ImageSaver:
     def main(self, reset, timeout):
         mainjob = Job(self.run(reset), critical=True)
         displayjob = Job(self.display.run(), forever=True, critical=True)
+        sinkjobs = [Job(sink, forever=True, critical=False)
+                    for sink in self.sinks]
 
-        scheduler = Scheduler(mainjob, displayjob,
+        scheduler = Scheduler(mainjob, displayjob, *sinkjobs,
                               timeout=timeout,
                               critical=False)
 
@@ -17,6 +17,7 @@ import asyncio
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
 from rhubarbe.telnet import TelnetProxy
+from rhubarbe.tracer import Tracer
 
 
 class ImageZip(TelnetProxy):
@@ -81,10 +82,11 @@ class ImageZip(TelnetProxy):
                             f"starting imagezip on {self.control_ip}")
 
         # print out exit status so the parser can catch it and expose it
-        retcod, _ = await asyncio.gather(
-            self.session(commands),
-            self.ticker(),
-        )
+        with Tracer().span(self.control_ip, 'imagezip'):
+            retcod, _ = await asyncio.gather(
+                self.session(commands),
+                self.ticker(),
+            )
         logger.info(f"imagezip on {self.control_ip} returned {retcod}")
 
         return retcod
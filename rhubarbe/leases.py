@@ -19,6 +19,7 @@ import traceback
 from .logger import logger
 from .config import Config
 from .plcapiproxy import PlcApiProxy
+from .events import make_event
 
 DEBUG = False
 DEBUG = True
@@ -169,7 +170,7 @@ class Leases:                                           # pylint: disable=r0902
         """
         send feedback, for displaying or monitoring
         """
-        await self.message_bus.put({field: msg})
+        await self.message_bus.put(make_event(field, msg))
 
     def has_special_privileges(self):
         """
@@ -389,7 +390,11 @@ class Leases:                                           # pylint: disable=r0902
             print(f"Cannot find lease with rank {lease_rank}")
             return
         lease_ids = [the_lease.lease_id]
-        retcod = self.plcapi_proxy.UpdateLeases(lease_ids, update_fields)
+        try:
+            retcod = self.plcapi_proxy.UpdateLeases(lease_ids, update_fields)
+        except Exception as exc:
+            print('Error', f"Cannot update lease - exc={exc}")
+            return
         if 'errors' in retcod and retcod['errors']:
             for error in retcod['errors']:
                 print(f"error: {error}")
@@ -405,7 +410,11 @@ class Leases:                                           # pylint: disable=r0902
             print(f"Cannot find lease with rank {lease_rank}")
             return
         lease_ids = [the_lease.lease_id]
-        retcod = self.plcapi_proxy.DeleteLeases(lease_ids)
+        try:
+            retcod = self.plcapi_proxy.DeleteLeases(lease_ids)
+        except Exception as exc:
+            print('Error', f"Cannot delete lease - exc={exc}")
+            return
         if retcod == 1:
             print("OK")
             # force next reload
@@ -1,5 +1,10 @@
 """
 create/configure logger objects
+
+Loggers don't write themselves: they push their records on a queue,
+and a separate thread - a QueueListener - does the actual writing,
+so that logging never blocks the event loop on I/O.
+See the [logging] section in the config for the available settings.
 """
 
 # c0111 no docstrings yet
@@ -12,10 +17,14 @@ create/configure logger objects
 # pylint: disable=c0103, w0703
 
 import sys
-from pathlib import Path
+import copy
+import json
+import queue
+import atexit
 
 import logging
 import logging.config
+import logging.handlers
 
 # with systemd it's sooo simpler to log on stdout, that gets managed by journal
 # so, we essentially need
@@ -23,6 +32,26 @@ import logging.config
 # * one special logger for monitor*s that goes onto stdout -> journal
 # * one special logger for accounts - ditto but with a shorter layout
 
+
+class JsonFormatter(logging.Formatter):
+    """
+    one JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
 rhubarbe_logging_config = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -40,9 +69,12 @@ rhubarbe_logging_config = {
     'handlers': {
         'rhubarbe': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'logging.handlers.RotatingFileHandler',
             'formatter': 'standard',
             'filename': 'rhubarbe.log',
+            # see [logging] in the config
+            'maxBytes': 10 * 2**20,
+            'backupCount': 5,
         },
         'monitor': {
             'level': 'INFO',
@@ -76,6 +108,69 @@ rhubarbe_logging_config = {
     },
 }
 
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    records never leave the process, so unlike with QueueHandler,
+    exc_info is kept for the actual formatters - the JSON one puts
+    it apart; only the message gets rendered right away
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class AsynchronousLogging:
+    """
+    moves the handlers of some loggers behind a single queue, that
+    gets emptied by a single thread; each handler only deals with
+    the records of the logger it was attached to
+    """
+
+    def __init__(self, *loggers):
+        self.loggers = loggers
+        # logger -> its actual handlers
+        self.handlers = {}
+        self.listener = None
+
+    def start(self):
+        if self.listener is not None:
+            return
+        the_queue = queue.SimpleQueue()
+        all_handlers = []
+        for the_logger in self.loggers:
+            handlers = the_logger.handlers[:]
+            self.handlers[the_logger] = handlers
+            for handler in handlers:
+                handler.addFilter(logging.Filter(the_logger.name))
+                the_logger.removeHandler(handler)
+                all_handlers.append(handler)
+            the_logger.addHandler(LocalQueueHandler(the_queue))
+        self.listener = logging.handlers.QueueListener(
+            the_queue, *all_handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """
+        writes all pending records, and puts the handlers back in place
+        """
+        if self.listener is None:
+            return
+        self.listener.stop()
+        self.listener = None
+        for the_logger, handlers in self.handlers.items():
+            for handler in the_logger.handlers[:]:
+                the_logger.removeHandler(handler)
+            for handler in handlers:
+                handler.filters.clear()
+                the_logger.addHandler(handler)
+        self.handlers = {}
+
+
 logging.config.dictConfig(rhubarbe_logging_config)
 
 # general case:
@@ -90,6 +185,33 @@ monitor_logger = logging.getLogger('monitor')
 # from rhubarbe.logger import accounts_logger as logger
 accounts_logger = logging.getLogger('accounts')
 
+asynchronous_logging = AsynchronousLogging(
+    logger, monitor_logger, accounts_logger)
+asynchronous_logging.start()
+
+
+def configure_logging(parser):
+    """
+    apply the [logging] section of the config - a ConfigParser;
+    called when the config gets loaded
+    """
+    if 'logging' not in parser:
+        return
+    section = parser['logging']
+    if not section.getboolean('asynchronous', True):
+        asynchronous_logging.stop()
+    handlers = [handler
+                for the_logger in (logger, monitor_logger, accounts_logger)
+                for handler in asynchronous_logging.handlers.get(
+                    the_logger, the_logger.handlers)]
+    for handler in handlers:
+        if section.get('format', 'text') == 'json':
+            handler.setFormatter(JsonFormatter())
+        if isinstance(handler, logging.handlers.RotatingFileHandler):
+            handler.maxBytes = section.getint('max_bytes', handler.maxBytes)
+            handler.backupCount = section.getint('backup_count',
+                                                 handler.backupCount)
+
 ####################
 # test
 if __name__ == '__main__':
@@ -15,7 +15,10 @@ Command-line entry point
 # we need to be able to mess inside the logger module
 # before it gets loaded from another way
 
+import sys
+import time
 import asyncio
+from contextlib import redirect_stdout, nullcontext
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
@@ -31,8 +34,11 @@ from rhubarbe.imagesrepo import ImagesRepo
 from rhubarbe.selector import (Selector,
                                add_selector_arguments, selected_selector)
 from rhubarbe.action import Action
+from rhubarbe.bus import MessageBus
+from rhubarbe.events import Info, selection_info
 from rhubarbe.display import Display
 from rhubarbe.display_curses import DisplayCurses
+from rhubarbe.display_json import DisplayJson
 from rhubarbe.node import Node
 from rhubarbe.imageloader import ImageLoader
 from rhubarbe.imagesaver import ImageSaver
@@ -45,6 +51,13 @@ from rhubarbe.ssh import SshProxy
 from rhubarbe.leases import Leases
 from rhubarbe.inventory import Inventory
 from rhubarbe.inventoryphones import InventoryPhones
+from rhubarbe.tracer import Tracer
+from rhubarbe.metrics import metrics_server, count_events
+from rhubarbe.watchdog import add_watchdog_argument, start_watchdog
+from rhubarbe.remotecommand import RemoteCommand
+from rhubarbe.push import Pusher
+from rhubarbe.recorder import (Recorder, RecordedNode,
+                               read_recording, replay as replay_events)
 
 
 # a supported command comes with a driver function
@@ -160,7 +173,7 @@ def cmc_verb(verb, resa_policy, *argv):
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
     leases = Leases(message_bus)                        # pylint: disable=w0621
 
     if resa_policy in ('warn', 'enforce'):
@@ -243,7 +256,7 @@ def bye(*argv):
     if selector.is_empty():
         selector.use_all_scope()
 
-    bus = asyncio.Queue()
+    bus = MessageBus()
     Action('usrpoff', selector).run(bus, args.timeout)
 
     # keep it simple for now
@@ -263,6 +276,51 @@ def bye(*argv):
 ####################
 
 
+def display_class(args):
+    """
+    the Display class to use, depending on --curses and --json
+    """
+    if getattr(args, 'json', False):
+        return DisplayJson
+    if getattr(args, 'curses', False):
+        return DisplayCurses
+    return Display
+
+
+def json_stdout(args):
+    """
+    with --json, stdout is for the JSON lines only, so whatever else
+    gets printed - binaries check, scheduler debrief, trace summary -
+    goes to stderr; the display must be created beforehand
+    """
+    return redirect_stdout(sys.stderr) if args.json else nullcontext()
+
+
+def add_record_argument(parser):
+    parser.add_argument("--record", default=None, metavar="FILE",
+                        help="""record all the events in that file,
+                        for use with rhubarbe replay""")
+
+
+def recorder_sinks(args, nodes, message_bus, command):
+    """
+    the extra coroutines to run for --record, as a list
+    """
+    if not args.record:
+        return []
+    recorder = Recorder(args.record, nodes, message_bus, command)
+    return [recorder.run()]
+
+
+def save_trace(filename):
+    tracer = Tracer()
+    tracer.save(filename)
+    tracer.print_summary()
+    print(f"trace saved in {filename} - see chrome://tracing")
+
+####################
+
+
 @subcommand
 def load(*argv):
     usage = f"""
@@ -270,7 +328,6 @@ def load(*argv):
     {RESERVATION_REQUIRED}
     """
     config = Config()
-    config.check_binaries()
     imagesrepo = ImagesRepo()
 
     parser = ArgumentParser(usage=usage,
@@ -289,16 +346,27 @@ def load(*argv):
                         help="Set bandwidth in Mibps for frisbee uploading")
     parser.add_argument("-c", "--curses", action='store_true', default=False,
                         help="Use curses to provide term-based animation")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write events on stdout as JSON lines, "
+                        "for use by other programs")
     # this is more for debugging
     parser.add_argument("-n", "--no-reset", dest='reset',
                         action='store_false', default=True,
                         help="""use this with nodes that are already
                         running a frisbee image. They won't get reset,
                         neither before or after the frisbee session""")
+    parser.add_argument("--trace", default=None,
+                        help="""record the timing of each phase for each node
+                        in that file, in Chrome trace format,
+                        and display a summary""")
+    add_record_argument(parser)
+    add_watchdog_argument(parser)
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
+    with json_stdout(args):
+        config.check_binaries()
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     selector = selected_selector(args)
     if selector.is_empty():
@@ -306,25 +374,34 @@ def load(*argv):
         return 1
     nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
              for cmc_name in selector.cmc_names()]
+    sinks = recorder_sinks(args, nodes, message_bus, 'load')
 
     # send feedback
-    message_bus.put_nowait({'selected_nodes': selector})
+    message_bus.put_nowait(selection_info(selector))
     from rhubarbe.logger import logger
     logger.info(f"timeout is {args.timeout}s")
     logger.info(f"bandwidth is {args.bandwidth} Mibps")
 
     actual_image = imagesrepo.locate_image(args.image, look_in_global=True)
     if not actual_image:
-        print(f"Image file {args.image} not found - emergency exit")
+        print(f"Image file {args.image} not found - emergency exit",
+              file=sys.stderr)
         exit(1)
 
     # send feedback
-    message_bus.put_nowait({'loading_image': actual_image})
-    display_class = Display if not args.curses else DisplayCurses
-    display = display_class(nodes, message_bus)
+    message_bus.put_nowait(Info(f"Loading image {actual_image}"))
+    display = display_class(args)(nodes, message_bus)
     loader = ImageLoader(nodes, image=actual_image, bandwidth=args.bandwidth,
-                         message_bus=message_bus, display=display)
-    return loader.main(reset=args.reset, timeout=args.timeout)
+                         message_bus=message_bus, display=display,
+                         sinks=sinks)
+    if args.trace:
+        Tracer().enable()
+    start_watchdog(args.watchdog)
+    with json_stdout(args):
+        retcod = loader.main(reset=args.reset, timeout=args.timeout)
+        if args.trace:
+            save_trace(args.trace)
+    return retcod
 
 ####################
 
@@ -340,7 +417,6 @@ def save(*argv):
     """
 
     config = Config()
-    config.check_binaries()
 
     parser = ArgumentParser(usage=usage,
                             formatter_class=ArgumentDefaultsHelpFormatter)
@@ -360,10 +436,21 @@ def save(*argv):
                         help="""use this with a node that is already
                         running a frisbee image. It won't get reset,
                         neither before or after the frisbee session""")
+    parser.add_argument("--trace", default=None,
+                        help="""record the timing of each phase
+                        in that file, in Chrome trace format,
+                        and display a summary""")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write events on stdout as JSON lines, "
+                        "for use by other programs")
+    add_record_argument(parser)
+    add_watchdog_argument(parser)
     parser.add_argument("node")
     args = parser.parse_args(argv)
+    with json_stdout(args):
+        config.check_binaries()
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     selector = Selector()
     selector.add_range(args.node)
@@ -373,17 +460,24 @@ def save(*argv):
     cmc_name = next(selector.cmc_names())
     node = Node(cmc_name, message_bus)
     nodename = node.control_hostname()
+    sinks = recorder_sinks(args, [node], message_bus, 'save')
 
     imagesrepo = ImagesRepo()
     actual_image = imagesrepo.where_to_save(nodename, args.radical)
-    message_bus.put_nowait({'info': f"Saving image {actual_image}"})
+    message_bus.put_nowait(Info(f"Saving image {actual_image}"))
     # curses has no interest here since we focus on one node
-    display_class = Display
-    display = display_class([node], message_bus)
+    display = display_class(args)([node], message_bus)
     saver = ImageSaver(node, image=actual_image, radical=args.radical,
                        message_bus=message_bus, display=display,
-                       comment=args.comment)
-    return saver.main(reset=args.reset, timeout=args.timeout)
+                       comment=args.comment, sinks=sinks)
+    if args.trace:
+        Tracer().enable()
+    start_watchdog(args.watchdog)
+    with json_stdout(args):
+        retcod = saver.main(reset=args.reset, timeout=args.timeout)
+        if args.trace:
+            save_trace(args.trace)
+    return retcod
 
 ####################
 
@@ -402,6 +496,9 @@ def wait(*argv):                                        # pylint: disable=r0914
                             formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("-c", "--curses", action='store_true', default=False,
                         help="Use curses to provide term-based animation")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write events on stdout as JSON lines, "
+                        "for use by other programs")
     parser.add_argument("-t", "--timeout", action='store',
                         default=config.value('nodes',
                                                  'wait_default_timeout'),
@@ -412,56 +509,224 @@ def wait(*argv):                                        # pylint: disable=r0914
                         type=float,
                         help="Specify backoff average between "
                         "attempts to ssh connect")
+    parser.add_argument("-n", "--no-banner-probe", dest='probe_banner',
+                        action='store_false',
+                        default=config.value('networking', 'ssh_probe_banner')
+                        .lower() in ('true', 'yes', 'on', '1'),
+                        help="""attempt the ssh handshake right away,
+                        without waiting for the ssh banner first""")
+    parser.add_argument("-m", "--control-master", action='store_true',
+                        default=False,
+                        help="""leave behind an OpenSSH master connection
+                        to each node, for the next ssh sessions to reuse,
+                        see ssh_control_path in the config""")
     # really dont' write anything
     parser.add_argument("-s", "--silent", action='store_true', default=False)
     parser.add_argument("-v", "--verbose", action='store_true', default=False)
+    add_record_argument(parser)
+    add_watchdog_argument(parser)
 
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
 
-    # --curses implies --verbose otherwise nothing shows up
-    if args.curses:
+    # --curses, --json and --record imply --verbose
+    # otherwise nothing shows up
+    if args.curses or args.json or args.record:
         args.verbose = True
 
     selector = selected_selector(args)
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
+    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
+             for cmc_name in selector.cmc_names()]
+    # the recorder subscribes when created, so before the first event
+    sinks = recorder_sinks(args, nodes, message_bus, 'wait')
 
     if args.verbose:
-        message_bus.put_nowait({'selected_nodes': selector})
+        message_bus.put_nowait(selection_info(selector))
     from rhubarbe.logger import logger
     logger.info(f"wait: backoff is {args.backoff} "
                 f"and global timeout is {args.timeout}")
 
-    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
-             for cmc_name in selector.cmc_names()]
     sshs = [SshProxy(node, verbose=args.verbose) for node in nodes]
-    jobs = [Job(ssh.wait_for(args.backoff), critical=True) for ssh in sshs]
+    jobs = [Job(ssh.wait_for(args.backoff, probe=args.probe_banner,
+                             master=args.control_master),
+                critical=True)
+            for ssh in sshs]
+    jobs += [Job(sink, forever=True, critical=False) for sink in sinks]
 
-    display_class = Display if not args.curses else DisplayCurses
-    display = display_class(nodes, message_bus)
+    display = display_class(args)(nodes, message_bus)
 
     # have the display class run forever until the other ones are done
     scheduler = Scheduler(Job(display.run(), forever=True, critical=True),
                           *jobs,
                           timeout=args.timeout,
                           critical=False)
+    start_watchdog(args.watchdog)
     try:
-        orchestration = scheduler.run()
-        if orchestration:
-            return 0
-        else:
-            if args.verbose:
-                scheduler.debrief()
-            return 1
+        with json_stdout(args):
+            orchestration = scheduler.run()
+            if orchestration:
+                return 0
+            else:
+                if args.verbose:
+                    scheduler.debrief()
+                return 1
     except KeyboardInterrupt:
-        print("rhubarbe-wait : keyboard interrupt - exiting")
+        print("rhubarbe-wait : keyboard interrupt - exiting",
+              file=sys.stderr if args.json else sys.stdout)
         # xxx
         return 1
     finally:
         display.epilogue()
-        if not args.silent:
+        if args.json:
+            for ssh in sshs:
+                display.emit({'time': round(time.time(), 3),
+                              'type': 'result',
+                              'node': ssh.node.control_hostname(),
+                              'ssh': bool(ssh.status),
+                              'banner': ssh.banner_time and
+                                        round(ssh.banner_time, 3),
+                              'ready': ssh.ready_time and
+                                       round(ssh.ready_time, 3),
+                              'master': ssh.master})
+        elif not args.silent:
             for ssh in sshs:
                 print(f"{ssh.node}:ssh {'OK' if ssh.status else 'KO'}")
+        for ssh in sshs:
+            if ssh.ready_time is not None:
+                logger.info(f"{ssh.node} ready after {ssh.ready_time:.3f}s")
+
+####################
+
+
+@subcommand
+def replay(*argv):
+    usage = """
+    Replay the events recorded with --record, e.g. with load or wait,
+    through one of the displays; also useful to benchmark the displays
+    """
+    parser = ArgumentParser(usage=usage,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-c", "--curses", action='store_true', default=False,
+                        help="Use curses to provide term-based animation")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write events on stdout as JSON lines, "
+                        "for use by other programs")
+    parser.add_argument("-s", "--speed", default=1., type=float,
+                        help="""replay that many times faster than
+                        the original pace; 0 means as fast as possible""")
+    parser.add_argument("recording")
+    args = parser.parse_args(argv)
+
+    header, events = read_recording(args.recording)
+    message_bus = MessageBus()
+    nodes = [RecordedNode(node['name'], node['ip'])     # pylint: disable=w0621
+             for node in header['nodes']]
+    display = display_class(args)(nodes, message_bus)
+
+    async def feed():
+        await replay_events(events, message_bus, args.speed)
+        await display.stop()
+
+    beg = time.monotonic()
+    try:
+        asyncio.get_event_loop().run_until_complete(
+            asyncio.gather(display.run(), feed()))
+    except KeyboardInterrupt:
+        display.set_goodbye("rhubarbe-replay : keyboard interrupt, bye")
+        return 1
+    finally:
+        display.epilogue()
+    duration = time.monotonic() - beg
+    print(f"replayed {len(events)} events from {header['command']}"
+          f" in {duration:.3f}s", file=sys.stderr)
+    return 0
+
+####################
+
+
+@subcommand
+def exec(*argv):                                        # pylint: disable=w0622
+    usage = """
+    Run a shell command on selected nodes in parallel, like in
+      rhubarbe exec 1-4 -- uname -r
+    Output lines are prefixed with the node name;
+    returns 0 if the command succeeded on all nodes
+    """
+    # everything after -- is the command
+    command = []
+    if "--" in argv:
+        index = argv.index("--")
+        argv, command = argv[:index], argv[index+1:]
+    parser = ArgumentParser(usage=usage,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-w", "--window", default=50, type=int,
+                        help="how many nodes at the same time")
+    parser.add_argument("-t", "--timeout", default=None, type=float,
+                        help="Specify global timeout for the whole process")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write output and results on stdout "
+                        "as JSON lines, for use by other programs")
+    add_selector_arguments(parser)
+    args = parser.parse_args(argv)
+    if not command:
+        parser.print_help()
+        return 1
+
+    # suppress info log messages from asyncssh
+    asyncssh_set_log_level(logging.WARNING)
+    selector = selected_selector(args)
+    message_bus = MessageBus()
+    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
+             for cmc_name in selector.cmc_names()]
+    remote_command = RemoteCommand(
+        nodes, " ".join(command), window=args.window,
+        timeout=args.timeout, json_output=args.json)
+    return 0 if remote_command.run() else 1
+
+####################
+
+
+@subcommand
+def push(*argv):
+    usage = """
+    Copy a local file on selected nodes, like in
+      rhubarbe push 1-4 bundle.tgz /root/
+    a destination that ends with / is a directory;
+    returns 0 if all nodes got the file
+    """
+    parser = ArgumentParser(usage=usage,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("-s", "--strategy", default='tree',
+                        choices=('tree', 'direct'),
+                        help="""with tree, nodes that have the file
+                        relay it to the other ones; with direct,
+                        the gateway uploads to all nodes""")
+    parser.add_argument("-f", "--fanout", default=4, type=int,
+                        help="how many uploads the gateway runs at a time")
+    parser.add_argument("-t", "--timeout", default=None, type=float,
+                        help="Specify global timeout for the whole process")
+    parser.add_argument("-j", "--json", action='store_true', default=False,
+                        help="Write results on stdout as JSON lines, "
+                        "for use by other programs")
+    add_selector_arguments(parser)
+    # after the node ranges
+    parser.add_argument("path", help="the local file to copy")
+    parser.add_argument("dest", help="where to copy it on the nodes")
+    args = parser.parse_args(argv)
+
+    # suppress info log messages from asyncssh
+    asyncssh_set_log_level(logging.WARNING)
+    selector = selected_selector(args)
+    if selector.is_empty():
+        parser.print_help()
+        return 1
+    message_bus = MessageBus()
+    nodes = [Node(cmc_name, message_bus)                # pylint: disable=w0621
+             for cmc_name in selector.cmc_names()]
+    pusher = Pusher(nodes, args.path, args.dest, strategy=args.strategy,
+                    fanout=args.fanout, json_output=args.json)
+    return 0 if pusher.run(timeout=args.timeout) else 1
 
 ####################
 
@@ -594,7 +859,7 @@ def leases(*argv):
                              "(create, update, delete)")
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
     leases = Leases(message_bus)
     if args.check:
         access = check_reservation(leases, verbose=True)
@@ -608,6 +873,26 @@ def leases(*argv):
 ####################
 
 
+def add_metrics_argument(parser, command):
+    parser.add_argument(
+        "--metrics-port", dest="metrics_port", type=int,
+        default=int(Config().value('metrics', command)),
+        help="expose metrics over http on that port; 0 means disabled")
+
+
+async def with_metrics(coroutine, metrics_port):
+    """
+    run coroutine, together with the metrics server if enabled
+    """
+    server = metrics_server(metrics_port)
+    if server is None:
+        return await coroutine
+    result, _ = await asyncio.gather(coroutine, server.run_forever())
+    return result
+
+####################
+
+
 @subcommand
 def monitornodes(*argv):                                # pylint: disable=r0914
 
@@ -627,7 +912,8 @@ def monitornodes(*argv):                                # pylint: disable=r0914
         '-c', "--cycle",
         default=config.value('monitor', 'cycle_nodes'),
         type=float,
-        help="Delay to wait between 2 probes of each node")
+        help="Delay to wait between 2 probes of each node, "
+        "right after it has changed state")
     parser.add_argument(
         "-u", "--sidecar-url", dest="sidecar_url",
         default=Config().value('sidecar', 'url'),
@@ -636,13 +922,21 @@ def monitornodes(*argv):                                # pylint: disable=r0914
         "-w", "--wlan", dest="report_wlan",
         default=False, action='store_true',
         help="ask for probing of wlan traffic rates")
+    parser.add_argument(
+        "-H", "--hot", dest="hot_ranges",
+        default=[], action='append',
+        help="""nodes to probe at high frequency,
+        e.g. nodes being loaded; can be used several times, like
+        --hot 1-4 --hot 12""")
+    add_metrics_argument(parser, 'monitornodes')
+    add_watchdog_argument(parser)
     parser.add_argument("-v", "--verbose",
                         action='store_true', default=False)
     add_selector_arguments(parser)
     args = parser.parse_args(argv)
 
     selector = selected_selector(args)
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
     # xxx having to feed a Display instance with nodes
     # at creation time is a nuisance
@@ -654,14 +948,20 @@ def monitornodes(*argv):                                # pylint: disable=r0914
                                 cycle=args.cycle,
                                 sidecar_url=args.sidecar_url,
                                 report_wlan=args.report_wlan,
+                                hot_ranges=args.hot_ranges,
                                 verbose=args.verbose)
 
+    sinks = [display.run()]
+    if args.metrics_port:
+        sinks.append(count_events(message_bus.subscribe('metrics')))
+
     async def async_main():
         # run both the core and the log loop in parallel
-        await asyncio.gather(monitornodes.run_forever(),
-                             display.run())
+        await asyncio.gather(monitornodes.run_forever(), *sinks)
 
-    MonitorLoop("monitornodes").run(async_main(), logger)
+    start_watchdog(args.watchdog)
+    MonitorLoop("monitornodes").run(
+        with_metrics(async_main(), args.metrics_port), logger)
     return 0
 
 ####################
@@ -693,13 +993,19 @@ def monitorphones(*argv):
         help="url for the sidecar server")
     parser.add_argument(
         "-v", "--verbose", action='store_true')
+    add_metrics_argument(parser, 'monitorphones')
+    add_watchdog_argument(parser)
     args = parser.parse_args(argv)
+    kwds = vars(args)
+    metrics_port = kwds.pop('metrics_port')
+    watchdog = kwds.pop('watchdog')
 
     logger.info("Using all phones")
-    monitorphones = MonitorPhones(**vars(args))
+    monitorphones = MonitorPhones(**kwds)
 
+    start_watchdog(watchdog)
     MonitorLoop("monitorphones").run(
-        monitorphones.run_forever(),
+        with_metrics(monitorphones.run_forever(), metrics_port),
         logger)
     return 0
 
@@ -728,16 +1034,19 @@ def monitorleases(*argv):
         help="url for the sidecar server")
     parser.add_argument(
         "-v", "--verbose", default=False, action='store_true')
+    add_metrics_argument(parser, 'monitorleases')
+    add_watchdog_argument(parser)
     args = parser.parse_args(argv)
 
-    message_bus = asyncio.Queue()
+    message_bus = MessageBus()
 
 
     monitorleases = MonitorLeases(
         message_bus, args.sidecar_url, args.verbose)
 
+    start_watchdog(args.watchdog)
     MonitorLoop("monitorleases").run(
-        monitorleases.run_forever(),
+        with_metrics(monitorleases.run_forever(), args.metrics_port),
         logger)
     return 0
 
@@ -755,14 +1064,110 @@ def accountsmanager(*argv):
                         help="Set cycle in seconds; 0 means run only once;"
                              " default from config file.",
                         default=None)
+    add_metrics_argument(parser, 'accountsmanager')
     args = parser.parse_args(argv)
 
+    # the accounts manager runs its own loop,
+    # so the server runs in a separate thread
+    server = metrics_server(args.metrics_port)
+    if server is not None:
+        server.start_in_thread()
     accounts_manager = AccountsManager()
     return accounts_manager.main(args.cycle)
 
 ####################
 
 
+@subcommand
+def simulator(*argv):                                   # pylint: disable=r0914
+
+    # xxx hacky - do a side effect in the logger module
+    import rhubarbe.logger
+    rhubarbe.logger.logger = rhubarbe.logger.monitor_logger
+    from rhubarbe.logger import logger
+    from rhubarbe.simulator.testbed import SimulatedTestbed
+
+    usage = """
+    Run a simulated testbed on localhost, with fake CMCs, and fake nodes
+    that answer telnet (frisbee) and optionnally ssh;
+    once started, run regular rhubarbe commands from the working directory,
+    where a rhubarbe.conf overlay points at the simulated testbed
+    """
+    parser = ArgumentParser(usage=usage,
+                            formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "-n", "--nodes", dest="nb_nodes", default=37, type=int,
+        help="number of simulated nodes")
+    parser.add_argument(
+        "-d", "--dir", dest="workdir", default=".",
+        help="where to create the inventory, config overlay and the like")
+    parser.add_argument(
+        "-g", "--generate-only", dest="generate_only",
+        default=False, action='store_true',
+        help="only create the files in the working directory, and exit")
+    parser.add_argument(
+        "--on", dest="start_on", default=False, action='store_true',
+        help="nodes are initially on")
+    parser.add_argument(
+        "--ssh", dest="with_ssh", default=False, action='store_true',
+        help="nodes in their regular OS run an ssh server")
+    parser.add_argument(
+        "--sidecar", dest="with_sidecar", default=False, action='store_true',
+        help="run a stand-in sidecar server that counts what it receives")
+    parser.add_argument(
+        "--plcapi", dest="with_plcapi", default=False, action='store_true',
+        help="run a stand-in PLCAPI server over an in-memory dataset")
+    parser.add_argument(
+        "--plcapi-size", dest="plcapi_size", default=100, type=int,
+        help="number of slices, persons and leases in the PLCAPI dataset")
+    parser.add_argument(
+        "--plcapi-latency", dest="plcapi_latency", default=0., type=float,
+        help="average delay for the PLCAPI server to answer, in seconds")
+    parser.add_argument(
+        "--latency", dest="cmc_latency", default=0., type=float,
+        help="average delay for the CMC cards to answer, in seconds")
+    parser.add_argument(
+        "--failure-rate", dest="cmc_failure_rate", default=0., type=float,
+        help="ratio of CMC requests that fail")
+    parser.add_argument(
+        "--boot-delay", dest="boot_delay", default=5., type=float,
+        help="average time for a node to boot")
+    parser.add_argument(
+        "--frisbee-duration", dest="frisbee_duration", default=10., type=float,
+        help="average time for frisbee (or imagezip) to complete")
+    parser.add_argument(
+        "--frisbee-failure-rate", dest="frisbee_failure_rate",
+        default=0., type=float,
+        help="ratio of frisbee (or imagezip) sessions that fail")
+    parser.add_argument(
+        "--link-bandwidth", dest="link_bandwidth", default=0., type=float,
+        help="""uplink of the gateway and of each node in MiB/s,
+        for what is sent over ssh; 0 means unlimited""")
+    parser.add_argument("--cmc-port", dest="cmc_port", default=8080, type=int)
+    parser.add_argument("--telnet-port", dest="telnet_port",
+                        default=2323, type=int)
+    parser.add_argument("--ssh-port", dest="ssh_port", default=2222, type=int)
+    parser.add_argument("--sidecar-port", dest="sidecar_port",
+                        default=10999, type=int)
+    parser.add_argument("--plcapi-port", dest="plcapi_port",
+                        default=10080, type=int)
+    args = parser.parse_args(argv)
+
+    kwds = vars(args)
+    generate_only = kwds.pop('generate_only')
+    testbed = SimulatedTestbed(kwds.pop('nb_nodes'), kwds.pop('workdir'),
+                               **kwds)
+    testbed.generate()
+    print(f"simulated testbed config in {testbed.workdir}/rhubarbe.conf")
+    if generate_only:
+        return 0
+
+    MonitorLoop("simulator").run(testbed.run_forever(), logger)
+    return 0
+
+####################
+
+
 @subcommand
 def inventory(*argv):
     usage = """
@@ -0,0 +1,287 @@
+"""
+A minimal metrics registry, exposed over http in the Prometheus text format
+
+The monitor daemons record counters, gauges and histograms in the
+Metrics() singleton; this is cheap enough to be always on.
+The http endpoint is optional, see the [metrics] section in the config,
+or the --metrics-port option of the monitor commands.
+
+    from rhubarbe.metrics import Metrics
+    probes = Metrics().histogram('rhubarbe_probe_seconds',
+                                 "probe duration per stage")
+    probes.observe(0.12, stage='ssh')
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# pylint: disable=c0111, w0703, w1202
+
+import time
+import asyncio
+import threading
+
+from aiohttp import web
+
+from rhubarbe.singleton import Singleton
+from rhubarbe.config import Config
+from rhubarbe.logger import monitor_logger as logger
+
+# in seconds, suitable for network calls
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    inside = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + inside + "}"
+
+
+def _number_text(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        # sorted tuple of (label, value) -> whatever the metric stores
+        self.values = {}
+
+    @staticmethod
+    def key(labels):
+        return tuple(sorted((key, str(value))
+                            for key, value in labels.items()))
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}",
+                f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self):
+        """
+        yields tuples name, labels, value
+        """
+        for labels, value in list(self.values.items()):
+            yield self.name, labels, value
+
+    def render(self):
+        lines = self.header()
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_labels_text(labels)} {_number_text(value)}")
+        return lines
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[self.key(labels)] = value
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # counts per bucket (not cumulative), sum
+        if key not in self.values:
+            self.values[key] = [[0] * len(self.buckets), 0.]
+        counts, _ = stored = self.values[key]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        stored[1] += value
+
+    def time(self, **labels):
+        """
+        a context manager that observes the time spent inside
+        """
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       labels + (('le', _number_text(bound)),), cumulative)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+
+class Metrics(metaclass=Singleton):
+    """
+    the registry; asking twice for the same name returns the same metric
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        # callables that get invoked right before rendering,
+        # typically to update gauges from existing counters
+        self.collectors = []
+
+    def _get(self, cls, name, help_text, **kwds):
+        if name not in self.metrics:
+            self.metrics[name] = cls(name, help_text, **kwds)
+        return self.metrics[name]
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("metrics collector failed")
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+def observe_cycle(daemon, duration, cycle=None):
+    """
+    for the daemons that work in cycles, record how long the last one took,
+    and how much it exceeded the expected cycle duration
+    """
+    metrics = Metrics()
+    metrics.gauge('rhubarbe_cycle_duration_seconds',
+                  "how long the last cycle took").set(duration, daemon=daemon)
+    if cycle:
+        metrics.gauge('rhubarbe_cycle_overrun_seconds',
+                      "how much the last cycle exceeded its period").set(
+                          max(0., duration - cycle), daemon=daemon)
+
+
+async def measure_loop_lag(period=1.):
+    """
+    a coroutine that measures the event loop lag, i.e. how late
+    a sleep() wakes up; this is a sign of the loop being blocked
+    """
+    lag = Metrics().gauge(
+        'rhubarbe_event_loop_lag_seconds',
+        "how late the event loop wakes up a task that sleeps")
+    lags = Metrics().histogram(
+        'rhubarbe_event_loop_lag_histogram_seconds',
+        "distribution of the event loop lag",
+        buckets=(.001, .005, .01, .05, .1, .5, 1, 5))
+    while True:
+        before = time.monotonic()
+        await asyncio.sleep(period)
+        late = max(0., time.monotonic() - before - period)
+        lag.set(late)
+        lags.observe(late)
+
+
+async def count_events(cursor):
+    """
+    a message bus sink that counts events per type
+    """
+    events = Metrics().counter(
+        'rhubarbe_bus_events_total',
+        "events seen on the message bus, per type")
+    while True:
+        event = await cursor.get()
+        if event == 'END-DISPLAY':
+            return
+        events.inc(type=type(event).__name__)
+
+
+class MetricsServer:
+    """
+    serves GET /metrics on address:port
+    """
+
+    def __init__(self, port, address='127.0.0.1'):
+        self.port = port
+        self.address = address
+        self.runner = None
+
+    async def handle(self, _request):
+        return web.Response(text=Metrics().render(),
+                            content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.address, self.port)
+        await site.start()
+
+    async def run_forever(self):
+        """
+        serve, and measure the loop lag meanwhile
+        """
+        await self.start()
+        await measure_loop_lag()
+
+    def start_in_thread(self):
+        """
+        for synchronous code: serve from a separate thread
+        """
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            loop.run_forever()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+def metrics_server(port):
+    """
+    returns a MetricsServer on that port,
+    or None if the endpoint is disabled
+    """
+    if not port:
+        return None
+    return MetricsServer(port, Config().value('metrics', 'address'))
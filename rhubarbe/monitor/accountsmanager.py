@@ -25,12 +25,19 @@ think of it as a dedicated nodemanager
 import time
 import os
 import pwd
+import json
+import hashlib
+import asyncio
+import tempfile
+import subprocess
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from rhubarbe.logger import accounts_logger as logger
 from rhubarbe.config import Config
 from rhubarbe.plcapiproxy import PlcApiProxy
+from rhubarbe.metrics import observe_cycle
 
 
 ####################
@@ -43,8 +50,11 @@ def replace_file_with_string(destination_path, new_contents,
     Replace a file with new contents
     checks for changes
       does not do anything if previous state was already right
-    can handle chmod/chown if requested
+    can handle chmod/chown if requested, owner being a login name,
+    that also is the name of its group
     can also remove resulting file if contents are void, if requested
+    the file is written atomically, i.e. through a temporary file
+    that gets renamed
 
     returns
       * True if a change occurred, or the file is deleted
@@ -70,33 +80,85 @@ def replace_file_with_string(destination_path, new_contents,
         # we're done and have nothing to do
         return False
     # overwrite file: create a temp in the same directory
+    temporary = None
     try:
-        with destination_path.open('w') as new:
+        fd, temporary = tempfile.mkstemp(dir=str(destination_path.parent),
+                                         prefix=".rhubarbe-")
+        with os.fdopen(fd, 'w') as new:
             new.write(new_contents)
-        if chmod:
-            destination_path.chmod(chmod)
-        if owner:
-            os.system("chown {} {}".format(owner, destination_path))
+            # mkstemp creates the file 0600
+            if chmod:
+                os.fchmod(new.fileno(), chmod)
+            if owner:
+                record = pwd.getpwnam(owner)
+                os.fchown(new.fileno(), record.pw_uid, record.pw_gid)
+        os.replace(temporary, str(destination_path))
         return True
-    except IOError as exc:
+    except (IOError, KeyError):
         logger.error("Cannot create {}".format(destination_path))
+        if temporary and os.path.exists(temporary):
+            os.unlink(temporary)
         return None
 
 ####################
+# the .ssh/config file that keeps ssh from
+# being too picky with host keys and similar
+
+# define the magic sequence for both fit* and data*
+SSH_CONFIG_BASES = ['fit', 'data']
+SSH_CONFIG_PATTERN = """Host {base}*
+StrictHostKeyChecking no
+UserKnownHostsFile=/dev/null
+CheckHostIP=no
+"""
+SSH_CONFIG = "\n".join(
+    [SSH_CONFIG_PATTERN.format(base=base) for base in SSH_CONFIG_BASES])
+
+
+def contents_hash(contents):
+    return hashlib.sha1(contents.encode()).hexdigest()
 
 
-class AccountsManager:
+####################
+
+
+class AccountsManager:                                  # pylint: disable=r0902
 
     def __init__(self):
         the_config = Config()
         self.plcapiurl = the_config.value('plcapi', 'url')
         self.email = the_config.value('plcapi', 'admin_email')
         self.password = the_config.value('plcapi', 'admin_password')
-
+        # how many threads to use for PLCAPI calls and for
+        # the filesystem changes
+        self.workers = int(the_config.value('accounts', 'workers'))
+
+        # the state that was last applied, as a dict
+        # slicename -> [authorized_keys hash, ssh config hash]
+        # slices whose expected state matches the snapshot are left alone,
+        # except during a full audit, that checks everything on disk
+        # None means the state on disk is unknown, e.g. after a failure,
+        # so that slice gets dealt with again at the next cycle
+        self.snapshot = {}
+        self.last_audit = None
+        self.audit_period = float(the_config.value('accounts',
+                                                   'audit_period'))
+        self.snapshot_path = the_config.value('accounts', 'snapshot')
+        self.load_snapshot()
+
+        self._executor = None
         self._proxy = None
 
-    # not reconnectable for now
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="accounts")
+        return self._executor
+
     def proxy(self):
+        # can be shared between threads, as
+        # each concurrent call gets its own connection
         if self._proxy is None:
             # also set debug=True if needed
             self._proxy = PlcApiProxy(self.plcapiurl,
@@ -104,6 +166,53 @@ class AccountsManager:
                                       password=self.password)
         return self._proxy
 
+    async def in_thread(self, function, *args):
+        """
+        run a blocking function in the thread pool
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor(), function, *args)
+
+    async def plcapi(self, method, *args):
+        """
+        one PLCAPI call, made in the thread pool
+        """
+        return await self.in_thread(
+            lambda: getattr(self.proxy(), method)(*args))
+
+    def load_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            with open(self.snapshot_path) as feed:
+                stored = json.load(feed)
+            self.snapshot = stored['slices']
+            self.last_audit = stored['audit']
+            logger.info("loaded snapshot of {} accounts from {}"
+                        .format(len(self.snapshot), self.snapshot_path))
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("could not load snapshot from {} - ignored"
+                             .format(self.snapshot_path))
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            temporary = "{}.tmp".format(self.snapshot_path)
+            with open(temporary, 'w') as output:
+                json.dump({'audit': self.last_audit,
+                           'slices': self.snapshot}, output)
+            os.replace(temporary, self.snapshot_path)
+        except Exception:
+            logger.exception("could not save snapshot in {}"
+                             .format(self.snapshot_path))
+
+    def audit_due(self):
+        return (self.last_audit is None
+                or time.time() - self.last_audit >= self.audit_period)
+
     @staticmethod
     def slices_from_passwd():
         """
@@ -142,53 +251,63 @@ class AccountsManager:
         NOTE that this addresses ubuntu for now, fedora 'useradd'
         being slightly different as far as I remember
         (at least wrt homedir creation, IIRC again)
+
+        returns True if the account is usable
+        """
+        command = ["useradd", "--create-home", "--user-group",
+                   slicename, "--shell", "/bin/bash"]
+        logger.info("Running {}".format(" ".join(command)))
+        retcod = subprocess.call(command)
+        if retcod != 0:
+            logger.error("{} -> {}".format(" ".join(command), retcod))
+            return False
+        try:
+            record = pwd.getpwnam(slicename)
+            # useradd has already given the homedir to the user
+            ssh_dir = Path(record.pw_dir) / ".ssh"
+            ssh_dir.mkdir(mode=0o700, exist_ok=True)
+            # mkdir's mode is subject to umask
+            ssh_dir.chmod(0o700)
+            os.chown(str(ssh_dir), record.pw_uid, record.pw_gid)
+            return True
+        except (OSError, KeyError):
+            logger.exception("Could not set up .ssh for {}"
+                             .format(slicename))
+            return False
+
+    @classmethod
+    def create_accounts(cls, slicenames):
+        """
+        create a batch of accounts in one go; useradd locks /etc/passwd
+        so there is no point in doing this concurrently
         """
-        commands = [
-            "useradd --create-home --user-group {x} --shell /bin/bash",
-            "mkdir /home/{x}/.ssh",
-            "chmod 700 /home/{x}/.ssh",
-            "chown -R {x}:{x} /home/{x}",
-        ]
-        for cmd in commands:
-            command = cmd.format(x=slicename)
-            logger.info("Running {}".format(command))
-            retcod = os.system(command)
-            if retcod != 0:
-                logger.error("{} -> {}".format(command, retcod))
+        for slicename in slicenames:
+            try:
+                cls.create_account(slicename)
+            except Exception:
+                logger.exception("Could not create account {}"
+                                 .format(slicename))
 
     @staticmethod
     def create_ssh_config(slicename):
         """
-        Initialize slice's .ssh/config that keeps ssh from
-        being too picky with host keys and similar
+        Initialize slice's .ssh/config, see SSH_CONFIG
 
         Performed only if not yet existing
         """
         ssh_config_file = Path("/home") / slicename / ".ssh/config"
-
-        # define the magic sequence for both fit* and data*
-        config_bases = ['fit', 'data']
-        #
-        config_pattern = """Host {base}*
-StrictHostKeyChecking no
-UserKnownHostsFile=/dev/null
-CheckHostIP=no
-"""
-
-        ssh_config = "\n".join(
-            [config_pattern.format(base=base) for base in config_bases])
-        replace_file_with_string(ssh_config_file,
-                                 ssh_config,
-                                 chmod=0o600,
-                                 owner="{x}:{x}".format(x=slicename))
+        return replace_file_with_string(ssh_config_file,
+                                        SSH_CONFIG,
+                                        chmod=0o600,
+                                        owner=slicename)
 
     @staticmethod
     def apply_keys(slicename, keys_string):
         auth_path = Path("/home") / slicename / ".ssh/authorized_keys"
-        replace_file_with_string(auth_path,
+        return replace_file_with_string(auth_path,
                                  keys_string,
                                  chmod=0o600,
-                                 owner="{x}:{x}".format(x=slicename),
+                                 owner=slicename,
                                  remove_if_empty=True)
 
     ##########
@@ -208,25 +327,58 @@ CheckHostIP=no
         return "".join(key_lines)
 
     ##########
-    def manage_accounts(self, policy):             # pylint: disable=r0914
-
-        # get plcapi specification of what should be
-        slices = self.proxy().GetSlices(
-            {}, ['slice_id', 'name', 'expires', 'person_ids'])
-        persons = self.proxy().GetPersons(
-            {}, ['person_id', 'email', 'slice_ids', 'key_ids'])
-        keys = self.proxy().GetKeys()
+    async def fetch_specification(self, policy):
+        """
+        get plcapi specification of what should be,
+        with all the calls issued concurrently
 
-        current_leases = []
+        returns a tuple slices, persons, keys, current_leases
+        """
+        async def no_leases():
+            return []
         if policy == 'leased':
-            now = int(time.time())
-            current_leases = self.proxy().GetLeases(
-                {'alive': now}, ['name'])
-
-        if (current_leases is None or slices is None
-                or persons is None or keys is None):
-            logger.info("PLCAPI unreachable - back to sleep")
+            leases = self.plcapi('GetLeases',
+                                 {'alive': int(time.time())}, ['name'])
+        else:
+            leases = no_leases()
+        return await asyncio.gather(
+            self.plcapi('GetSlices',
+                        {}, ['slice_id', 'name', 'expires', 'person_ids']),
+            self.plcapi('GetPersons',
+                        {}, ['person_id', 'email', 'slice_ids', 'key_ids']),
+            self.plcapi('GetKeys'),
+            leases)
+
+    def manage_account(self, slicename, keys, expected):
+        """
+        write the account's files, and record expected
+        in the snapshot if that went fine; otherwise the slice
+        remains in the snapshot, as unknown, so that the next cycle
+        deals with it again, and revokes its keys if it has expired
+        """
+        try:
+            # None means the file could not be written
+            if (self.create_ssh_config(slicename) is not None
+                    and self.apply_keys(slicename, keys) is not None):
+                self.snapshot[slicename] = expected
+            else:
+                self.snapshot[slicename] = None
+        except Exception:
+            self.snapshot[slicename] = None
+            logger.exception("Could not deal with slice {}"
+                             .format(slicename))
+
+    async def manage_accounts(self, policy):       # pylint: disable=r0914
+
+        beg = time.time()
+        try:
+            slices, persons, keys, current_leases = \
+                await self.fetch_specification(policy)
+        except Exception as exc:
+            logger.info("PLCAPI unreachable ({}) - back to sleep"
+                        .format(exc))
             return
+        fetched = time.time()
 
         # prepare data
         persons_by_id = {p['person_id']: p for p in persons}
@@ -234,8 +386,16 @@ CheckHostIP=no
         # current_slicenames will contain 0 or 1 item
         current_slicenames = [lease['name'] for lease in current_leases]
 
-        # initialize with the slice names that are in /etc/passwd
-        logins = self.slices_from_passwd()
+        # a full audit inspects /etc/passwd and all the files on disk
+        # otherwise we only touch the slices whose inputs have changed
+        audit = self.audit_due()
+        if audit:
+            logger.info("full audit of accounts")
+            # initialize with the slice names that are in /etc/passwd
+            logins = self.slices_from_passwd()
+            self.snapshot = {}
+        else:
+            logins = list(self.snapshot)
 
         # initialize map login_name -> authorized_keys contents
         # this is where we handle the fact that obsolete slices
@@ -261,33 +421,59 @@ CheckHostIP=no
 
             auths_by_login[slicename] = authorized_keys
 
-        # implement it
-        for slicename, keys in auths_by_login.items():
-            try:
-                if slicename not in logins:
-                    self.create_account(slicename)
-                # do this always, allows to propagate later changes
-                self.create_ssh_config(slicename)
-                self.apply_keys(slicename, keys)
-            except Exception:
-                logger.exception("Could not deal with slice {}"
-                                 .format(slicename))
+        # only keep the ones that need to be dealt with
+        config_hash = contents_hash(SSH_CONFIG)
+        expected_by_login = {
+            slicename: [contents_hash(keys), config_hash]
+            for slicename, keys in auths_by_login.items()}
+        changed = {
+            slicename: keys for slicename, keys in auths_by_login.items()
+            if self.snapshot.get(slicename) != expected_by_login[slicename]}
 
-    def run_forever(self, cycle, policy):
+        # implement it
+        # useradd locks /etc/passwd, so new accounts get created
+        # sequentially; files can then be dealt with concurrently
+        new_slicenames = [slicename for slicename in changed
+                          if slicename not in logins
+                          or self.snapshot.get(slicename) is None]
+        # in incremental mode, logins come from the snapshot,
+        # so we need to check that these indeed are new
+        if new_slicenames and not audit:
+            existing = set(self.slices_from_passwd())
+            new_slicenames = [slicename for slicename in new_slicenames
+                              if slicename not in existing]
+        if new_slicenames:
+            await self.in_thread(self.create_accounts, new_slicenames)
+        await asyncio.gather(*(
+            self.in_thread(self.manage_account, slicename, keys,
+                           expected_by_login[slicename])
+            for slicename, keys in changed.items()))
+        if audit:
+            self.last_audit = time.time()
+        if changed or audit:
+            self.save_snapshot()
+        now = time.time()
+        logger.info("{}/{} accounts managed in {:.2f}s "
+                    "(fetch {:.2f}s, apply {:.2f}s)"
+                    .format(len(changed), len(auths_by_login), now - beg,
+                            fetched - beg, now - fetched))
+
+    async def run_forever(self, cycle, policy):
         while True:
             beg = time.time()
             logger.info("---------- rhubarbe accounts manager "
                         "policy = {}, cycle {}s"
                         .format(policy, cycle))
-            self.manage_accounts(policy)
+            await self.manage_accounts(policy)
             now = time.time()
             duration = now - beg
+            observe_cycle('accountsmanager', duration, cycle)
             towait = cycle - duration
             if towait > 0:
                 logger.info("---------- rhubarbe accounts manager - "
                             "sleeping for {:.2f}s"
                             .format(towait))
-                time.sleep(towait)
+                await asyncio.sleep(towait)
             else:
                 logger.info("duration {}s exceeded cycle {}s - "
                             "skipping sleep"
@@ -310,11 +496,91 @@ CheckHostIP=no
             logger.error("Unknown policy {} - using 'closed'"
                          .format(policy))
             policy = 'closed'
+        loop = asyncio.get_event_loop()
         # trick is
         if cycle != 0:
-            self.run_forever(cycle, policy)
+            loop.run_until_complete(self.run_forever(cycle, policy))
         else:
             logger.info("---------- rhubarbe accounts manager oneshot "
                         "policy = {}"
                         .format(policy))
-            self.manage_accounts(policy)
+            loop.run_until_complete(self.manage_accounts(policy))
+
+
+####################
+# test
+if __name__ == '__main__':
+
+    def test_failure_then_expiry():
+        """
+        a slice whose files could not be written, and that has expired
+        by the next - incremental - cycle, gets its keys revoked
+        """
+        # slicename -> contents of authorized_keys
+        files = {}
+        failing = set()
+
+        class SandboxedAccountsManager(AccountsManager):
+
+            def __init__(self):                 # pylint: disable=w0231
+                # no config and no PLCAPI needed
+                self.workers = 4
+                self.snapshot = {}
+                self.last_audit = None
+                self.audit_period = 1e6
+                self.snapshot_path = None
+                self._executor = None
+                self._proxy = None
+
+            @staticmethod
+            def slices_from_passwd():
+                return list(files)
+
+            @staticmethod
+            def create_account(slicename):
+                files.setdefault(slicename, "")
+                return True
+
+            @staticmethod
+            def create_ssh_config(slicename):
+                return True
+
+            @staticmethod
+            def apply_keys(slicename, keys_string):
+                if slicename in failing:
+                    return None
+                files[slicename] = keys_string
+                return True
+
+        plc_slice = {'slice_id': 1, 'name': 'inria_test',
+                     'expires': 0, 'person_ids': [1]}
+        person = {'person_id': 1, 'email': 'test@example.org',
+                  'slice_ids': [1], 'key_ids': [1]}
+        keys = [{'key_id': 1, 'key': 'ssh-ed25519 first'}]
+        specification = [[plc_slice], [person], keys, []]
+
+        async def fetch_specification(policy):   # pylint: disable=w0613
+            return specification
+
+        manager = SandboxedAccountsManager()
+        manager.fetch_specification = fetch_specification
+        loop = asyncio.get_event_loop()
+
+        # first cycle is a full audit, that goes fine
+        loop.run_until_complete(manager.manage_accounts('open'))
+        assert files == {'inria_test': "ssh-ed25519 first\n"}
+        # a key is added, but the file can't be written
+        keys.append({'key_id': 2, 'key': 'ssh-ed25519 second'})
+        person['key_ids'].append(2)
+        failing.add('inria_test')
+        loop.run_until_complete(manager.manage_accounts('open'))
+        assert manager.snapshot['inria_test'] is None
+        # the slice expires before the next, incremental, cycle
+        failing.clear()
+        specification[:] = [[], [], [], []]
+        assert not manager.audit_due()
+        loop.run_until_complete(manager.manage_accounts('open'))
+        assert files == {'inria_test': ""}, files
+        print("test_failure_then_expiry OK")
+
+    test_failure_then_expiry()
@@ -6,6 +6,7 @@ import asyncio
 from rhubarbe.logger import monitor_logger as logger
 from rhubarbe.config import Config
 from rhubarbe.leases import Leases
+from rhubarbe.metrics import observe_cycle
 
 from rhubarbe.monitor.reconnectable import ReconnectableSidecar
 
@@ -45,7 +46,9 @@ class MonitorLeases:                                    # pylint: disable=r0902
             try:
                 if self.verbose:
                     logger.info("monitorleases mainloop")
+                beg = time.monotonic()
                 await leases.refresh()
+                observe_cycle('monitorleases', time.monotonic() - beg)
                 # xxx this is fragile
                 omf_leases = leases.resources
                 logger.info("advertising {} leases".format(len(omf_leases)))
@@ -10,7 +10,6 @@ and reports it to the sidecar service
 # pylint: disable=c0111, w0703, w1202
 
 import time
-import re
 import asyncio
 
 from rhubarbe.config import Config
@@ -21,6 +20,8 @@ from rhubarbe.logger import monitor_logger as logger
 
 # connect to sidecar
 from rhubarbe.monitor.reconnectable import ReconnectableSidecar
+from rhubarbe.monitor.scheduler import (ProbeScheduler, Unlimited, limiter,
+                                        PROBE_SECONDS)
 
 # translate info into a single char for logging
 def one_char_summary(info):
@@ -47,16 +48,38 @@ class MonitorNode:
     """
 
     def __init__(self, node, reconnectable,             # pylint: disable=r0913
-                 report_wlan=False, verbose=False):
+                 report_wlan=False, full_report_period=60,
+                 ssh_limiter=None, ping_limiter=None,
+                 extra_probes=None, verbose=False):
         # a rhubarbe.node.Node instance
         self.node = node
         self.report_wlan = report_wlan
+        # name -> shell command, see the [probes] config section
+        self.extra_probes = extra_probes or {}
+        # computed once, it does not change over time
+        self.command = self.probe_command()
         self.reconnectable = reconnectable
+        self.full_report_period = full_report_period
+        # shared among all nodes, to limit simultaneous ssh connects and pings
+        self.ssh_limiter = ssh_limiter or Unlimited()
+        self.ping_limiter = ping_limiter or Unlimited()
         self.verbose = verbose
         # current info - will be reported to sidecar
         self.info = {'id': node.id}
+        # what the sidecar has been told so far - we only send changes
+        self.reported = {}
+        self.reported_time = 0
+        self.reported_connections = None
         # remember previous wlan measurement to compute rate
         self.history = {}
+        # managed by the ProbeScheduler
+        self.scheduled_summary = None
+        self.scheduled_delay = 0
+        self.scheduled_due = None
+        self.probing = False
+
+    def summary(self):
+        return one_char_summary(self.info)
 
     def set_info(self, *overrides):
         """
@@ -76,8 +99,32 @@ class MonitorNode:
     async def report_info(self):
         """
         Send info to sidecar
+
+        only the keys that have changed since the previous report are sent;
+        the whole info gets sent every full_report_period seconds,
+        and after the sidecar connection has been re-established
         """
-        await self.reconnectable.emit_info(self.info)
+        now = time.time()
+        connections = self.reconnectable.connections
+        full = (connections != self.reported_connections
+                or now - self.reported_time >= self.full_report_period)
+        if full:
+            delta = dict(self.info)
+        else:
+            delta = {key: value for key, value in self.info.items()
+                     if key not in self.reported
+                     or self.reported[key] != value}
+            if not delta:
+                return
+            delta['id'] = self.node.id
+        if not await self.reconnectable.emit_info(delta):
+            return
+        if full:
+            self.reported = delta
+            self.reported_time = now
+            self.reported_connections = connections
+        else:
+            self.reported.update(delta)
 
     async def set_info_and_report(self, *overrides):
         """
@@ -86,66 +133,67 @@ class MonitorNode:
         self.set_info(*overrides)
         await self.report_info()
 
-    ubuntu_matcher = re.compile(r"DISTRIB_RELEASE=(?P<ubuntu_version>[0-9.]+)")
-    fedora_matcher = re.compile(r"Fedora release (?P<fedora_version>\d+)")
-    centos_matcher = re.compile(r"CentOS Linux release (?P<centos_version>\d+)")
-    gnuradio_matcher = re.compile(
-        r"\AGNURADIO:(?P<gnuradio_version>[0-9\.]+)\Z")
-    uname_matcher = re.compile(r"\AUNAME:(?P<uname>.+)\Z")
-    # 2016-05-28@08:20 - node fit38 - image oai-enb-base2 - by root
-    rhubarbe_image_matcher = re.compile(
-        r"\A/etc/rhubarbe-image:.* - image (?P<image_radical>[^ ]+) - by")
-    rxtx_matcher = re.compile(
-        r"==> /sys/class/net/wlan(?P<wlan_no>[0-9])/"
-        r"statistics/(?P<rxtx>[rt]x)_bytes <==")
-    number_matcher = re.compile(r"\A[0-9]+\Z")
+    # the remote side of the ssh probe
+    # each snippet outputs one or several lines of the form key=value
+    # so that the output can be parsed in a single pass
+    probe_snippets = [
+        # e.g. ubuntu-18.04 or fedora-29 or centos-7
+        "os_release=other; "
+        "v=$(sed -n 's/^DISTRIB_RELEASE=\\([0-9.]*\\).*/ubuntu-\\1/p' "
+        "/etc/lsb-release 2> /dev/null); [ -n \"$v\" ] && os_release=$v; "
+        "v=$(sed -n "
+        "-e 's/^Fedora release \\([0-9]*\\).*/fedora-\\1/p' "
+        "-e 's/^CentOS Linux release \\([0-9]*\\).*/centos-\\1/p' "
+        "/etc/redhat-release 2> /dev/null); [ -n \"$v\" ] && os_release=$v; "
+        "echo os_release=$os_release",
+        "echo gnuradio_release=$(gnuradio-config-info --version "
+        "2> /dev/null || echo none)",
+        # 2016-05-28@08:20 - node fit38 - image oai-enb-base2 - by root
+        "echo image_radical=$(sed -n "
+        "'s/.* - image \\([^ ]*\\) - by.*/\\1/p' "
+        "/etc/rhubarbe-image 2> /dev/null | tail -1)",
+        "echo uname=$(uname -r)",
+    ]
+    # e.g. wlan0_rx_bytes=12345
+    wlan_probe_snippet = (
+        "for dev in /sys/class/net/wlan?; do [ -d $dev ] || continue; "
+        "for rxtx in rx tx; do "
+        "echo ${dev##*/}_${rxtx}_bytes=$(cat $dev/statistics/${rxtx}_bytes); "
+        "done; done")
+
+    @staticmethod
+    def extra_probe_snippet(name, command):
+        """
+        the snippet for a probe defined in the [probes] config section
+        """
+        return f"echo {name}=$( ({command}) 2> /dev/null | head -1)"
+
+    def probe_command(self):
+        snippets = list(self.probe_snippets)
+        if self.report_wlan:
+            snippets.append(self.wlan_probe_snippet)
+        snippets += [self.extra_probe_snippet(name, command)
+                     for name, command in self.extra_probes.items()]
+        return "; ".join(snippets)
 
     def parse_ssh_probe_output(self,      # pylint: disable=r0912, r0914, r0915
                                stdout, padding_dict):
-        os_release = "other"
-        gnuradio_release = "none"
-        uname = ""
-        rxtx_dict = {}
-        rxtx_key = None
-        image_radical = ""
+        facts = {}
         for line in stdout.split("\n"):
-            match = self.ubuntu_matcher.match(line)
-            if match:
-                version = match.group('ubuntu_version')
-                os_release = f"ubuntu-{version}"
-                continue
-            match = self.fedora_matcher.match(line)
-            if match:
-                version = match.group('fedora_version')
-                os_release = f"fedora-{version}"
-                continue
-            match = self.centos_matcher.match(line)
-            if match:
-                version = match.group('centos_version')
-                os_release = f"centos-{version}"
-                continue
-            match = self.gnuradio_matcher.match(line)
-            if match:
-                gnuradio_release = match.group('gnuradio_version')
-                continue
-            match = self.uname_matcher.match(line)
-            if match:
-                uname = match.group('uname')
-                continue
-            match = self.rhubarbe_image_matcher.match(line)
-            if match:
-                image_radical = match.group('image_radical')
-                continue
-            match = self.rxtx_matcher.match(line)
-            if match:
-                # use a tuple as the hash
-                rxtx_key = (match.group('wlan_no'), match.group('rxtx'))
-                continue
-            match = self.number_matcher.match(line)
-            if match and rxtx_key:
-                rxtx_dict[rxtx_key] = int(line)
-                continue
-            rxtx_key = None
+            key, sep, value = line.partition("=")
+            if sep:
+                facts[key] = value.strip()
+
+        rxtx_dict = {}
+        for key, value in facts.items():
+            # e.g. wlan0_rx_bytes
+            if key.startswith('wlan') and key.endswith('_bytes'):
+                try:
+                    wlan_no, rxtx, _ = key[4:].split('_')
+                    # use a tuple as the hash
+                    rxtx_dict[(wlan_no, rxtx)] = int(value)
+                except ValueError:
+                    pass
 
         # now that we have the counters we need to translate this into rate
         # for that purpose we use local clock;
@@ -178,11 +226,14 @@ class MonitorNode:
             self.history[rxtx_key] = (bytes, now)
         # xxx would make sense to clean up history for measurements that
         # we were not able to collect at this cycle
-        self.set_info({'os_release': os_release,
-                       'gnuradio_release': gnuradio_release,
-                       'uname': uname,
-                       'image_radical': image_radical},
-                      padding_dict, wlan_info_dict)
+        extra_dict = {name: facts.get(name, "")
+                      for name in self.extra_probes}
+        self.set_info({'os_release': facts.get('os_release', "other"),
+                       'gnuradio_release': facts.get('gnuradio_release',
+                                                     "none"),
+                       'uname': facts.get('uname', ""),
+                       'image_radical': facts.get('image_radical', "")},
+                      padding_dict, wlan_info_dict, extra_dict)
 
     async def probe(self,                 # pylint: disable=r0912, r0914, r0915
                     ping_timeout, ssh_timeout):
@@ -199,11 +250,13 @@ class MonitorNode:
         }
         # get USRP status no matter what - use "" if we receive None
         # to limit noise when the node is physically removed
-        usrp_status = await self.node.get_usrpstatus() or 'fail'
+        with PROBE_SECONDS.time(stage='usrpstatus'):
+            usrp_status = await self.node.get_usrpstatus() or 'fail'
         # replace usrpon and usrpoff with just on and off
         self.set_info({'usrp_on_off': usrp_status.replace('usrp', '')})
         # get CMC status
-        status = await self.node.get_status()
+        with PROBE_SECONDS.time(stage='cmc'):
+            status = await self.node.get_status()
         if status == "off":
             await self.set_info_and_report({'cmc_on_off': 'off'}, padding_dict)
             return
@@ -219,37 +272,28 @@ class MonitorNode:
             'control_ssh': 'on',
         }
         self.zero_wlan_infos()
-        remote_commands = [
-            "cat /etc/lsb-release /etc/redhat-release /etc/gnuradio-release "
-            "2> /dev/null | grep -i release",
-            "echo -n GNURADIO: ; gnuradio-config-info --version "
-            "2> /dev/null || echo none",
-            # this trick allows to have the filename on each output line
-            "grep . /etc/rhubarbe-image /dev/null",
-            "echo -n 'UNAME:' ; uname -r",
-            ]
-        if self.report_wlan:
-            remote_commands.append(
-                "head /sys/class/net/wlan?/statistics/[rt]x_bytes"
-            )
         # reconnect each time
         async with SshProxy(self.node) as ssh:
             if self.verbose:
                 logger.info(f"trying to ssh-connect to {self.node.control_hostname()} "
                             f"(timeout={ssh_timeout})")
             try:
-                connected = await asyncio.wait_for(ssh.connect(),
-                                                   timeout=ssh_timeout)
+                async with self.ssh_limiter:
+                    with PROBE_SECONDS.time(stage='ssh_connect'):
+                        connected = await asyncio.wait_for(
+                            ssh.connect(), timeout=ssh_timeout)
             except asyncio.TimeoutError:
                 connected = False
                 self.set_info({'control_ssh': 'off'})
             if self.verbose:
                 logger.info(f"{self.node.control_hostname()} ssh-connected={connected}")
-            if connected:
+            if not connected:
+                self.set_info({'control_ssh': 'off'})
+            else:
                 try:
-                    command = ";".join(remote_commands)
-                    output = await asyncio.wait_for(ssh.run(command),
-                                                    timeout=ssh_timeout)
+                    with PROBE_SECONDS.time(stage='ssh_run'):
+                        output = await asyncio.wait_for(
+                            ssh.run(self.command), timeout=ssh_timeout)
                     # padding dict here sets control_ssh and control_ping to on
                     self.parse_ssh_probe_output(output, padding_dict)
                     # required as otherwise we leak openfiles
@@ -277,39 +321,30 @@ class MonitorNode:
         # I don't know of an asyncio library to deal with icmp
         # so let's use asyncio.subprocess
         # xxx maybe a Ping class would be the way to go
-        control = self.node.control_hostname()
+        control = self.node.control_address()
         command = ["ping", "-c", "1", "-t", "1", control]
         try:
-            subprocess = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.DEVNULL)
-            # failure occurs through timeout
-            await asyncio.wait_for(subprocess.wait(),
-                                   timeout=ping_timeout)
+            async with self.ping_limiter:
+                with PROBE_SECONDS.time(stage='ping'):
+                    subprocess = await asyncio.create_subprocess_exec(
+                        *command,
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL)
+                    # failure occurs through timeout
+                    await asyncio.wait_for(subprocess.wait(),
+                                           timeout=ping_timeout)
             await self.set_info_and_report({'control_ping': 'on'})
             return
         except asyncio.TimeoutError:
             await self.set_info_and_report({'control_ping': 'off'})
             return
 
-    async def probe_forever(self, cycle, ping_timeout, ssh_timeout):
-        """
-        runs forever, wait <cycle> seconds between 2 runs of probe()
-        """
-        while True:
-            try:
-                await self.probe(ping_timeout, ssh_timeout)
-            except Exception:
-                logger.exception("monitornodes oops 2")
-            await asyncio.sleep(cycle)
-
 
 class MonitorNodes:                                     # pylint: disable=r0902
 
     def __init__(self, cmc_names, message_bus,          # pylint: disable=r0913
                  sidecar_url, cycle,
-                 report_wlan=False, verbose=False):
+                 report_wlan=False, hot_ranges=None, verbose=False):
         self.cycle = cycle
         self.report_wlan = report_wlan
         self.verbose = verbose
@@ -318,19 +353,51 @@ class MonitorNodes:                                     # pylint: disable=r0902
         self.ping_timeout = float(Config().value('networking', 'ping_timeout'))
         self.ssh_timeout = float(Config().value('networking', 'ssh_timeout'))
         self.log_period = float(Config().value('monitor', 'log_period'))
+        full_report_period = float(
+            Config().value('monitor', 'full_report_period'))
+        flush_period = float(Config().value('sidecar', 'flush_period'))
+        flush_threshold = int(Config().value('sidecar', 'flush_threshold'))
 
         # websockets
         self.reconnectable = \
-            ReconnectableSidecar(sidecar_url, 'nodes')
+            ReconnectableSidecar(sidecar_url, 'nodes',
+                                 flush_period=flush_period,
+                                 flush_threshold=flush_threshold)
 
         # the nodes part
+        the_config = Config()
+        ssh_limiter = limiter(
+            int(the_config.value('monitor', 'ssh_concurrency')))
+        ping_limiter = limiter(
+            int(the_config.value('monitor', 'ping_concurrency')))
+        extra_probes = the_config.section_values('probes')
+        for name in list(extra_probes):
+            if not name.isidentifier():
+                logger.warning(f"ignoring probe with invalid name {name}")
+                del extra_probes[name]
         nodes = [Node(cmc_name, message_bus) for cmc_name in cmc_names]
         self.monitor_nodes = [
             MonitorNode(node=node, reconnectable=self.reconnectable,
                         report_wlan=self.report_wlan,
+                        full_report_period=full_report_period,
+                        ssh_limiter=ssh_limiter, ping_limiter=ping_limiter,
+                        extra_probes=extra_probes,
                         verbose=verbose)
             for node in nodes]
 
+        # adaptive scheduling
+        self.scheduler = ProbeScheduler(
+            cycle=cycle,
+            max_cycle=float(the_config.value('monitor', 'cycle_nodes_max')),
+            backoff=float(the_config.value('monitor', 'cycle_nodes_backoff')),
+            hot_cycle=float(the_config.value('monitor', 'cycle_nodes_hot')),
+            budget=float(the_config.value('monitor', 'probe_budget')),
+            workers=int(the_config.value('monitor', 'probe_workers')),
+            jitter=float(the_config.value('monitor', 'probe_jitter')),
+            hot_ranges=hot_ranges,
+            hot_nodes_path=the_config.value('monitor', 'hot_nodes_path'))
+        self.scheduler.monitor_nodes = self.monitor_nodes
+
     async def log(self):
         previous = 0
         while True:
@@ -339,6 +406,11 @@ class MonitorNodes:                                     # pylint: disable=r0902
             current = self.reconnectable.counter
             delta = f"+ {current-previous}"
             line += f" {current} emits ({delta})"
+            line += (f" - saved {self.reconnectable.frames_saved} frames"
+                     f" {self.reconnectable.bytes_saved} bytes")
+            depth, probes, avg_lag, max_lag = self.scheduler.metrics()
+            line += (f" - {probes} probes, queue {depth},"
+                     f" lag avg {avg_lag:.2f}s max {max_lag:.2f}s")
             previous = current
             logger.info(line)
             await asyncio.sleep(self.log_period)
@@ -347,10 +419,10 @@ class MonitorNodes:                                     # pylint: disable=r0902
         logger.info(f"Starting nodes on {len(self.monitor_nodes)} nodes - "
                     f"report_wlan={self.report_wlan}")
         return asyncio.gather(
-            *[monitor_node.probe_forever(self.cycle,
-                                         ping_timeout=self.ping_timeout,
-                                         ssh_timeout=self.ssh_timeout)
-              for monitor_node in self.monitor_nodes],
+            self.scheduler.run_workers(ping_timeout=self.ping_timeout,
+                                       ssh_timeout=self.ssh_timeout),
+            self.scheduler.watch_hot_nodes(),
             self.reconnectable.keep_connected(),
+            self.reconnectable.flush_forever(),
             self.log(),
         )
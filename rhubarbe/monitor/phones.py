@@ -23,9 +23,15 @@ from rhubarbe.config import Config
 from rhubarbe.logger import monitor_logger as logger
 
 from rhubarbe.inventoryphones import InventoryPhones
+from rhubarbe.metrics import Metrics
 from rhubarbe.monitor.reconnectable import ReconnectableSidecar
 
 
+PROBE_SECONDS = Metrics().histogram(
+    'rhubarbe_phone_probe_duration_seconds',
+    "time spent probing a phone")
+
+
 class MonitorPhone:                                     # pylint: disable=r0902
 
     # id is what you get through adb devices
@@ -105,7 +111,8 @@ class MonitorPhone:                                     # pylint: disable=r0902
 
     async def probe_forever(self):
         while True:
-            await self.probe()
+            with PROBE_SECONDS.time():
+                await self.probe()
             await asyncio.sleep(self.cycle)
 
 
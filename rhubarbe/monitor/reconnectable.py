@@ -7,31 +7,145 @@ import asyncio
 from r2lab import SidecarAsyncClient
 
 from rhubarbe.logger import monitor_logger as logger
+from rhubarbe.metrics import Metrics
+
+FRAMES = Metrics().counter(
+    'rhubarbe_sidecar_frames_total',
+    "frames sent to the sidecar")
+FAILURES = Metrics().counter(
+    'rhubarbe_sidecar_failures_total',
+    "frames that could not be sent to the sidecar")
+CONNECTIONS = Metrics().counter(
+    'rhubarbe_sidecar_connections_total',
+    "successful (re)connections to the sidecar")
 
 #import logging
 #logger.setLevel(logging.DEBUG)
 
-class ReconnectableSidecar:
+class ReconnectableSidecar:                             # pylint: disable=r0902
 
-    def __init__(self, url, category, keep_period=1):
+    def __init__(self, url, category, keep_period=1,    # pylint: disable=r0913
+                 flush_period=None, flush_threshold=None):
         # keep_period is the frequency where connection is verified for open-ness
         self.url = url
         self.category = category
         self.keep_period = keep_period
+        # when flush_period is set, emit_info() does not send right away
+        # infos get coalesced per id, and are sent as a single frame
+        # every flush_period, or as soon as flush_threshold ids are pending
+        # caller MUST then run flush_forever()
+        self.flush_period = flush_period
+        self.flush_threshold = flush_threshold
         # caller MUST run keep_connected() 
         self.proto = None
+        # number of frames actually sent
         self.counter = 0
+        # number of successful (re)connections, so that
+        # emitters can tell when the other end might have lost track
+        self.connections = 0
+        # batching internals and counters
+        self._pending = {}
+        self._pending_counts = {}
+        self._flush_event = asyncio.Event()
+        self.frames_saved = 0
+        self.bytes_saved = 0
         logger.info(f"reconnectable sidecar to {url} ")
 
     
     async def emit_info(self, info):
+        if self.flush_period:
+            self.enqueue_info(info)
+            return True
         # create a list with that one info
         return await self.emit_infos([info])
 
 
+    def enqueue_info(self, info):
+        """
+        store info for the next flush; an info that is still pending
+        for the same id gets merged, so only the latest values are sent
+        """
+        id_ = info['id']
+        if id_ in self._pending:
+            self._pending[id_].update(info)
+        else:
+            self._pending[id_] = dict(info)
+        self._pending_counts[id_] = self._pending_counts.get(id_, 0) + 1
+        if self.flush_threshold and len(self._pending) >= self.flush_threshold:
+            self._flush_event.set()
+
+
+    async def flush(self):
+        """
+        send all pending infos in a single frame
+        pending infos are kept if we are not connected, and
+        a frame that could not be sent goes back to the pending infos
+        """
+        if not self._pending or not self.proto:
+            return False
+        pending, counts = self._pending, self._pending_counts
+        self._pending, self._pending_counts = {}, {}
+        infos = list(pending.values())
+        # this is what json.dumps() would produce on the whole payload
+        # but we get the size of each info on the way
+        envelope = json.dumps(dict(category=self.category,
+                                   action='info', message=[]))
+        encoded = [json.dumps(info) for info in infos]
+        frame = envelope[:-2] + ", ".join(encoded) + envelope[-2:]
+        logger.debug(f"Sending {len(infos)} infos in one frame")
+        try:
+            await self.proto.send(frame)
+            self.counter += 1
+            FRAMES.inc(category=self.category)
+        except Exception:
+            logger.exception("batched send failed")
+            FAILURES.inc(category=self.category)
+            self.proto = None
+            self.requeue(pending, counts)
+            return False
+        # what it would have taken to send each emit_info() separately
+        unbatched_frames = sum(counts.values())
+        unbatched_bytes = sum(
+            counts[info['id']] * (len(envelope) + len(text))
+            for info, text in zip(infos, encoded))
+        self.frames_saved += unbatched_frames - 1
+        self.bytes_saved += unbatched_bytes - len(frame)
+        return True
+
+
+    def requeue(self, pending, counts):
+        """
+        put back infos that could not be sent, in front of the ones
+        enqueued in the meantime; for the same id, newer values win
+        """
+        for id_, info in self._pending.items():
+            if id_ in pending:
+                pending[id_].update(info)
+            else:
+                pending[id_] = info
+        for id_, count in self._pending_counts.items():
+            counts[id_] = counts.get(id_, 0) + count
+        self._pending, self._pending_counts = pending, counts
+
+
+    async def flush_forever(self):
+        """
+        A continuous loop that flushes pending infos
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(),
+                                       timeout=self.flush_period)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+
     async def emit_infos(self, infos):
         if not self.proto:
             logger.warning(f"dropping message {infos}")
+            FAILURES.inc(category=self.category)
             return False
         logger.debug(f"Sending {infos}")
         # xxx use Payload
@@ -40,11 +154,14 @@ class ReconnectableSidecar:
         try:
             await self.proto.send(json.dumps(payload))
             self.counter += 1
+            FRAMES.inc(category=self.category)
         except ConnectionRefusedError:
             logger.warning(f"Could not send {self.category} - dropped")
+            FAILURES.inc(category=self.category)
         except Exception as exc:
             # xxx to review
             logger.exception("send failed")
+            FAILURES.inc(category=self.category)
             self.proto = None
             return False
         return True
@@ -70,6 +187,8 @@ class ReconnectableSidecar:
                 try:
                     logger.info(f"(re)-connecting to {self.url} ...")
                     self.proto = await SidecarAsyncClient(self.url, **kwds)
+                    self.connections += 1
+                    CONNECTIONS.inc(category=self.category)
                     logger.debug("connected !")
                 except ConnectionRefusedError:
                     logger.warning(f"Could not connect to {self.url} at this time")
@@ -0,0 +1,315 @@
+"""
+Decides when each node gets probed by monitornodes
+
+* a node whose state does not change gets probed less and less often
+* a node that has just changed state gets probed again quickly
+* a node in the hot list gets probed at high frequency
+* and overall no more than a given number of probes are fired every second
+
+Probes are run by a fixed number of workers that pick nodes
+as they become due, so that not all nodes are probed at the same time
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# pylint: disable=c0111, w0703, w1202
+
+import time
+import heapq
+import random
+import asyncio
+from pathlib import Path
+
+from rhubarbe.selector import Selector, MisformedRange
+from rhubarbe.metrics import Metrics
+from rhubarbe.logger import monitor_logger as logger
+
+PROBE_SECONDS = Metrics().histogram(
+    'rhubarbe_probe_duration_seconds',
+    "time spent in each stage of probing a node, or overall for 'total'")
+PROBE_ERRORS = Metrics().counter(
+    'rhubarbe_probe_errors_total',
+    "probes that ended with an unexpected exception")
+LAG_SECONDS = Metrics().histogram(
+    'rhubarbe_probe_lag_seconds',
+    "how late probes get started wrt their schedule")
+QUEUE_DEPTH = Metrics().gauge(
+    'rhubarbe_probe_queue_depth',
+    "how many nodes are due but not being probed yet")
+
+
+class Unlimited:
+    """
+    an async context manager that does nothing,
+    used in lieu of a semaphore when no limit is set
+    """
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def limiter(limit):
+    """
+    a semaphore if limit is set, a no-op otherwise
+    """
+    return asyncio.Semaphore(limit) if limit else Unlimited()
+
+
+class ProbeBudget:
+    """
+    a token bucket that caps the number of probes per second
+    rate = 0 means no limit; the bucket holds at least one token,
+    so that a rate below 1 means one probe every 1/rate seconds
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ProbeScheduler:                                   # pylint: disable=r0902
+    """
+    cycle: the delay between 2 probes right after a node changed state
+    max_cycle: the delay never goes beyond that, for nodes that are stable
+    backoff: the delay gets multiplied by that much as long as
+      the node remains in the same state
+    hot_cycle: the delay for nodes in the hot list
+    budget: max number of probes per second, all nodes together
+    workers: how many probes can run simultaneously
+    jitter: delays are randomly spread by that ratio, e.g.
+      with 0.2 a delay of 10s becomes anything between 8s and 12s
+
+    the hot list is made of the ranges in hot_ranges, plus the ones found
+    in the file at hot_nodes_path, if it exists; that file
+    is re-read whenever it changes, and uses the same syntax as
+    the command line, e.g. '1-4 12 fit18'
+    """
+
+    def __init__(self, cycle, max_cycle,                # pylint: disable=r0913
+                 backoff, hot_cycle, budget, workers=16, jitter=0.2,
+                 hot_ranges=None, hot_nodes_path=None):
+        self.cycle = cycle
+        self.max_cycle = max(cycle, max_cycle)
+        self.backoff = backoff
+        self.hot_cycle = hot_cycle
+        self.budget = ProbeBudget(budget)
+        self.workers = workers
+        self.jitter = jitter
+        self.hot_ranges = hot_ranges or []
+        self.hot_nodes_path = hot_nodes_path
+        # node ids
+        self.hot_ids = self.parse_ranges(self.hot_ranges)
+        self._hot_mtime = None
+        # MonitorNode instances, so we can wake them up
+        self.monitor_nodes = []
+        Metrics().add_collector(
+            lambda: QUEUE_DEPTH.set(self.queue_depth()))
+        # a heap of tuples (due, counter, monitor_node)
+        # entries whose due is not monitor_node.scheduled_due are obsolete
+        self._queue = []
+        self._counter = 0
+        self._queue_changed = asyncio.Event()
+        # metrics: how late probes start, reset by metrics()
+        self._lags = []
+
+    @staticmethod
+    def parse_ranges(ranges):
+        selector = Selector()
+        for range1 in ranges:
+            try:
+                selector.add_range(range1)
+            except MisformedRange as exc:
+                logger.warning(f"hot nodes: ignored {exc}")
+        return set(selector.set)
+
+    def is_hot(self, monitor_node):
+        return monitor_node.node.id in self.hot_ids
+
+    def next_delay(self, monitor_node):
+        """
+        how long to wait before probing this node again
+        """
+        summary = monitor_node.summary()
+        if summary != monitor_node.scheduled_summary:
+            monitor_node.scheduled_summary = summary
+            monitor_node.scheduled_delay = self.cycle
+        else:
+            monitor_node.scheduled_delay = min(
+                monitor_node.scheduled_delay * self.backoff, self.max_cycle)
+        if self.is_hot(monitor_node):
+            return self.hot_cycle
+        return monitor_node.scheduled_delay
+
+    def schedule(self, monitor_node, delay):
+        """
+        have monitor_node probed again in about delay seconds
+        """
+        if self.jitter:
+            delay *= 1 + self.jitter * (2 * random.random() - 1)
+        due = time.monotonic() + delay
+        monitor_node.scheduled_due = due
+        self._counter += 1
+        heapq.heappush(self._queue, (due, self._counter, monitor_node))
+        self._queue_changed.set()
+
+    def wake_up(self, monitor_node):
+        """
+        have monitor_node probed right away, unless it's being probed
+        """
+        if monitor_node.probing:
+            return
+        monitor_node.scheduled_due = time.monotonic()
+        self._counter += 1
+        heapq.heappush(self._queue, (monitor_node.scheduled_due,
+                                     self._counter, monitor_node))
+        self._queue_changed.set()
+
+    async def next_due(self):
+        """
+        wait for the next node to be due and return it
+        """
+        while True:
+            self._queue_changed.clear()
+            timeout = None
+            if self._queue:
+                due, _, monitor_node = self._queue[0]
+                if due != monitor_node.scheduled_due:
+                    heapq.heappop(self._queue)
+                    continue
+                now = time.monotonic()
+                if due <= now:
+                    heapq.heappop(self._queue)
+                    self._lags.append(now - due)
+                    LAG_SECONDS.observe(now - due)
+                    monitor_node.probing = True
+                    return monitor_node
+                timeout = due - now
+            try:
+                await asyncio.wait_for(self._queue_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def worker(self, ping_timeout, ssh_timeout):
+        while True:
+            monitor_node = await self.next_due()
+            try:
+                await self.budget.acquire()
+                with PROBE_SECONDS.time(stage='total'):
+                    await monitor_node.probe(ping_timeout, ssh_timeout)
+            except Exception:
+                PROBE_ERRORS.inc()
+                logger.exception("monitornodes oops 2")
+            finally:
+                monitor_node.probing = False
+            self.schedule(monitor_node, self.next_delay(monitor_node))
+
+    async def run_workers(self, ping_timeout, ssh_timeout):
+        """
+        spread the first probes over one cycle, and run the workers
+        """
+        for monitor_node in self.monitor_nodes:
+            self.schedule(monitor_node, random.random() * self.cycle)
+        await asyncio.gather(*[self.worker(ping_timeout, ssh_timeout)
+                               for _ in range(self.workers)])
+
+    def queue_depth(self):
+        """
+        how many nodes are due but have not been picked by a worker yet
+        """
+        now = time.monotonic()
+        return sum(1 for due, _, monitor_node in self._queue
+                   if due <= now and due == monitor_node.scheduled_due)
+
+    def metrics(self):
+        """
+        returns a tuple depth, nb_probes, avg_lag, max_lag
+        the lags are the ones observed since the previous call
+        """
+        lags, self._lags = self._lags, []
+        avg_lag = sum(lags) / len(lags) if lags else 0.
+        max_lag = max(lags) if lags else 0.
+        return self.queue_depth(), len(lags), avg_lag, max_lag
+
+    def set_hot_ids(self, hot_ids):
+        newly_hot = hot_ids - self.hot_ids
+        self.hot_ids = hot_ids
+        for monitor_node in self.monitor_nodes:
+            if monitor_node.node.id in newly_hot:
+                self.wake_up(monitor_node)
+
+    def read_hot_nodes(self):
+        path = Path(self.hot_nodes_path)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._hot_mtime:
+            return
+        self._hot_mtime = mtime
+        ranges = list(self.hot_ranges)
+        if mtime is not None:
+            try:
+                with path.open() as feed:
+                    ranges += feed.read().split()
+            except OSError as exc:
+                logger.warning(f"cannot read hot nodes from {path}: {exc}")
+        hot_ids = self.parse_ranges(ranges)
+        if hot_ids != self.hot_ids:
+            logger.info(f"hot nodes are now {sorted(hot_ids)}")
+        self.set_hot_ids(hot_ids)
+
+    async def watch_hot_nodes(self):
+        """
+        A continuous loop that keeps track of the hot nodes file
+        """
+        if not self.hot_nodes_path:
+            return
+        while True:
+            try:
+                self.read_hot_nodes()
+            except Exception:
+                logger.exception("monitornodes could not read hot nodes")
+            await asyncio.sleep(self.cycle)
+
+
+####################
+# test
+if __name__ == '__main__':
+
+    def test_fractional_budget():
+        """
+        with a budget of 0.5, probes go every 2 seconds
+        """
+        budget = ProbeBudget(0.5)
+
+        async def two_probes():
+            beg = time.monotonic()
+            await budget.acquire()
+            first = time.monotonic() - beg
+            await asyncio.wait_for(budget.acquire(), timeout=5)
+            return first, time.monotonic() - beg
+
+        first, second = asyncio.get_event_loop().run_until_complete(
+            two_probes())
+        assert first < 0.1, first
+        assert 1.9 < second < 2.5, second
+        print("test_fractional_budget OK")
+
+    test_fractional_budget()
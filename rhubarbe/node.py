@@ -17,6 +17,8 @@ import aiohttp
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
 from rhubarbe.inventory import Inventory
+from rhubarbe.tracer import Tracer
+from rhubarbe.events import make_event
 from rhubarbe.frisbee import Frisbee
 from rhubarbe.imagezip import ImageZip
 
@@ -59,6 +61,27 @@ class Node:                                             # pylint: disable=r0902
         return the_inventory.attached_hostname_info(self.cmc_name,
                                                     'control', 'hostname')
 
+    def control_address(self):
+        """
+        how to reach the control interface, see address_nodes_by in config
+        """
+        if Config().value('networking', 'address_nodes_by') == 'ip':
+            return self.control_ip_address()
+        return self.control_hostname()
+
+    def cmc_url(self, verb):
+        the_config = Config()
+        if the_config.value('networking', 'address_nodes_by') == 'ip':
+            the_inventory = Inventory()
+            host = the_inventory.attached_hostname_info(self.cmc_name,
+                                                        'cmc', 'ip')
+        else:
+            host = self.cmc_name
+        port = int(the_config.value('networking', 'cmc_port'))
+        if port != 80:
+            host = f"{host}:{port}"
+        return f"http://{host}/{verb}"
+
     async def get_status(self):
         """
         returns self.status
@@ -121,7 +144,7 @@ class Node:                                             # pylint: disable=r0902
         """
         verb typically is 'status', 'on', 'off' or 'info'
         """
-        url = f"http://{self.cmc_name}/{verb}"
+        url = self.cmc_url(verb)
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.get(url) as response:
@@ -170,7 +193,7 @@ class Node:                                             # pylint: disable=r0902
           * False to indicate that the node is 'off' after checking
           * None if something goes wrong
         """
-        url = f"http://{self.cmc_name}/{message}"
+        url = self.cmc_url(message)
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.get(url) as response:
@@ -194,11 +217,12 @@ class Node:                                             # pylint: disable=r0902
 
     async def feedback(self, field, message):
         await self.message_bus.put(
-            {'ip': self.control_ip_address(), field: message})
+            make_event(field, message, ip=self.control_ip_address()))
 
     async def ensure_reset(self):
         if self.status is None:
-            await self.get_status()
+            with Tracer().span(self.control_ip_address(), 'cmc status'):
+                await self.get_status()
         if self.status not in self.message_to_reset_map:
             await self.feedback(
                 'reboot', f"Cannot get status at {self.cmc_name}")
@@ -249,18 +273,26 @@ class Node:                                             # pylint: disable=r0902
     ##########
     async def wait_for_telnet(self, service):
         ipaddr = self.control_ip_address()
-        if service == 'frisbee':
-            self.frisbee = Frisbee(ipaddr, self.message_bus)
-            await self.frisbee.wait_until_connect()
-        elif service == 'imagezip':
-            self.imagezip = ImageZip(ipaddr, self.message_bus)
-            await self.imagezip.wait_until_connect()
+        with Tracer().span(ipaddr, 'wait telnet'):
+            if service == 'frisbee':
+                self.frisbee = Frisbee(ipaddr, self.message_bus)
+                await self.frisbee.wait_until_connect()
+            elif service == 'imagezip':
+                self.imagezip = ImageZip(ipaddr, self.message_bus)
+                await self.imagezip.wait_until_connect()
+
+    async def final_reset(self):
+        with Tracer().span(self.control_ip_address(), 'final reset'):
+            await self.ensure_reset()
 
     async def reboot_on_frisbee(self, idle):
         self.manage_nextboot_symlink('frisbee')
-        await self.ensure_reset()
+        tracer, ipaddr = Tracer(), self.control_ip_address()
+        with tracer.span(ipaddr, 'reset'):
+            await self.ensure_reset()
         await self.feedback('reboot', f"idling for {idle}s")
-        await asyncio.sleep(idle)
+        with tracer.span(ipaddr, 'idle'):
+            await asyncio.sleep(idle)
 
     async def run_frisbee(self, ipaddr, port, reset):
         await self.wait_for_telnet('frisbee')
@@ -268,7 +300,7 @@ class Node:                                             # pylint: disable=r0902
         result = await self.frisbee.run(ipaddr, port)
         #logger.info(f"run_frisbee -> {result}")
         if reset:
-            await self.ensure_reset()
+            await self.final_reset()
         else:
             await self.feedback('reboot',
                                 'skipping final reset')
@@ -281,7 +313,7 @@ class Node:                                             # pylint: disable=r0902
                                          radical, comment)
         #logger.info(f"run_imagezip -> {result}")
         if reset:
-            await self.ensure_reset()
+            await self.final_reset()
         else:
             await self.feedback('reboot',
                                 'skipping final reset')
@@ -1,72 +1,216 @@
 """
 The PlcApiProxy class allows to create an authenticated xmlrpc
 connection to a myplc server; typically r2labapi.inria.fr
+
+Connections are kept alive and reused across calls; each concurrent
+caller - typically a thread - gets its own connection from a pool.
+Once the password has been used to open a session (GetSession),
+the session is used instead until it expires.
+Get* calls, that are idempotent, are retried on network errors;
+all errors are propagated to the caller.
+
+See the [plcapi] section in the config for timeout, retries and
+session lifetime.
 """
 
 # c0111 no docstrings yet
 # w1202 logger & format
-# w0703 catch Exception
-# r1705 else after return
-# pylint: disable=c0111, w0703, w1202
+# pylint: disable=c0111, w1202
 
+import time
 import getpass
+import threading
+import http.client
+from contextlib import contextmanager
 
 import ssl
 
 # from aioxmlrpc.client import ServerProxy
-from xmlrpc.client import ServerProxy
+from xmlrpc.client import (ServerProxy, Transport, SafeTransport,
+                           Fault, ProtocolError)
+
+from rhubarbe.config import Config
+from rhubarbe.logger import logger
+from rhubarbe.metrics import Metrics
+
+CALL_SECONDS = Metrics().histogram(
+    'rhubarbe_plcapi_call_duration_seconds',
+    "duration of the PLCAPI calls, per method")
+CALL_ERRORS = Metrics().counter(
+    'rhubarbe_plcapi_errors_total',
+    "PLCAPI calls that raised an exception, per method")
+CALL_RETRIES = Metrics().counter(
+    'rhubarbe_plcapi_retries_total',
+    "PLCAPI calls that were retried after a network error, per method")
+
+# as per PLC/Faults.py
+PLC_AUTHENTICATION_FAILURE = 103
+
+# what is worth a retry
+NETWORK_ERRORS = (OSError, ProtocolError, http.client.HTTPException)
+
+
+class _TimeoutMixin:
+    """
+    the stock transports keep their connection open between requests;
+    this adds a timeout on that connection
+    """
+
+    timeout = None
+
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+class KeepAliveTransport(_TimeoutMixin, Transport):
+    pass
+
+
+class SafeKeepAliveTransport(_TimeoutMixin, SafeTransport):
+    pass
 
 
-class PlcApiProxy(ServerProxy):                         # pylint: disable=r0903
+class PlcApiProxy:                                      # pylint: disable=r0902
 
     # use the standard plcapi scheme to run on /PLCAPI/
-    # always use password auth in this first rough version
-    # could be improved by using session authentication
     def __init__(self, url, email=None, password=None, debug=False):
         self.url = url
         self.email = email
         self.password = password
         self.debug = debug
+        the_config = Config()
+        self.timeout = float(the_config.value('plcapi', 'timeout'))
+        self.retries = int(the_config.value('plcapi', 'retries'))
+        self.retry_backoff = float(the_config.value('plcapi',
+                                                    'retry_backoff'))
+        # 0 means no session, i.e. use the password on each call
+        self.session_lifetime = float(the_config.value('plcapi',
+                                                       'session_lifetime'))
         ###
-        context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
-        context.check_hostname = False
-        ServerProxy.__init__(
-            self, self.url, allow_none=True, context=context
-        )
+        # idle ServerProxy instances, each with its own connection
+        self._idle = []
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_expires = 0
+
+    def _new_server(self):
+        if self.url.startswith("https"):
+            context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
+            context.check_hostname = False
+            transport = SafeKeepAliveTransport(context=context)
+        else:
+            transport = KeepAliveTransport()
+        transport.timeout = self.timeout
+        return ServerProxy(self.url, transport=transport, allow_none=True)
+
+    @contextmanager
+    def _server(self):
+        """
+        borrow a connection from the pool
+        """
+        with self._lock:
+            server = self._idle.pop() if self._idle else None
+        if server is None:
+            server = self._new_server()
+        try:
+            yield server
+        finally:
+            # on errors, the transport closes the connection
+            # and will reopen it on next request
+            with self._lock:
+                self._idle.append(server)
+
+    def _raw_call(self, method, auth, *args):
+        with self._server() as server:
+            return getattr(server, method)(auth, *args)
+
+    def _password_auth(self):
+        if not self.email:
+            self.email = input("Enter plcapi email (login) : ")
+        if not self.password:
+            self.password = getpass.getpass(
+                f"Enter plcapi password for {self.email} : ")
+        return {'AuthMethod': 'password',
+                'Username': self.email,
+                'AuthString': self.password}
+
+    def _session_auth(self):
+        with self._lock:
+            if self._session and time.time() < self._session_expires:
+                return {'AuthMethod': 'session', 'session': self._session}
+        # several threads may do this at the same time, that's harmless
+        expires = time.time() + self.session_lifetime
+        session = self._raw_call('GetSession', self._password_auth())
+        with self._lock:
+            self._session, self._session_expires = session, expires
+        return {'AuthMethod': 'session', 'session': session}
+
+    def _forget_session(self):
+        with self._lock:
+            self._session = None
 
     def __auth__(self, anonymous):
         if anonymous:
             return {'AuthMethod': 'anonymous'}
-        else:
-            if not self.email:
-                self.email = input("Enter plcapi email (login) : ")
-            if not self.password:
-                self.password = getpass.getpass(
-                    f"Enter plcapi password for {self.email} : ")
-            return {'AuthMethod': 'password',
-                    'Username': self.email,
-                    'AuthString': self.password}
+        if self.session_lifetime:
+            return self._session_auth()
+        return self._password_auth()
+
+    def _call(self, method, anonymous, *args):
+        # only the Get* calls are safe to be sent twice
+        attempts = 1 + (self.retries if method.startswith('Get') else 0)
+        attempt = 0
+        renewed = False
+        while True:
+            try:
+                return self._raw_call(method, self.__auth__(anonymous), *args)
+            except Fault as fault:
+                # the session may have been discarded on the server side
+                if (fault.faultCode == PLC_AUTHENTICATION_FAILURE
+                        and self._session and not renewed):
+                    logger.info(f"PLCAPI session rejected in {method}"
+                                f" - renewing")
+                    self._forget_session()
+                    renewed = True
+                    continue
+                raise
+            except NETWORK_ERRORS as exc:
+                attempt += 1
+                if attempt >= attempts:
+                    raise
+                delay = self.retry_backoff * 2 ** (attempt - 1)
+                logger.warning(f"PLCAPI {method} failed with {exc}"
+                               f" - retrying in {delay}s")
+                CALL_RETRIES.inc(method=method)
+                time.sleep(delay)
 
     def __getattr__(self, attr):
         """
         pass the authentication along for all calls
         """
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
         # the default is to use authenticated calls
         # because this is the majority of the plcapi calls
-        def fun(*args, anonymous=False, **kwds):
+        def fun(*args, anonymous=False):
             if self.debug:
                 auth_msg = "[auth]" if not anonymous else "[anon]"
                 print(f"-> Sending {auth_msg} {attr} on {self} "
-                      f"with args={args} and kwds={kwds}")
-            actual_fun = ServerProxy.__getattr__(
-                self, attr)
+                      f"with args={args}")
+            beg = time.monotonic()
             try:
-                retcod = actual_fun(self.__auth__(anonymous), *args, **kwds)
+                retcod = self._call(attr, anonymous, *args)
                 if self.debug:
                     print(f"<- Received {retcod}")
                 return retcod
-            except Exception as exc:
-                print(f"ignored exception in {attr} : {exc}")
+            except Exception:
+                CALL_ERRORS.inc(method=attr)
+                raise
+            finally:
+                CALL_SECONDS.observe(time.monotonic() - beg, method=attr)
         return fun
 
     def __str__(self):
@@ -0,0 +1,306 @@
+"""
+Distributing a file to a set of nodes, like in
+rhubarbe push -a bundle.tgz /root/
+
+With the 'direct' strategy, the gateway uploads the file to all nodes,
+a few at a time. With the 'tree' strategy, the gateway only uploads to
+the first few nodes - the seeds; as soon as a node has the file, it
+relays it to another node - the gateway simply runs an ssh command on
+it - so that the number of copies doubles at each round, and the
+gateway uplink is used only for the seeds. The gateway uploads to
+other nodes only if a relay fails, e.g. because the nodes can't ssh
+into one another, or if no node is there to relay, e.g. because all
+the seeds have failed.
+
+Each node gets one ssh connection from the gateway, used for both
+receiving the file and relaying it.
+"""
+
+# c0111 no docstrings yet
+# w0703 catch Exception
+# pylint: disable=c0111, w0703
+
+import sys
+import json
+import time
+import shlex
+import asyncio
+from pathlib import Path
+from collections import deque
+
+from rhubarbe.ssh import SshProxy
+
+# the gateway, as a source
+GATEWAY = 'gateway'
+
+CHUNK_SIZE = 256 * 2**10
+
+
+def upload_command(dest):
+    return f"cat > {shlex.quote(dest)}"
+
+
+def relay_command(dest, target, port, username='root'):
+    """
+    the command that a node runs to send its copy to target
+    """
+    options = ("-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null"
+               " -o BatchMode=yes -o LogLevel=ERROR")
+    return (f"ssh {options} -p {port} {username}@{target}"
+            f" {shlex.quote(upload_command(dest))} < {shlex.quote(dest)}")
+
+
+class PushState:                                        # pylint: disable=r0903
+    """
+    who can send the file, and who still needs it
+    """
+
+    def __init__(self, nodes, fanout):
+        # the nodes that don't have the file yet
+        self.pending = deque(nodes)
+        # the targets that a node failed to relay to, for the gateway
+        self.direct = deque()
+        # the nodes that have the file and are not busy relaying it
+        self.ready = deque()
+        # how many more uploads the gateway can run
+        self.slots = fanout
+        # how many pending targets the gateway has uploaded to
+        self.seeds = 0
+        self.in_flight = 0
+        # set each time a transfer is over
+        self.changed = asyncio.Event()
+
+
+class Pusher:
+
+    def __init__(self, nodes, path, dest,               # pylint: disable=r0913
+                 strategy='tree', fanout=4, json_output=False,
+                 connect_timeout=10.):
+        self.nodes = nodes
+        self.path = Path(path)
+        # a directory means keep the same name
+        self.dest = (dest + self.path.name) if dest.endswith('/') else dest
+        self.strategy = strategy
+        self.fanout = max(1, fanout)
+        self.json_output = json_output
+        self.connect_timeout = connect_timeout
+        self.size = self.path.stat().st_size
+        # node -> its connected SshProxy
+        self.proxies = {}
+        # node name -> dict
+        self.results = {}
+
+    def report(self, node, source, duration, ok):
+        name = node.control_hostname()
+        throughput = self.size / duration / 2**20 if duration else 0.
+        self.results[name] = {
+            'node': name, 'ok': ok, 'source': source,
+            'duration': round(duration, 3),
+            'throughput': round(throughput, 3)}
+        if self.json_output:
+            print(json.dumps(self.results[name], separators=(',', ':')),
+                  flush=True)
+        elif ok:
+            print(f"{name}:push OK in {duration:.2f}s"
+                  f" ({throughput:.1f} MiB/s from {source})", flush=True)
+        else:
+            print(f"{name}:push KO", flush=True)
+
+    async def proxy(self, node):
+        """
+        the connected SshProxy for that node, or None
+        """
+        if node not in self.proxies:
+            ssh = SshProxy(node)
+            connected = await ssh.connect(self.connect_timeout)
+            self.proxies[node] = ssh if connected else None
+        return self.proxies[node]
+
+    async def upload(self, target):
+        """
+        send the file from the gateway
+        """
+        ssh = await self.proxy(target)
+        if ssh is None:
+            return False
+        process = await ssh.conn.create_process(
+            upload_command(self.dest), encoding=None)
+        with self.path.open('rb') as feed:
+            while True:
+                chunk = feed.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        process.stdin.write_eof()
+        completed = await process.wait()
+        return completed.exit_status == 0
+
+    async def relay(self, source, target):
+        """
+        have source send its copy to target
+        """
+        ssh = await self.proxy(source)
+        if ssh is None:
+            return False
+        completed = await ssh.conn.run(
+            relay_command(self.dest, target.control_ip_address(),
+                          ssh.port, ssh.username))
+        return completed.exit_status == 0
+
+    async def transfer(self, source, target, state):
+        """
+        source - a node or the gateway - sends the file to target;
+        if a relay fails, target goes in state.direct, for the gateway
+        """
+        beg = time.monotonic()
+        try:
+            if source is GATEWAY:
+                ok = await self.upload(target)
+            else:
+                ok = await self.relay(source, target)
+        except Exception:
+            ok = False
+        if ok or source is GATEWAY:
+            reported_source = (source if source is GATEWAY
+                               else source.control_hostname())
+            self.report(target, reported_source,
+                        time.monotonic() - beg, ok)
+        else:
+            state.direct.append(target)
+        state.in_flight -= 1
+        if source is GATEWAY:
+            state.slots += 1
+        else:
+            # a failed relay may well be the target's fault
+            state.ready.append(source)
+        if ok and self.strategy == 'tree':
+            state.ready.append(target)
+        state.changed.set()
+
+    async def co_run(self):
+        state = PushState(self.nodes, self.fanout)
+        transfers = []
+
+        def start(source, target):
+            state.in_flight += 1
+            transfers.append(asyncio.ensure_future(
+                self.transfer(source, target, state)))
+
+        while state.pending or state.direct or state.in_flight:
+            # nodes first, to spare the gateway uplink
+            while state.ready and state.pending:
+                start(state.ready.popleft(), state.pending.popleft())
+            while state.slots and state.direct:
+                state.slots -= 1
+                start(GATEWAY, state.direct.popleft())
+            while state.slots and state.pending and (
+                    self.strategy == 'direct'
+                    or state.seeds < self.fanout
+                    # nobody has, or is getting, the file
+                    or not (state.ready or state.in_flight)):
+                state.slots -= 1
+                state.seeds += 1
+                start(GATEWAY, state.pending.popleft())
+            if state.in_flight:
+                await state.changed.wait()
+                state.changed.clear()
+        await asyncio.gather(*transfers)
+        for ssh in self.proxies.values():
+            if ssh is not None:
+                await ssh.close()
+
+    def run(self, timeout=None):
+        """
+        returns True if all nodes have the file
+        """
+        beg = time.monotonic()
+        try:
+            asyncio.get_event_loop().run_until_complete(
+                asyncio.wait_for(self.co_run(), timeout))
+        except asyncio.TimeoutError:
+            print("rhubarbe-push : timeout", file=sys.stderr)
+        except KeyboardInterrupt:
+            print("rhubarbe-push : keyboard interrupt - exiting",
+                  file=sys.stderr)
+        duration = time.monotonic() - beg
+        done = [result for result in self.results.values() if result['ok']]
+        summary = {
+            'type': 'summary', 'size': self.size,
+            'strategy': self.strategy, 'nodes': len(self.nodes),
+            'ok': len(done), 'duration': round(duration, 3),
+            # how much data got written on the nodes, per second
+            'throughput': round(len(done) * self.size / duration / 2**20, 3),
+        }
+        if self.json_output:
+            print(json.dumps(summary, separators=(',', ':')), flush=True)
+        else:
+            print(f"pushed {self.size} bytes to {len(done)}/{len(self.nodes)}"
+                  f" nodes in {duration:.2f}s"
+                  f" ({summary['throughput']:.1f} MiB/s overall,"
+                  f" {self.strategy} strategy)", file=sys.stderr)
+        return len(done) == len(self.nodes)
+
+####################
+# test
+if __name__ == '__main__':
+
+    def test_failed_relay():
+        """
+        with fake transfers, a relay that fails gets uploaded by the
+        gateway within its fanout, and the relay node keeps relaying
+        """
+
+        class FakeNode:
+            def __init__(self, rank):
+                self.name = f"fit{rank:02d}"
+
+            def control_hostname(self):
+                return self.name
+
+            def control_ip_address(self):
+                return self.name
+
+        class FakePusher(Pusher):
+            uploads = 0
+            max_uploads = 0
+            relays = {}
+            failed = []
+
+            async def upload(self, target):
+                self.uploads += 1
+                self.max_uploads = max(self.max_uploads, self.uploads)
+                await asyncio.sleep(0.02)
+                self.uploads -= 1
+                return True
+
+            async def relay(self, source, target):
+                self.relays[source] = self.relays.get(source, 0) + 1
+                await asyncio.sleep(0.01)
+                # the first relay of the first node fails
+                if source is self.nodes[0] and not self.failed:
+                    self.failed.append(target)
+                    return False
+                return True
+
+        fanout = 2
+        nodes = [FakeNode(rank) for rank in range(1, 17)]
+        pusher = FakePusher(nodes, __file__, "/tmp/", fanout=fanout,
+                            json_output=True)
+        asyncio.get_event_loop().run_until_complete(pusher.co_run())
+        assert all(result['ok'] for result in pusher.results.values())
+        assert len(pusher.results) == len(nodes)
+        # the gateway never had more than fanout uploads at a time
+        assert pusher.max_uploads == fanout, pusher.max_uploads
+        # the failed target came from the gateway
+        failed = pusher.failed[0].control_hostname()
+        assert pusher.results[failed]['source'] == GATEWAY
+        # and apart from that, the gateway only uploaded to the seeds
+        from_gateway = [result for result in pusher.results.values()
+                        if result['source'] == GATEWAY]
+        assert len(from_gateway) == fanout + 1, from_gateway
+        # and the node whose relay failed kept relaying
+        assert pusher.relays[nodes[0]] >= 2, pusher.relays
+        print("test_failed_relay OK")
+
+    test_failed_relay()
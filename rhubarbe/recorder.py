@@ -0,0 +1,140 @@
+"""
+Recording the events from the message bus, and replaying them
+
+A recording is a NDJSON file; the first line is a header that describes
+the session, including the nodes involved, and each following line is
+one event, with t the monotonic time in seconds since the recording
+started, e.g.
+
+{"t":12.345,"type":"Progress","ip":"192.168.3.1","timestamp":1700000000.1,"percent":40}
+
+Ips are recorded as control ips, so that a recording can be replayed
+without the inventory it was made with. The recorder reads the bus
+through its own cursor, so it sees the same events as the display would.
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import json
+import time
+import asyncio
+
+from rhubarbe.version import __version__
+from rhubarbe.events import Progress, Tick, Status, Retcod, Info
+
+EVENT_CLASSES = {klass.__name__: klass
+                 for klass in (Progress, Tick, Status, Retcod, Info)}
+
+
+def event_to_record(event):
+    record = {'type': type(event).__name__,
+              'ip': event.ip,
+              'timestamp': round(event.timestamp, 3)}
+    record.update(event.fields())
+    return record
+
+
+def event_from_record(record):
+    record = dict(record)
+    klass = EVENT_CLASSES[record.pop('type')]
+    timestamp = record.pop('timestamp')
+    record.pop('t', None)
+    event = klass(**record)
+    event.timestamp = timestamp
+    return event
+
+
+class Recorder:
+
+    def __init__(self, path, nodes, message_bus, command=None):
+        self.path = path
+        self.nodes = nodes
+        self.command = command
+        # subscribe right away, not to miss the first events
+        self.cursor = message_bus.subscribe('recorder')
+        self.origin = time.monotonic()
+        # any ip -> control ip
+        self._control_ips = {}
+
+    def control_ip(self, ipaddr):
+        if ipaddr is None:
+            return None
+        if ipaddr not in self._control_ips:
+            from rhubarbe.inventory import Inventory
+            self._control_ips[ipaddr] = \
+                Inventory().control_ip_from_any_ip(ipaddr) or ipaddr
+        return self._control_ips[ipaddr]
+
+    def header(self):
+        return {'type': 'header',
+                'rhubarbe': __version__,
+                'command': self.command,
+                'time': round(time.time(), 3),
+                'nodes': [{'name': node.control_hostname(),
+                           'ip': node.control_ip_address()}
+                          for node in self.nodes]}
+
+    async def run(self):
+        # line-buffered, so that the recording survives a crash
+        with open(self.path, 'w', buffering=1) as output:
+            output.write(json.dumps(self.header(),
+                                    separators=(',', ':')) + "\n")
+            while True:
+                event = await self.cursor.get()
+                if event == 'END-DISPLAY':
+                    return
+                record = {'t': round(time.monotonic() - self.origin, 4)}
+                record.update(event_to_record(event))
+                record['ip'] = self.control_ip(event.ip)
+                output.write(json.dumps(record,
+                                        separators=(',', ':')) + "\n")
+
+
+class RecordedNode:
+    """
+    a stand-in for rhubarbe.node.Node, that is enough for a display
+    """
+
+    def __init__(self, name, ipaddr):
+        self.name = name
+        self.ipaddr = ipaddr
+
+    def __repr__(self):
+        return f"<RecordedNode {self.name}>"
+
+    def control_hostname(self):
+        return self.name
+
+    def control_ip_address(self):
+        return self.ipaddr
+
+
+def read_recording(path):
+    """
+    returns a tuple header, events, where events is a list of
+    tuples (t, event)
+    """
+    with open(path) as feed:
+        header = json.loads(next(feed))
+        events = []
+        for line in feed:
+            record = json.loads(line)
+            events.append((record['t'], event_from_record(record)))
+    return header, events
+
+
+async def replay(events, message_bus, speed=1.):
+    """
+    sends events on the bus, at their original pace if speed is 1,
+    or that many times faster; with speed 0, as fast as possible
+    """
+    origin = time.monotonic()
+    for timestamp, event in events:
+        if speed:
+            delay = timestamp / speed - (time.monotonic() - origin)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        # like if it happened now
+        event.timestamp = time.time()
+        await message_bus.put(event)
@@ -0,0 +1,164 @@
+"""
+Running a shell command on a set of nodes, like in
+rhubarbe exec 1-4 -- uname -r
+
+The command runs on all nodes at the same time, within the limit of
+a window; each node gets its own ssh connection, or reuses the OpenSSH
+master connection left behind by rhubarbe wait --control-master if any.
+
+The output is printed as it comes, one line at a time, prefixed with
+the node name, or as JSON lines; once done, each node gets a result
+with the command's exit status.
+"""
+
+# c0111 no docstrings yet
+# w0703 catch Exception
+# pylint: disable=c0111, w0703
+
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+from asynciojobs import Scheduler, Job
+
+from rhubarbe.ssh import SshProxy, OPENSSH_OPTIONS
+
+
+class LineSplitter:
+    """
+    accumulates chunks of text, and calls on_line with each full line;
+    only the last, incomplete, line is kept
+    """
+
+    def __init__(self, on_line):
+        self.on_line = on_line
+        self.pending = ""
+
+    def feed(self, data):
+        lines = (self.pending + data).split("\n")
+        self.pending = lines.pop()
+        for line in lines:
+            self.on_line(line)
+
+    def flush(self):
+        if self.pending:
+            self.on_line(self.pending)
+            self.pending = ""
+
+
+class RemoteCommand:
+
+    def __init__(self, nodes, command,                  # pylint: disable=r0913
+                 window=None, timeout=None, json_output=False,
+                 connect_timeout=10.):
+        self.nodes = nodes
+        self.command = command
+        self.window = window
+        self.timeout = timeout
+        self.json_output = json_output
+        self.connect_timeout = connect_timeout
+        # node name -> exit status, None if the command could not run
+        self.results = {}
+
+    @staticmethod
+    def emit(record):
+        print(json.dumps(record, separators=(',', ':')), flush=True)
+
+    def output_line(self, name, line, stderr):
+        if self.json_output:
+            self.emit({'node': name, 'type': 'output',
+                       'stream': 'stderr' if stderr else 'stdout',
+                       'line': line})
+        else:
+            print(f"{name}:{line}",
+                  file=sys.stderr if stderr else sys.stdout, flush=True)
+
+    def output_result(self, name, retcod, duration):
+        self.results[name] = retcod
+        if self.json_output:
+            self.emit({'node': name, 'type': 'result', 'retcod': retcod,
+                       'duration': round(duration, 3)})
+
+    async def run_with_asyncssh(self, ssh, name):
+        if not await ssh.connect(self.connect_timeout):
+            return None
+        splitters = {stderr: LineSplitter(
+            lambda line, stderr=stderr: self.output_line(name, line, stderr))
+                     for stderr in (False, True)}
+        try:
+            return await ssh.run_streaming(
+                self.command,
+                lambda data, stderr: splitters[stderr].feed(data))
+        finally:
+            for splitter in splitters.values():
+                splitter.flush()
+            await ssh.close()
+
+    async def run_with_master(self, ssh, name, control_path):
+        # in case the master is gone, ssh connects by itself,
+        # and must then neither prompt nor hang
+        process = await asyncio.create_subprocess_exec(
+            'ssh', '-S', control_path, *OPENSSH_OPTIONS,
+            '-o', f'ConnectTimeout={max(1, round(self.connect_timeout))}',
+            '-p', str(ssh.port),
+            '-l', ssh.username, ssh.hostname, self.command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+
+        async def relay(stream, stderr):
+            async for line in stream:
+                self.output_line(
+                    name, line.decode(errors='replace').rstrip("\n"), stderr)
+
+        await asyncio.gather(relay(process.stdout, False),
+                             relay(process.stderr, True))
+        return await process.wait()
+
+    async def run_on_node(self, node):
+        name = node.control_hostname()
+        ssh = SshProxy(node)
+        beg = time.monotonic()
+        retcod = None
+        try:
+            control_path = ssh.control_path()
+            if Path(control_path).is_socket():
+                retcod = await self.run_with_master(ssh, name, control_path)
+            else:
+                retcod = await self.run_with_asyncssh(ssh, name)
+        except Exception as exc:
+            self.output_line(name, f"rhubarbe exec: {exc}", True)
+        finally:
+            self.output_result(name, retcod, time.monotonic() - beg)
+        return retcod
+
+    def run(self):
+        """
+        returns True if the command succeeded on all nodes
+        """
+        jobs = [Job(self.run_on_node(node), critical=False)
+                for node in self.nodes]
+        scheduler = Scheduler(*jobs, jobs_window=self.window,
+                              timeout=self.timeout, critical=False)
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            print("rhubarbe-exec : keyboard interrupt - exiting",
+                  file=sys.stderr)
+        # nodes that did not even get a result
+        for node in self.nodes:
+            name = node.control_hostname()
+            if name not in self.results:
+                self.output_result(name, None, 0.)
+        failed = [name for name, retcod in self.results.items()
+                  if retcod != 0]
+        if failed and not self.json_output:
+            details = (f"{name}({self.results[name]})"
+                       if self.results[name] is not None
+                       else f"{name}(no status)"
+                       for name in failed)
+            print("rhubarbe-exec : failed on " + " ".join(details),
+                  file=sys.stderr)
+        return not failed
@@ -0,0 +1,50 @@
+"""
+The CMC cards of all simulated nodes
+
+A single aiohttp application listens on the CMC address of every node,
+and finds out which node is targetted from the local address
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import random
+import asyncio
+
+from aiohttp import web
+
+
+class SimulatedCmcs:
+
+    def __init__(self, testbed):
+        self.testbed = testbed
+        self.nodes_by_ip = {node.cmc_ip: node for node in testbed.nodes}
+        self.runner = None
+        # how many requests were received
+        self.counter = 0
+
+    async def handle(self, request):
+        self.counter += 1
+        local_ip, *_ = request.transport.get_extra_info('sockname')
+        node = self.nodes_by_ip[local_ip]
+        latency = self.testbed.cmc_latency
+        if latency:
+            await asyncio.sleep(latency * (0.5 + random.random()))
+        if random.random() < self.testbed.cmc_failure_rate:
+            raise web.HTTPInternalServerError()
+        text = await node.cmc_verb(request.match_info['verb'])
+        return web.Response(text=text)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{verb}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        for ipaddr in self.nodes_by_ip:
+            site = web.TCPSite(self.runner, ipaddr, self.testbed.cmc_port)
+            await site.start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,169 @@
+"""
+A simulated node, as seen through its CMC card and its control interface
+
+* powering on or resetting the node triggers a boot sequence
+* at the end of the boot, like the real thing, the node checks for
+  its nextboot symlink in the pxelinux directory; if it's there
+  the node runs the frisbee image and starts a telnet server,
+  otherwise it runs its regular OS and starts an ssh server (optional)
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# pylint: disable=c0111, w0703, w1202
+
+import random
+import asyncio
+from pathlib import Path
+
+import telnetlib3
+
+from rhubarbe.logger import logger
+from rhubarbe.simulator.telnet import FrisbeeShell
+
+
+class SimulatedNode:                                    # pylint: disable=r0902
+
+    def __init__(self, rank, testbed):
+        self.rank = rank
+        self.testbed = testbed
+        # the addresses that go in the inventory
+        self.cmc_ip = f"127.20.{rank >> 8}.{rank & 255}"
+        self.control_ip = f"127.10.{rank >> 8}.{rank & 255}"
+        self.mac = f"02:00:00:00:{rank >> 8:02x}:{rank & 255:02x}"
+        # state
+        self.power = 'on' if testbed.start_on else 'off'
+        self.usrp = 'off'
+        # None when off, otherwise 'booting', 'os' or 'frisbee'
+        self.mode = None
+        self._boot_task = None
+        self._telnet_server = None
+        self._ssh_server = None
+        # path -> size, for the files received over ssh
+        self.files = {}
+
+    def __repr__(self):
+        return f"<SimulatedNode #{self.rank} {self.power} {self.mode}>"
+
+    def inventory_entry(self):
+        regularname, rebootname = (self.testbed.regularname,
+                                   self.testbed.rebootname)
+        return {
+            'cmc': {
+                'hostname': f"{rebootname}{self.rank:02}",
+                'ip': self.cmc_ip,
+                'mac': f"02:00:00:01:{self.rank >> 8:02x}:"
+                       f"{self.rank & 255:02x}",
+            },
+            'control': {
+                'hostname': f"{regularname}{self.rank:02}",
+                'ip': self.control_ip,
+                'mac': self.mac,
+            },
+        }
+
+    def nextboot_symlink(self):
+        # same naming scheme as Node.manage_nextboot_symlink
+        return (Path(self.testbed.pxelinux_dir)
+                / ("01-" + self.mac.replace(':', '-')))
+
+    ##########
+    async def cmc_verb(self, verb):
+        """
+        the text that the CMC answers for that verb
+        """
+        if verb == 'status':
+            return self.power
+        if verb == 'usrpstatus':
+            return f"usrp{self.usrp}"
+        if verb == 'info':
+            return (f"simulated node #{self.rank}\n"
+                    f"power={self.power}\nmode={self.mode}\n")
+        if verb == 'on':
+            if self.power != 'on':
+                self.power = 'on'
+                await self.boot()
+            return 'ok'
+        if verb == 'off':
+            self.power = 'off'
+            await self.shutdown()
+            return 'ok'
+        if verb == 'reset':
+            if self.power != 'on':
+                return 'error'
+            await self.boot()
+            return 'ok'
+        if verb in ('usrpon', 'usrpoff'):
+            self.usrp = verb.replace('usrp', '')
+            return 'ok'
+        return 'unknown'
+
+    ##########
+    async def shutdown(self):
+        if self._boot_task:
+            self._boot_task.cancel()
+            self._boot_task = None
+        await self.stop_services()
+        self.mode = None
+
+    async def boot(self):
+        await self.shutdown()
+        self.mode = 'booting'
+        self._boot_task = asyncio.ensure_future(self._boot())
+
+    async def _boot(self):
+        delay = self.testbed.boot_delay * (0.5 + random.random())
+        await asyncio.sleep(delay)
+        self._boot_task = None
+        try:
+            # the symlink points to a relative name, so it is dangling here
+            if self.nextboot_symlink().is_symlink():
+                self.mode = 'frisbee'
+                await self.start_telnet()
+            else:
+                self.mode = 'os'
+                if self.testbed.with_ssh:
+                    await self.start_ssh()
+        except Exception:
+            logger.exception(f"{self} could not start its services")
+
+    async def start_telnet(self):
+        def shell(reader, writer):
+            return FrisbeeShell(self, reader, writer).run()
+        self._telnet_server = await telnetlib3.create_server(
+            host=self.control_ip, port=self.testbed.telnet_port,
+            shell=shell)
+
+    async def start_ssh(self):
+        # do not import at toplevel, ssh is optional
+        from rhubarbe.simulator.ssh import start_ssh_server
+        self._ssh_server = await start_ssh_server(self)
+
+    async def stop_services(self):
+        if self._telnet_server:
+            self._telnet_server.close()
+            self._telnet_server = None
+        if self._ssh_server:
+            self._ssh_server.close()
+            self._ssh_server = None
+
+    ##########
+    def probe_output(self, command):
+        """
+        what the node answers to an ssh command
+        only the probe issued by monitornodes gets a meaningful answer
+        """
+        if 'os_release=' not in command:
+            return ""
+        lines = [
+            "os_release=ubuntu-18.04",
+            "gnuradio_release=none",
+            f"image_radical={self.testbed.image_radical}",
+            "uname=4.15.0-simulated",
+        ]
+        if 'wlan' in command:
+            # a node receiving about 1 Mbps
+            counter = int(asyncio.get_event_loop().time() * 125000)
+            lines += [f"wlan0_rx_bytes={counter}", "wlan0_tx_bytes=0"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,253 @@
+"""
+A stand-in for the PLCAPI service, over an in-memory dataset
+
+Implements the subset of the XMLRPC API that rhubarbe uses, i.e.
+GetSession, GetLeases, AddLeases, UpdateLeases, DeleteLeases,
+GetSlices, GetPersons and GetKeys; authentication is not checked.
+"""
+
+# c0111 no docstrings yet
+# c0103 method names are the PLCAPI ones
+# w0703 catch Exception
+# pylint: disable=c0111, c0103, w0703
+
+import time
+import random
+import asyncio
+import threading
+from xmlrpc.client import loads, dumps, Fault
+
+from aiohttp import web
+
+from rhubarbe.config import Config
+
+# as per PLC/Faults.py
+PLC_INVALID_API_METHOD = 100
+PLC_INVALID_ARGUMENT = 102
+
+LEASE_DURATION = 3600
+
+
+def _columns(record, columns):
+    if not columns:
+        return dict(record)
+    return {column: record[column] for column in columns if column in record}
+
+
+def _matches(record, key, the_filter):
+    """
+    the_filter can be None, a list of ids, or a dict of exact values
+    """
+    if not the_filter:
+        return True
+    if isinstance(the_filter, list):
+        return record[key] in the_filter
+    for column, value in the_filter.items():
+        if isinstance(value, list):
+            if record.get(column) not in value:
+                return False
+        elif record.get(column) != value:
+            return False
+    return True
+
+
+class PlcDataset:
+    """
+    slices have 1 to 3 persons, persons have one key, and leases
+    last one hour each, back to back, centered on now;
+    the dataset is reproducible for a given seed
+    """
+
+    def __init__(self, nb_slices=100, nb_persons=100, nb_leases=100,
+                 seed=0):
+        hostname = Config().value('plcapi', 'leases_hostname')
+        randomizer = random.Random(seed)
+        self.keys = [{'key_id': key_id,
+                      'key': f"ssh-rsa AAAAB3Nza{key_id:08d} person{key_id}"}
+                     for key_id in range(1, nb_persons+1)]
+        self.persons = [{'person_id': person_id,
+                         'email': f"person{person_id}@example.org",
+                         'key_ids': [person_id],
+                         'slice_ids': []}
+                        for person_id in range(1, nb_persons+1)]
+        self.slices = []
+        for slice_id in range(1, nb_slices+1):
+            persons = randomizer.sample(self.persons,
+                                        min(nb_persons,
+                                            randomizer.randint(1, 3)))
+            for person in persons:
+                person['slice_ids'].append(slice_id)
+            self.slices.append({
+                'slice_id': slice_id,
+                'name': f"inria_slice{slice_id}",
+                'expires': int(time.time()) + 30 * 24 * 3600,
+                'person_ids': [person['person_id'] for person in persons]})
+        now = int(time.time())
+        first = now - now % LEASE_DURATION - (nb_leases // 2) * LEASE_DURATION
+        self.leases = []
+        for rank in range(nb_leases):
+            self.leases.append({
+                'lease_id': rank + 1,
+                'hostname': hostname,
+                'name': randomizer.choice(self.slices)['name']
+                        if self.slices else 'inria_admin',
+                't_from': first + rank * LEASE_DURATION,
+                't_until': first + (rank+1) * LEASE_DURATION})
+        self.next_lease_id = nb_leases + 1
+
+    def __repr__(self):
+        return (f"<PlcDataset {len(self.slices)} slices,"
+                f" {len(self.persons)} persons, {len(self.leases)} leases>")
+
+    # the PLCAPI methods, auth excluded
+    def GetSession(self):
+        return f"simulated-session-{random.getrandbits(64):x}"
+
+    @staticmethod
+    def _lease_matches(lease, the_filter):
+        if not isinstance(the_filter, dict):
+            return _matches(lease, 'lease_id', the_filter)
+        the_filter = dict(the_filter)
+        alive = the_filter.pop('alive', None)
+        if alive is not None and not (
+                lease['t_from'] <= alive < lease['t_until']):
+            return False
+        day = the_filter.pop('day', None)
+        if day is not None:
+            midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+            beg = midnight + day * 24 * 3600
+            end = beg + 24 * 3600
+            if lease['t_until'] <= beg or lease['t_from'] >= end:
+                return False
+        return _matches(lease, 'lease_id', the_filter)
+
+    def GetLeases(self, the_filter=None, columns=None):
+        return [_columns(lease, columns) for lease in self.leases
+                if self._lease_matches(lease, the_filter)]
+
+    def _overlaps(self, hostname, t_from, t_until, ignore_id=None):
+        return any(lease['hostname'] == hostname
+                   and lease['lease_id'] != ignore_id
+                   and lease['t_from'] < t_until
+                   and t_from < lease['t_until']
+                   for lease in self.leases)
+
+    def AddLeases(self, hostnames, slicename, t_from, t_until):
+        new_ids, errors = [], []
+        if t_from >= t_until:
+            return {'new_ids': [], 'errors': ["empty time range"]}
+        for hostname in hostnames:
+            if self._overlaps(hostname, t_from, t_until):
+                errors.append(f"overlapping lease on {hostname}")
+                continue
+            self.leases.append({'lease_id': self.next_lease_id,
+                                'hostname': hostname, 'name': slicename,
+                                't_from': t_from, 't_until': t_until})
+            new_ids.append(self.next_lease_id)
+            self.next_lease_id += 1
+        return {'new_ids': new_ids, 'errors': errors}
+
+    def UpdateLeases(self, lease_ids, fields):
+        updated_ids, errors = [], []
+        for lease in self.leases:
+            if lease['lease_id'] not in lease_ids:
+                continue
+            t_from = fields.get('t_from', lease['t_from'])
+            t_until = fields.get('t_until', lease['t_until'])
+            if t_from >= t_until or self._overlaps(
+                    lease['hostname'], t_from, t_until,
+                    ignore_id=lease['lease_id']):
+                errors.append(f"cannot update lease {lease['lease_id']}")
+                continue
+            lease['t_from'], lease['t_until'] = t_from, t_until
+            updated_ids.append(lease['lease_id'])
+        return {'updated_ids': updated_ids, 'errors': errors}
+
+    def DeleteLeases(self, lease_ids):
+        self.leases = [lease for lease in self.leases
+                       if lease['lease_id'] not in lease_ids]
+        return 1
+
+    def GetSlices(self, the_filter=None, columns=None):
+        return [_columns(plc_slice, columns) for plc_slice in self.slices
+                if _matches(plc_slice, 'slice_id', the_filter)]
+
+    def GetPersons(self, the_filter=None, columns=None):
+        return [_columns(person, columns) for person in self.persons
+                if _matches(person, 'person_id', the_filter)]
+
+    def GetKeys(self, the_filter=None, columns=None):
+        return [_columns(key, columns) for key in self.keys
+                if _matches(key, 'key_id', the_filter)]
+
+
+class SimulatedPlcApi:
+
+    METHODS = ('GetSession', 'GetLeases', 'AddLeases', 'UpdateLeases',
+               'DeleteLeases', 'GetSlices', 'GetPersons', 'GetKeys')
+
+    def __init__(self, dataset, port, latency=0.):
+        self.dataset = dataset
+        self.port = port
+        self.latency = latency
+        self.runner = None
+        # how many requests were received
+        self.counter = 0
+
+    def url(self):
+        return f"http://127.0.0.1:{self.port}/PLCAPI/"
+
+    def call(self, method, params):
+        if method not in self.METHODS:
+            raise Fault(PLC_INVALID_API_METHOD,
+                        f"Invalid method {method}")
+        # first param is auth
+        try:
+            return getattr(self.dataset, method)(*params[1:])
+        except TypeError as exc:
+            raise Fault(PLC_INVALID_ARGUMENT, str(exc))
+
+    async def handle(self, request):
+        self.counter += 1
+        params, method = loads(await request.read(), use_builtin_types=True)
+        if self.latency:
+            await asyncio.sleep(self.latency * (0.5 + random.random()))
+        try:
+            response = dumps((self.call(method, params),),
+                             methodresponse=True, allow_none=True)
+        except Fault as fault:
+            response = dumps(fault, methodresponse=True)
+        except Exception as exc:
+            response = dumps(Fault(PLC_INVALID_ARGUMENT, str(exc)),
+                             methodresponse=True)
+        return web.Response(text=response, content_type='text/xml')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/PLCAPI/', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', self.port)
+        await site.start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def start_in_thread(self):
+        """
+        for synchronous code: serve from a separate thread
+        """
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait()
+        return thread
@@ -0,0 +1,46 @@
+"""
+A stand-in for the sidecar service, that only counts what it receives
+"""
+
+# c0111 no docstrings yet
+# w0703 catch Exception
+# pylint: disable=c0111, w0703
+
+import json
+
+import websockets
+
+
+class SidecarSink:
+
+    def __init__(self, port):
+        self.port = port
+        self.server = None
+        self.frames = 0
+        self.infos = 0
+        self.bytes = 0
+
+    def url(self):
+        return f"ws://127.0.0.1:{self.port}/"
+
+    async def handle(self, websocket, *_):
+        try:
+            async for message in websocket:
+                self.frames += 1
+                self.bytes += len(message)
+                try:
+                    self.infos += len(json.loads(message)['message'])
+                except Exception:
+                    pass
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def start(self):
+        self.server = await websockets.serve(self.handle,
+                                             '127.0.0.1', self.port)
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
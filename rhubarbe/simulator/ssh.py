@@ -0,0 +1,134 @@
+"""
+The ssh server of a simulated node running its regular OS
+
+No authentication is required, and the only commands that get a
+meaningful answer are
+
+* the probe issued by monitornodes
+* the ones issued by rhubarbe push, i.e. receiving a file with
+  'cat > path', and relaying it to another node with
+  'ssh ... user@host 'cat > path' < path'; files are not stored,
+  the node only remembers their size, and relays as many zeros
+
+All the data sent from a given ip - the gateway or a node - goes
+through the testbed's throttle for that ip, which emulates its uplink
+"""
+
+# c0111 no docstrings yet
+# w0703 catch Exception
+# pylint: disable=c0111, w0703
+
+import shlex
+import asyncio
+
+import asyncssh
+
+CHUNK_SIZE = 256 * 2**10
+
+# one host key is enough for all simulated nodes
+_HOST_KEY = None
+
+
+def host_key():
+    global _HOST_KEY                                    # pylint: disable=w0603
+    if _HOST_KEY is None:
+        _HOST_KEY = asyncssh.generate_private_key('ssh-ed25519')
+    return _HOST_KEY
+
+
+class SimulatedSSHServer(asyncssh.SSHServer):
+
+    def begin_auth(self, username):
+        # no authentication required
+        return False
+
+
+class Throttle:
+    """
+    a link shared by all the data sent from one ip, at that many
+    bytes per second; 0 means unlimited
+    """
+
+    def __init__(self, bandwidth):
+        self.bandwidth = bandwidth
+        # when the link is done with what it has already been given
+        self.busy_until = 0.
+
+    async def consume(self, nbytes):
+        if not self.bandwidth:
+            return
+        now = asyncio.get_event_loop().time()
+        self.busy_until = max(now, self.busy_until) + nbytes / self.bandwidth
+        await asyncio.sleep(self.busy_until - now)
+
+
+async def receive_file(node, process, path):
+    peer = process.get_extra_info('peername')[0]
+    throttle = node.testbed.throttle(peer)
+    size = 0
+    while True:
+        chunk = await process.stdin.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        await throttle.consume(len(chunk))
+        size += len(chunk)
+    node.files[path] = size
+    process.exit(0)
+
+
+async def relay_file(node, process, tokens):
+    """
+    tokens is the split command, like
+    ssh <options> -p port user@host 'cat > path' < path
+    """
+    source = tokens[tokens.index('<') + 1]
+    remote = tokens[tokens.index('<') - 1]
+    port = int(tokens[tokens.index('-p') + 1])
+    username, host = next(token for token in tokens
+                          if '@' in token).split('@')
+    if source not in node.files:
+        process.stderr.write(f"{source}: No such file\n".encode())
+        process.exit(1)
+        return
+    size = node.files[source]
+    try:
+        async with asyncssh.connect(
+                host, port, username=username, known_hosts=None,
+                local_addr=(node.control_ip, 0)) as conn:
+            remote_process = await conn.create_process(remote, encoding=None)
+            zeros = CHUNK_SIZE * b'\0'
+            for offset in range(0, size, CHUNK_SIZE):
+                remote_process.stdin.write(
+                    zeros[:min(CHUNK_SIZE, size - offset)])
+                await remote_process.stdin.drain()
+            remote_process.stdin.write_eof()
+            completed = await remote_process.wait()
+            process.exit(completed.exit_status)
+    except Exception as exc:
+        process.stderr.write(f"ssh: {host}: {exc}\n".encode())
+        process.exit(255)
+
+
+async def start_ssh_server(node):
+    """
+    start listening on the node's control interface
+    returns an object that can be close()d
+    """
+    async def process_factory(process):
+        command = process.command or ""
+        try:
+            tokens = shlex.split(command)
+        except ValueError:
+            tokens = []
+        if len(tokens) == 3 and tokens[:2] == ['cat', '>']:
+            await receive_file(node, process, tokens[2])
+        elif tokens[:1] == ['ssh'] and '<' in tokens:
+            await relay_file(node, process, tokens)
+        else:
+            process.stdout.write(node.probe_output(command).encode())
+            process.exit(0)
+
+    return await asyncssh.create_server(
+        SimulatedSSHServer, node.control_ip, node.testbed.ssh_port,
+        server_host_keys=[host_key()],
+        process_factory=process_factory, encoding=None)
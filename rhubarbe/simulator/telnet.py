@@ -0,0 +1,126 @@
+"""
+What runs behind the telnet server of a simulated node in frisbee mode
+
+Commands are read one line at a time, and we emulate
+
+* the frisbee client, with an output that FrisbeeParser understands
+* imagezip piped into netcat, by sending bytes to the collector
+* 'echo _TELNET_STATUS=$?' and 'exit' as used by TelnetProxy.session()
+
+anything else is just deemed successful
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# w0703 catch Exception
+# pylint: disable=c0111, w0703, w1202
+
+import re
+import random
+import asyncio
+
+from rhubarbe.logger import logger
+
+# frisbee -i 127.10.0.1 -m 234.5.6.1 -p 10001 /dev/sda
+FRISBEE_MATCHER = re.compile(r"\S*frisbee\s.*-m\s+\S+\s+-p\s+\d+")
+# imagezip -o -z1 /dev/sda - | nc 127.0.0.1 10001
+IMAGEZIP_MATCHER = re.compile(
+    r"\S*imagezip\s.*\|\s*\S+\s+(?P<server>\S+)\s+(?P<port>\d+)\s*$")
+
+# what we pretend the image size is, in 1MiB chunks
+CHUNKS = 1000
+CHUNK_SIZE = 2**20
+# how many progress lines are issued
+STEPS = 20
+
+
+class FrisbeeShell:
+
+    def __init__(self, node, reader, writer):
+        self.node = node
+        self.reader = reader
+        self.writer = writer
+        self.last_status = 0
+
+    def write_line(self, line):
+        self.writer.write(line + "\r\n")
+
+    async def run(self):
+        line = ""
+        try:
+            while True:
+                incoming = await self.reader.read(1024)
+                if not incoming:
+                    break
+                for char in incoming:
+                    if char not in "\r\n":
+                        line += char
+                        continue
+                    if not line:
+                        continue
+                    command, line = line.strip(), ""
+                    if command == 'exit':
+                        return
+                    await self.run_command(command)
+        except Exception:
+            logger.exception(f"{self.node}: telnet shell failed")
+        finally:
+            self.writer.close()
+
+    async def run_command(self, command):
+        if command.startswith("echo _TELNET_STATUS="):
+            self.write_line(f"_TELNET_STATUS={self.last_status}")
+            return
+        if FRISBEE_MATCHER.match(command):
+            self.last_status = await self.frisbee()
+            return
+        match = IMAGEZIP_MATCHER.match(command)
+        if match:
+            self.last_status = await self.imagezip(
+                match.group('server'), int(match.group('port')))
+            return
+        self.last_status = 0
+
+    def duration(self):
+        return self.node.testbed.frisbee_duration * (0.5 + random.random())
+
+    def fails(self):
+        return random.random() < self.node.testbed.frisbee_failure_rate
+
+    async def frisbee(self):
+        self.write_line(f"Joined the team after 0.1 sec. "
+                        f"ID is {self.node.rank}. "
+                        f"File is {CHUNKS} chunks ({CHUNKS*CHUNK_SIZE} bytes)")
+        step_duration = self.duration() / STEPS
+        fails = self.fails()
+        for step in range(1, STEPS+1):
+            await asyncio.sleep(step_duration)
+            if fails and step == STEPS // 2:
+                self.write_line("Short write, disk is full")
+                return 1
+            remaining = CHUNKS * (STEPS - step) // STEPS
+            self.write_line(f"{64*'.'} {int(step*step_duration)} {remaining}")
+        self.write_line(f"Wrote {CHUNKS*CHUNK_SIZE} bytes "
+                        f"({CHUNKS*CHUNK_SIZE // 2} actual)")
+        return 0
+
+    async def imagezip(self, server, port):
+        """
+        send a few megabytes to the collector
+        """
+        try:
+            _, writer = await asyncio.open_connection(server, port)
+        except OSError as exc:
+            logger.warning(f"{self.node}: cannot reach collector: {exc}")
+            return 1
+        step_duration = self.duration() / STEPS
+        fails = self.fails()
+        for step in range(1, STEPS+1):
+            await asyncio.sleep(step_duration)
+            if fails and step == STEPS // 2:
+                writer.close()
+                return 1
+            writer.write(CHUNK_SIZE // 4 * b'\0')
+            await writer.drain()
+        writer.close()
+        return 0
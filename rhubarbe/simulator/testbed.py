@@ -0,0 +1,235 @@
+"""
+A simulated testbed that runs entirely on localhost
+
+All nodes get their own loopback addresses (127.20.x.y for the CMC,
+127.10.x.y for the control interface), so that the regular rhubarbe
+commands can run against the simulator, without any change other than
+a config overlay.
+
+The simulator writes in its working directory
+
+* inventory-nodes.json and inventory-phones.json
+* pxelinux.cfg/ where the nextboot symlinks get created
+* images/ with a dummy default image
+* bin/ with stand-ins for frisbeed and nc
+* rhubarbe.conf, an overlay that points at all the above,
+  and at the stand-in PLCAPI service if enabled
+
+so that e.g.
+   cd <workdir>; rhubarbe status -a
+talks to the simulated nodes
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# pylint: disable=c0111, w1202
+
+import os
+import pwd
+import sys
+import json
+import asyncio
+import resource
+from pathlib import Path
+
+from rhubarbe.config import Config
+from rhubarbe.logger import logger
+from rhubarbe.simulator.node import SimulatedNode
+from rhubarbe.simulator.cmc import SimulatedCmcs
+from rhubarbe.simulator.sidecar import SidecarSink
+from rhubarbe.simulator.plcapi import PlcDataset, SimulatedPlcApi
+
+# a frisbeed that stays up until it gets killed
+FAKE_FRISBEED = """#!/bin/sh
+exec sleep 1000000
+"""
+
+# a nc that can only do 'nc [-d] -l ip port', and writes on stdout
+FAKE_NETCAT = """#!{python}
+import sys, socket, shutil
+ip, port = sys.argv[-2], int(sys.argv[-1])
+server = socket.socket()
+server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+server.bind((ip, port))
+server.listen(1)
+conn, _ = server.accept()
+shutil.copyfileobj(conn.makefile('rb'), sys.stdout.buffer)
+"""
+
+
+class SimulatedTestbed:                                 # pylint: disable=r0902
+
+    def __init__(self, nb_nodes, workdir, *,            # pylint: disable=r0913
+                 cmc_port=8080, telnet_port=2323, ssh_port=2222,
+                 sidecar_port=10999, plcapi_port=10080,
+                 cmc_latency=0., cmc_failure_rate=0.,
+                 boot_delay=5., frisbee_duration=10.,
+                 frisbee_failure_rate=0.,
+                 start_on=False, with_ssh=False, with_sidecar=False,
+                 with_plcapi=False, plcapi_size=100, plcapi_latency=0.,
+                 link_bandwidth=0., image_radical="simulated"):
+        the_config = Config()
+        self.regularname = the_config.value('testbed', 'regularname')
+        self.rebootname = the_config.value('testbed', 'rebootname')
+        self.workdir = Path(workdir).absolute()
+        self.pxelinux_dir = self.workdir / "pxelinux.cfg"
+        self.cmc_port = cmc_port
+        self.telnet_port = telnet_port
+        self.ssh_port = ssh_port
+        self.sidecar_port = sidecar_port
+        self.cmc_latency = cmc_latency
+        self.cmc_failure_rate = cmc_failure_rate
+        self.boot_delay = boot_delay
+        self.frisbee_duration = frisbee_duration
+        self.frisbee_failure_rate = frisbee_failure_rate
+        self.start_on = start_on
+        self.with_ssh = with_ssh
+        self.with_sidecar = with_sidecar
+        self.image_radical = image_radical
+        # in MiB/s, the uplink of the gateway and of each node
+        self.link_bandwidth = link_bandwidth
+        self._throttles = {}
+        self.nodes = [SimulatedNode(rank, self)
+                      for rank in range(1, nb_nodes+1)]
+        self.cmcs = SimulatedCmcs(self)
+        self.sidecar = SidecarSink(sidecar_port) if with_sidecar else None
+        self.plcapi = (SimulatedPlcApi(PlcDataset(plcapi_size, plcapi_size,
+                                                  plcapi_size),
+                                       plcapi_port, plcapi_latency)
+                       if with_plcapi else None)
+
+    def throttle(self, ipaddr):
+        """
+        the Throttle for the data sent from that ip
+        """
+        if ipaddr not in self._throttles:
+            from rhubarbe.simulator.ssh import Throttle
+            self._throttles[ipaddr] = Throttle(self.link_bandwidth * 2**20)
+        return self._throttles[ipaddr]
+
+    def __repr__(self):
+        return f"<SimulatedTestbed {len(self.nodes)} nodes in {self.workdir}>"
+
+    ##########
+    def generate(self):
+        """
+        create all the files in workdir
+        """
+        for subdir in ('pxelinux.cfg', 'images', 'bin'):
+            (self.workdir / subdir).mkdir(parents=True, exist_ok=True)
+        with (self.workdir / "inventory-nodes.json").open('w') as output:
+            json.dump([node.inventory_entry() for node in self.nodes],
+                      output, indent=2)
+        with (self.workdir / "inventory-phones.json").open('w') as output:
+            json.dump([], output)
+        # like on the real thing, the nextboot symlinks point at this file
+        frisbee_image = Config().value('pxelinux', 'frisbee_image')
+        (self.pxelinux_dir / frisbee_image).touch()
+        default_image = self.workdir / "images" / "default.ndz"
+        if not default_image.exists():
+            default_image.write_bytes(2**20 * b'\0')
+        for name, contents in (
+                ('frisbeed', FAKE_FRISBEED),
+                ('nc', FAKE_NETCAT.format(python=sys.executable))):
+            path = self.workdir / "bin" / name
+            path.write_text(contents)
+            path.chmod(0o755)
+        with (self.workdir / "rhubarbe.conf").open('w') as output:
+            output.write(self.config_overlay())
+
+    def config_overlay(self):
+        workdir = self.workdir
+        hostname = Config().local_hostname()
+        login = pwd.getpwuid(os.getuid())[0]
+        scope = f"1-{len(self.nodes)}"
+        plcapi = "" if not self.plcapi else f"""
+[plcapi]
+url = {self.plcapi.url()}
+admin_email = admin@example.org
+admin_password = simulated
+"""
+        return f"""# generated by rhubarbe simulator - do not edit
+[testbed]
+inventory_nodes_path = {workdir}/inventory-nodes.json
+inventory_phones_path = {workdir}/inventory-phones.json
+all_scope = {scope}
+all_scope.{hostname} = {scope}
+
+[nodes]
+idle_after_reset = 1
+
+[pxelinux]
+config_dir = {self.pxelinux_dir}
+
+[frisbee]
+images_dir = {workdir}/images
+server = {workdir}/bin/frisbeed
+netcat = {workdir}/bin/nc
+netcat_style = fedora
+
+[networking]
+address_nodes_by = ip
+cmc_port = {self.cmc_port}
+telnet_port = {self.telnet_port}
+ssh_port = {self.ssh_port}
+local_control_ip = 127.0.0.1
+telnet_backoff = 0.5
+ssh_backoff = 0.5
+
+[sidecar]
+url = ws://127.0.0.1:{self.sidecar_port}/
+
+[accounts]
+privileged = root,guest,{login}
+
+[monitor]
+hot_nodes_path = {workdir}/hot-nodes
+{plcapi}"""
+
+    ##########
+    @staticmethod
+    def raise_file_limit():
+        # each node uses a few sockets
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    async def start(self):
+        self.raise_file_limit()
+        await self.cmcs.start()
+        if self.sidecar:
+            await self.sidecar.start()
+        if self.plcapi:
+            await self.plcapi.start()
+        # the nodes that are on from the start need to boot
+        await asyncio.gather(*(node.boot() for node in self.nodes
+                               if node.power == 'on'))
+        logger.info(f"{self} started")
+
+    async def stop(self):
+        await asyncio.gather(*(node.shutdown() for node in self.nodes))
+        await self.cmcs.stop()
+        if self.sidecar:
+            await self.sidecar.stop()
+        if self.plcapi:
+            await self.plcapi.stop()
+
+    def stats(self):
+        modes = {}
+        for node in self.nodes:
+            modes[node.mode] = modes.get(node.mode, 0) + 1
+        text = f"cmc requests={self.cmcs.counter}"
+        text += "".join(f" {mode}={nb}" for mode, nb in sorted(
+            modes.items(), key=lambda mode_nb: str(mode_nb[0])))
+        if self.sidecar:
+            text += (f" sidecar frames={self.sidecar.frames}"
+                     f" infos={self.sidecar.infos}")
+        if self.plcapi:
+            text += f" plcapi requests={self.plcapi.counter}"
+        return text
+
+    async def run_forever(self, period=5):
+        await self.start()
+        while True:
+            await asyncio.sleep(period)
+            logger.info(self.stats())
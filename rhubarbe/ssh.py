@@ -10,13 +10,27 @@ This code still has it, mostly out of laziness
 # r1705 else after return
 # pylint: disable=c0111, w0703, w1202
 
+import time
 import random
 import asyncio
+from pathlib import Path
+
 import asyncssh
 
+from rhubarbe.config import Config
+
 DEBUG = False
 # DEBUG = True
 
+# for the ssh processes we spawn: like connect(), that does
+# not check host keys, and never prompt for anything
+OPENSSH_OPTIONS = [
+    '-o', 'StrictHostKeyChecking=no',
+    '-o', 'UserKnownHostsFile=/dev/null',
+    '-o', 'BatchMode=yes',
+    '-o', 'LogLevel=ERROR',
+]
+
 
 class MySSHClientSession(asyncssh.SSHClientSession):
     """
@@ -26,17 +40,28 @@ class MySSHClientSession(asyncssh.SSHClientSession):
     the corresponding Node object
     """
     def __init__(self, *args, **kwds):
-        self.data = ""
+        # the output comes in chunks, that get joined only once
+        self.chunks = []
         self.node = None
         self.command = None
+        # if set, called with each chunk and a stderr flag
+        self.on_data = None
         super().__init__(*args, **kwds)
 
+    @property
+    def data(self):
+        return "".join(self.chunks)
+
     def data_received(self, data, datatype):
         # not adding a \n since it's already in there
         if DEBUG:
             print('SSS DR: {}:{}-> {} [[of type {}]]'.
                   format(self.node, self.command, data, datatype), end='')
-        self.data += data
+        if self.on_data is not None:
+            self.on_data(data,
+                         datatype == asyncssh.EXTENDED_DATA_STDERR)
+        else:
+            self.chunks.append(data)
 
     def connection_made(self, conn):                    # pylint: disable=w0221
         if DEBUG:
@@ -72,9 +97,14 @@ class SshProxy:
         self.username = username
         self.verbose = verbose
         #
-        self.hostname = self.node.control_hostname()
+        self.hostname = self.node.control_address()
+        self.port = int(Config().value('networking', 'ssh_port'))
         self.status = None
         self.conn, self.client = None, None
+        # set by wait_for, in seconds since it started
+        self.banner_time, self.ready_time = None, None
+        # set by wait_for, the path of the ControlMaster socket if any
+        self.master = None
 
     def __repr__(self):
         return f"SshProxy {self.node}"
@@ -94,8 +124,8 @@ class SshProxy:
         try:
             self.conn, self.client = await asyncio.wait_for(
                 asyncssh.create_connection(
-                    MySSHClient, self.hostname, username=self.username,
-                    known_hosts=None
+                    MySSHClient, self.hostname, port=self.port,
+                    username=self.username, known_hosts=None
                 ),
                 timeout=timeout)
             return True
@@ -111,26 +141,137 @@ class SshProxy:
             self.conn, self.client = None, None
             return False
 
-    async def run(self, command):
+    async def probe_banner(self, timeout=None):
         """
-        Run a command
+        A cheap readiness check, to run before the actual handshake:
+        returns True if the ssh port accepts connections and sends
+        the SSH identification string; no crypto involved
         """
+        async def read_banner(reader):
+            # the server may send other lines before the banner
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return False
+                if line.startswith(b"SSH-"):
+                    return True
+
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.hostname, self.port),
+                timeout=timeout)
+            return await asyncio.wait_for(read_banner(reader),
+                                          timeout=timeout)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def control_path(self):
+        """
+        where to leave an OpenSSH master connection for that node,
+        from the ssh_control_path pattern in the config
+        """
+        pattern = Config().value('networking', 'ssh_control_path')
+        path = pattern.format(user=self.username,
+                              node=self.node.control_hostname(),
+                              port=self.port)
+        return str(Path(path).expanduser())
+
+    @staticmethod
+    async def _ssh_retcod(command, timeout):
+        """
+        run an ssh command with no input and no output
+        returns its exit status, or None if it could not complete
+        """
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL)
+        except OSError:
+            return None
+        try:
+            return await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            return None
+
+    async def start_control_master(self, timeout=10.):
+        """
+        Leave behind an OpenSSH ControlMaster connection to the node,
+        that subsequent ssh sessions can reuse with -S control_path()
+        A master that is already running on that path gets reused,
+        and a stale socket gets removed first
+        Returns the control path, or None if it could not be created
+        """
+        control_path = self.control_path()
+        if Path(control_path).is_socket():
+            check = ['ssh', '-O', 'check', '-S', control_path,
+                     '-p', str(self.port), '-l', self.username,
+                     self.hostname]
+            if await self._ssh_retcod(check, timeout) == 0:
+                return control_path
+            try:
+                Path(control_path).unlink()
+            except OSError:
+                return None
+        persist = Config().value('networking', 'ssh_control_persist')
+        command = [
+            'ssh', '-p', str(self.port), '-l', self.username,
+            '-o', 'ControlMaster=yes',
+            '-o', f'ControlPath={control_path}',
+            '-o', f'ControlPersist={persist}',
+            *OPENSSH_OPTIONS,
+            # no command, and go in the background once authenticated
+            '-N', '-f', self.hostname]
+        try:
+            Path(control_path).parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return None
+        retcod = await self._ssh_retcod(command, timeout)
+        return control_path if retcod == 0 else None
+
+    def _session_class(self, command, on_data=None):
         class ClientsessionClosure(MySSHClientSession):
             def __init__(ssh_client_session,            # pylint: disable=e0213
                          *args, **kwds):
+                super().__init__(*args, **kwds)
                 ssh_client_session.node = self.node
                 ssh_client_session.command = command
-                super().__init__(*args, **kwds)
+                ssh_client_session.on_data = on_data
+        return ClientsessionClosure
 
+    async def run(self, command):
+        """
+        Run a command
+        """
         # print(5*'-', "running on ", self.hostname, ':', command)
         try:
             chan, session = await self.conn.create_session(
-                ClientsessionClosure, command)
+                self._session_class(command), command)
             await chan.wait_closed()
             return session.data
         except Exception:
             return
 
+    async def run_streaming(self, command, on_data):
+        """
+        Run a command, and call on_data(data, stderr) with each chunk
+        of its output as it comes; the output is not kept
+
+        Returns the exit status, or None if the command could not run
+        """
+        try:
+            chan, _ = await self.conn.create_session(
+                self._session_class(command, on_data), command)
+            await chan.wait_closed()
+            return chan.get_exit_status()
+        except Exception:
+            return None
+
     # >>> asyncio.iscoroutine(asyncssh.SSHClientConnection.close)
     # False
     async def close(self):
@@ -139,27 +280,53 @@ class SshProxy:
             await self.conn.wait_closed()
         self.conn = None
 
-    async def wait_for(self, backoff, timeout=1.):
+    async def wait_for(self, backoff, timeout=1.,       # pylint: disable=r0912
+                       probe=True, master=False):
         """
         Wait until the ssh service is usable
+
+        With probe set, the ssh handshake is attempted only once
+        the ssh banner shows up, see probe_banner()
+        With master set, an OpenSSH master connection is left behind,
+        see start_control_master()
         """
         self.status = False
+        self.banner_time, self.ready_time = None, None
+        self.master = None
+        start = time.monotonic()
         while True:
             if self.verbose:
                 await self.node.feedback('ssh_status', "trying to connect")
-            self.status = await self.connect(timeout)
-            if self.status:
-                if self.verbose:
-                    await self.node.feedback('ssh_status', "connection OK")
-                await self.close()
-                return self.status
+            if probe and not await self.probe_banner(timeout):
+                failure = "no ssh banner"
+            else:
+                if probe and self.banner_time is None:
+                    self.banner_time = time.monotonic() - start
+                self.status = await self.connect(timeout)
+                if self.status:
+                    self.ready_time = time.monotonic() - start
+                    if self.verbose:
+                        await self.node.feedback(
+                            'ssh_status',
+                            f"connection OK after {self.ready_time:.2f}s")
+                    await self.close()
+                    if master:
+                        self.master = await self.start_control_master()
+                        if self.verbose:
+                            await self.node.feedback(
+                                'ssh_status',
+                                f"control master in {self.master}"
+                                if self.master
+                                else "could not create control master")
+                    return self.status
+                failure = "cannot connect"
             # random.random() is between 0. and 1.
             # and so as we need something between 0.5 and 1.5
             random_backoff = (0.5 + random.random()) * backoff
             if self.verbose:
                 await self.node.feedback(
                     'ssh_status',
-                    f"cannot connect, backing off for {random_backoff:.3}s")
+                    f"{failure}, backing off for {random_backoff:.3}s")
             await asyncio.sleep(random_backoff)
 
 
@@ -24,6 +24,8 @@ import telnetlib3
 
 from rhubarbe.logger import logger
 from rhubarbe.config import Config
+from rhubarbe.tracer import Tracer
+from rhubarbe.events import make_event
 
 MAX_BUF = 16 * 1024
 
@@ -68,7 +70,7 @@ class TelnetProxy:
 
 
     async def feedback(self, field, msg):
-        await self.message_bus.put({'ip': self.control_ip, field: msg})
+        await self.message_bus.put(make_event(field, msg, ip=self.control_ip))
 
 
     async def try_to_connect(self):
@@ -79,13 +81,16 @@ class TelnetProxy:
 
         await self.feedback('frisbee_status', "trying to telnet..")
         logger.info(f"Trying to telnet on {self.control_ip}")
+        tracer = Tracer()
         try:
-            self._reader, self._writer = await asyncio.wait_for(
-                telnetlib3.open_connection(
-                    self.control_ip, 23, shell=None, log=logger,
-                    connect_minwait=self.connect_minwait,
-                    connect_maxwait=self.connect_maxwait),
-                timeout = self.connect_timeout)
+            with tracer.span(self.control_ip, 'telnet attempt'):
+                self._reader, self._writer = await asyncio.wait_for(
+                    telnetlib3.open_connection(
+                        self.control_ip, self.port, shell=None, log=logger,
+                        connect_minwait=self.connect_minwait,
+                        connect_maxwait=self.connect_maxwait),
+                    timeout = self.connect_timeout)
+            tracer.mark(self.control_ip, 'telnet connected')
         except (asyncio.TimeoutError, OSError) as exc:
             self._reader, self._writer = None, None
         except Exception as exc:
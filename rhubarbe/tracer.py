@@ -0,0 +1,145 @@
+"""
+Per-phase timing of what happens during load and save
+
+Each node - and the server side - is a track, on which we record
+
+* spans, i.e. phases that have a beginning and an end,
+  like waiting for telnet, or running frisbee; a span is deemed failed
+  if it ends with an exception, or has not ended yet when saving
+* marks, i.e. instant events, like the first percent reported by frisbee
+
+All timestamps are monotonic, relative to when the tracer was enabled.
+The result can be saved in the Chrome trace format, that can be viewed in
+chrome://tracing or https://ui.perfetto.dev, and summarized as a table.
+
+The tracer is disabled until enable() gets called, and until then
+recording is a no-op.
+"""
+
+# c0111 no docstrings yet
+# pylint: disable=c0111
+
+import time
+import json
+from contextlib import contextmanager
+
+from rhubarbe.singleton import Singleton
+
+# the track used for the server side, frisbeed or the collector
+SERVER_TRACK = 'server'
+
+
+class Tracer(metaclass=Singleton):
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.monotonic()
+        # lists [track, name, start, end, failed]
+        self.spans = []
+        # tuples (track, name, timestamp)
+        self.marks = []
+
+    def enable(self):
+        self.enabled = True
+        self.origin = time.monotonic()
+
+    def now(self):
+        return time.monotonic() - self.origin
+
+    @contextmanager
+    def span(self, track, name):
+        """
+        use as a context manager around a phase on that track
+        """
+        if not self.enabled:
+            yield
+            return
+        record = [track, name, self.now(), None, False]
+        self.spans.append(record)
+        try:
+            yield
+        except BaseException:
+            # an exception, or cancelled because of the global timeout
+            record[4] = True
+            raise
+        finally:
+            record[3] = self.now()
+
+    def mark(self, track, name):
+        if not self.enabled:
+            return
+        self.marks.append((track, name, self.now()))
+
+    ##########
+    def tracks(self):
+        """
+        all tracks in order of appearance, server first
+        """
+        tracks = [SERVER_TRACK]
+        for track, *_ in self.spans + self.marks:
+            if track not in tracks:
+                tracks.append(track)
+        return tracks
+
+    def chrome_trace(self):
+        """
+        a dict in the Chrome trace event format, with timestamps in us
+        """
+        events = []
+        tids = {track: tid for tid, track in enumerate(self.tracks())}
+        for track, tid in tids.items():
+            events.append(dict(ph='M', name='thread_name', pid=1, tid=tid,
+                               args=dict(name=str(track))))
+        now = self.now()
+        for track, name, start, end, failed in self.spans:
+            event = dict(ph='X', name=name, pid=1, tid=tids[track],
+                         ts=int(start * 1e6),
+                         dur=int(((end if end is not None else now) - start)
+                                 * 1e6))
+            if end is None or failed:
+                event['args'] = dict(failed=True)
+            events.append(event)
+        for track, name, timestamp in self.marks:
+            events.append(dict(ph='i', s='t', name=name, pid=1,
+                               tid=tids[track], ts=int(timestamp * 1e6)))
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def save(self, filename):
+        with open(filename, 'w') as output:
+            json.dump(self.chrome_trace(), output)
+
+    def summary(self):
+        """
+        a list of lines that sum up durations per phase,
+        and when marks were reached, across all tracks
+        """
+        phases = {}
+        now = self.now()
+        for _, name, start, end, failed in self.spans:
+            durations, nb_failed = phases.setdefault(name, ([], [0]))
+            durations.append((end if end is not None else now) - start)
+            if end is None or failed:
+                nb_failed[0] += 1
+        lines = [f"{'phase':<20} {'count':>5} {'min':>8} {'avg':>8} "
+                 f"{'max':>8} {'total':>9} {'failed':>6}"]
+        for name, (durations, (nb_failed,)) in phases.items():
+            lines.append(
+                f"{name:<20} {len(durations):>5} {min(durations):>8.2f} "
+                f"{sum(durations)/len(durations):>8.2f} "
+                f"{max(durations):>8.2f} {sum(durations):>9.2f} "
+                f"{nb_failed:>6}")
+        marks = {}
+        for _, name, timestamp in self.marks:
+            marks.setdefault(name, []).append(timestamp)
+        if marks:
+            lines.append(f"{'mark':<20} {'count':>5} {'first':>8} "
+                         f"{'last':>8}")
+            for name, timestamps in marks.items():
+                lines.append(f"{name:<20} {len(timestamps):>5} "
+                             f"{min(timestamps):>8.2f} "
+                             f"{max(timestamps):>8.2f}")
+        return lines
+
+    def print_summary(self):
+        for line in self.summary():
+            print(line)
@@ -0,0 +1,137 @@
+"""
+A watchdog that catches the event loop being blocked
+
+Some code paths still run synchronous code right in the event loop -
+XMLRPC calls, filesystem or subprocess calls, curses refreshes - and
+when that takes long, everything else gets delayed, which typically
+shows up later as mysterious timeouts.
+
+The watchdog runs in a separate thread; it regularly schedules a no-op
+callback in the loop, and measures how long it takes to get run.
+If that exceeds the threshold, it logs the stack of the loop thread
+at that moment, i.e. the code that is blocking, and then how long
+the loop has been blocked altogether; this is also recorded in metrics.
+
+It is disabled by default, see the [watchdog] section in the config,
+or the --watchdog option of the commands that support it.
+"""
+
+# c0111 no docstrings yet
+# w1202 logger & format
+# pylint: disable=c0111, w1202
+
+import sys
+import time
+import asyncio
+import threading
+import traceback
+
+from rhubarbe.config import Config
+from rhubarbe.metrics import Metrics
+
+BLOCKED_TOTAL = Metrics().counter(
+    'rhubarbe_watchdog_blocked_total',
+    "how many times the event loop was blocked beyond the threshold")
+BLOCKED_SECONDS = Metrics().histogram(
+    'rhubarbe_watchdog_blocked_seconds',
+    "how long the event loop was blocked, when beyond the threshold",
+    buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+RESPONSE_SECONDS = Metrics().gauge(
+    'rhubarbe_watchdog_response_seconds',
+    "how long the event loop took to run the last watchdog callback")
+
+
+class Watchdog:
+
+    def __init__(self, threshold, period=None, loop=None, logger=None):
+        """
+        threshold is in seconds; period is how often the loop gets
+        checked, and defaults to the threshold
+        """
+        self.threshold = threshold
+        self.period = period if period is not None else threshold
+        # the loop is expected to be run from the current thread
+        self.loop = loop or asyncio.get_event_loop()
+        self.loop_thread_id = threading.get_ident()
+        if logger is None:
+            # don't bind this at import time, as the monitor
+            # commands redefine rhubarbe.logger.logger
+            import rhubarbe.logger
+            logger = rhubarbe.logger.logger
+        self.logger = logger
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True,
+                                       name="rhubarbe-watchdog")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def loop_stack(self):
+        frame = sys._current_frames().get(       # pylint: disable=w0212
+            self.loop_thread_id)
+        if frame is None:
+            return "(no stack available)"
+        return "".join(traceback.format_stack(frame))
+
+    def watch(self):
+        while not self.stopped.is_set():
+            if self.loop.is_closed():
+                return
+            # in between two runs of the loop, there's nothing to watch
+            if not self.loop.is_running():
+                self.stopped.wait(self.period)
+                continue
+            pong = threading.Event()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                # loop got closed meanwhile
+                return
+            reported = False
+            while not pong.wait(self.threshold):
+                if self.stopped.is_set() or self.loop.is_closed():
+                    return
+                if not self.loop.is_running():
+                    break
+                # only the first stack is of interest, it's the one
+                # that shows what started blocking
+                if not reported:
+                    self.logger.warning(
+                        f"watchdog: event loop blocked for more than "
+                        f"{time.monotonic() - sent:.3f}s, in\n"
+                        f"{self.loop_stack()}")
+                    reported = True
+            if not pong.is_set():
+                continue
+            delay = time.monotonic() - sent
+            RESPONSE_SECONDS.set(delay)
+            if delay >= self.threshold:
+                BLOCKED_TOTAL.inc()
+                BLOCKED_SECONDS.observe(delay)
+                self.logger.warning(
+                    f"watchdog: event loop was blocked for {delay:.3f}s")
+            self.stopped.wait(self.period)
+
+
+def add_watchdog_argument(parser):
+    parser.add_argument(
+        "--watchdog", default=float(Config().value('watchdog', 'threshold')),
+        type=float, metavar="SECONDS",
+        help="""log the stack of the code that blocks the event loop
+        for longer than that; 0 means disabled""")
+
+
+def start_watchdog(threshold):
+    """
+    to be called from the thread that runs the loop, before running it;
+    returns the Watchdog instance, or None if disabled
+    """
+    if not threshold:
+        return None
+    return Watchdog(threshold).start()
@@ -22,9 +22,9 @@ LONG_DESCRIPTION = \
 # instead, cut'n'paste from the rhubarbe help message
 rhubarbe_help = (
     "nodes,status,on,off,reset,info,usrpstatus,usrpon,usrpoff,"
-    "load,save,wait,images,resolve,share,"
+    "load,save,wait,replay,exec,push,images,resolve,share,"
     "inventory,config,template,version,"
-    "monitornodes,monitorphones,monitorleases,accountsmanager"
+    "monitornodes,monitorphones,monitorleases,accountsmanager,simulator"
 )
 supported_subcommands = rhubarbe_help.split(",")
 
@@ -60,7 +60,7 @@ setuptools.setup(
     license="CC BY-SA 4.0",
     keywords=['R2lab', 'networking testbed'],
 
-    packages=['rhubarbe', 'rhubarbe.monitor'],
+    packages=['rhubarbe', 'rhubarbe.monitor', 'rhubarbe.simulator'],
     version=__version__,
     python_requires=">=3.5",
 